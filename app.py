@@ -1,14 +1,33 @@
-import re
+import atexit
+import base64
+import csv
+import hashlib
+import io
+import json
+import mimetypes
+import signal
 import sys
-import time
 import uuid as uid
-from datetime import datetime, timedelta
+import zlib
+from datetime import datetime, timedelta, timezone
 import os
 
-import psycopg2
-from flask import Flask, request, render_template, jsonify, session, redirect, url_for, Response
+from flask import Flask, request, render_template, jsonify, session, redirect, url_for, Response, \
+    make_response, stream_with_context, g, before_render_template, template_rendered, send_from_directory
 from waitress import serve
 
+from assets import DIST_DIR, load_manifest, pick_variant
+from cache import LRUCache
+from compression import compress_response
+from db import ConnectionPool
+from fraud import FraudEngine, score_risks
+from group_commit import GroupCommitWriter, WriterClosedError, WriterOutcomeUnknownError, WriterQueueFullError
+from metrics import Metrics, template_finished, template_started
+from repository import TRANSACTION_KINDS, PostgresRepository
+from search import DEFAULT_SEARCH_MODE, search_mode
+from worker import serve_worker
+from sqlite_repository import SQLiteRepository
+
 app = Flask(__name__)
 
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'TESTKEY') 
@@ -16,43 +35,181 @@ USERNAME = os.getenv('ADMIN_USERNAME')
 PASSWORD = os.getenv('ADMIN_PASSWORD') 
 DB_URL = os.getenv('DATABASE_URL')
 
-# Maximum number of database connection retries
+# Maximum number of database connection retries at startup
 MAX_DB_RETRIES = 3
 # Delay between retries (in seconds)
 DB_RETRY_DELAY = 2
+# How long one connection attempt may take (in seconds)
+DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', 5))
+# Consecutive connection failures that open the circuit breaker, after which requests fail fast
+DB_BREAKER_THRESHOLD = int(os.getenv('DB_BREAKER_THRESHOLD', 3))
+# Time between background reconnection probes while the circuit is open (in seconds)
+DB_BREAKER_PROBE_INTERVAL = float(os.getenv('DB_BREAKER_PROBE_INTERVAL', 5))
+# Port the waitress server listens on
+PORT = int(os.getenv('PORT', 5000))
+# Number of waitress worker threads; the connection pool is sized to match
+WAITRESS_THREADS = int(os.getenv('WAITRESS_THREADS', 4))
+# Pooled connections are recycled after this many seconds
+DB_POOL_MAX_AGE = int(os.getenv('DB_POOL_MAX_AGE', 1800))
+# How long a request waits for a free pooled connection (in seconds)
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 10))
+# "postgres" (DATABASE_URL) in production; "sqlite" (SQLITE_PATH) for local profiling and load tests
+DATA_BACKEND = os.getenv('DATA_BACKEND', 'postgres')
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'scrapyard.sqlite3')
+# Opt-in group commit: purchases and reimbursements are written by a background thread, many per transaction
+WRITE_BEHIND = os.getenv('WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+# Most taps per group-commit transaction, and how long (in milliseconds) the writer waits to fill one
+WRITE_BEHIND_MAX_BATCH = int(os.getenv('WRITE_BEHIND_MAX_BATCH', 200))
+WRITE_BEHIND_MAX_WAIT_MS = float(os.getenv('WRITE_BEHIND_MAX_WAIT_MS', 2))
+# Taps allowed to wait for the writer; beyond that, requests wait up to the enqueue timeout and then get a 503
+WRITE_BEHIND_QUEUE_SIZE = int(os.getenv('WRITE_BEHIND_QUEUE_SIZE', 1000))
+WRITE_BEHIND_ENQUEUE_TIMEOUT = float(os.getenv('WRITE_BEHIND_ENQUEUE_TIMEOUT', 2))
+# How long a request waits for its tap to be committed (in seconds)
+WRITE_BEHIND_ACK_TIMEOUT = float(os.getenv('WRITE_BEHIND_ACK_TIMEOUT', 30))
 
 
 # --- DATABASE CONNECTION ---
+if DATA_BACKEND == "sqlite":
+    repository = SQLiteRepository(SQLITE_PATH)
+else:
+    repository = PostgresRepository(ConnectionPool(
+        DB_URL,
+        # The group-commit writer holds a connection of its own
+        max_size=WAITRESS_THREADS + (1 if WRITE_BEHIND else 0),
+        max_age=DB_POOL_MAX_AGE,
+        checkout_timeout=DB_POOL_TIMEOUT,
+        max_retries=MAX_DB_RETRIES,
+        retry_delay=DB_RETRY_DELAY,
+        connect_timeout=DB_CONNECT_TIMEOUT,
+        failure_threshold=DB_BREAKER_THRESHOLD,
+        probe_interval=DB_BREAKER_PROBE_INTERVAL
+    ))
+
+
 def get_db():
-    """ Establish a database connection and return it with retry mechanism. """
-    retries = 0
-    last_error = None
+    """ Open a repository transaction; use as `with get_db() as store:` to commit it afterwards. """
+    return repository.transaction()
 
-    while retries < MAX_DB_RETRIES:
-        try:
-            conn = psycopg2.connect(DB_URL, sslmode="require")
-            conn.autocommit = True
-            return conn
-        except psycopg2.OperationalError as e:
-            last_error = e
-            error_msg = str(e)
 
-            # Check if this is the specific DNS resolution error
-            if "could not translate host name" in error_msg and "to address" in error_msg:
-                print(f"Critical database connection error: {error_msg}")
-                # This will be caught by the server wrapper and trigger a restart
-                sys.exit(1)
+tap_writer = None
+if WRITE_BEHIND:
+    tap_writer = GroupCommitWriter(
+        repository,
+        max_batch=WRITE_BEHIND_MAX_BATCH,
+        max_wait=WRITE_BEHIND_MAX_WAIT_MS / 1000,
+        queue_size=WRITE_BEHIND_QUEUE_SIZE,
+        enqueue_timeout=WRITE_BEHIND_ENQUEUE_TIMEOUT
+    )
+    # Write every queued tap before the process exits
+    atexit.register(tap_writer.close)
+
+
+# Hours of transactions the in-process fraud engine keeps; longer fraud-detection windows query the table
+FRAUD_WINDOW_HOURS = int(os.getenv('FRAUD_WINDOW_HOURS', 48))
+
+fraud_engine = FraudEngine(window_hours=FRAUD_WINDOW_HOURS)
+
+# Public balance lookups are cached per card; writes in this process update or invalidate the entry, and
+# with PostgreSQL every worker drops entries changed by any process (see balance_changed()). The TTL bounds
+# staleness where notifications are unavailable, such as the SQLite backend
+BALANCE_CACHE_SIZE = int(os.getenv('BALANCE_CACHE_SIZE', 10000))
+BALANCE_CACHE_TTL = int(os.getenv('BALANCE_CACHE_TTL', 30))
+
+balance_cache = LRUCache(max_size=BALANCE_CACHE_SIZE, ttl=BALANCE_CACHE_TTL)
+
+
+# Number of recent transactions shown on (and cached with) the public balance page
+BALANCE_HISTORY_SIZE = 10
+
+
+def balance_view(uuid, name, scraps, history):
+    """
+    Build the cached state of a balance page.
+
+    `history` holds up to BALANCE_HISTORY_SIZE (type, reason, timestamp, log id) tuples, newest first.
+    The ETag changes whenever the balance or the last transaction does.
+    """
+    last_id = history[0][3] if history else 0
+    return {
+        "name": name,
+        "scraps": scraps,
+        "history": history,
+        "transactions": [{"type": transaction_type, "reason": reason, "timestamp": timestamp.isoformat()}
+                         for transaction_type, reason, timestamp, _ in history],
+        "etag": hashlib.sha1(f"{uuid}:{last_id}:{scraps}".encode()).hexdigest(),
+        "last_modified": history[0][2] if history else None,
+    }
+
+
+def cache_balance_change(entry, new_scraps):
+    """ Write a committed purchase/reimbursement through to the cached balance page, if it is cached. """
+    log_id, uuid, user_name, transaction_type, reason, _, timestamp = entry
+    key = balance_key(uuid)
+    balance_cache.update(key, lambda view: balance_view(
+        key, user_name, new_scraps,
+        [(transaction_type, reason, timestamp, log_id)] + view["history"][:BALANCE_HISTORY_SIZE - 1]))
+
+
+def balance_key(uuid):
+    """ Normalise a card UUID so lookups and writes agree on the cache key. """
+    try:
+        return str(uid.UUID(str(uuid)))
+    except ValueError:
+        return str(uuid)
+
+
+def balance_changed(payload):
+    """
+    Drop cached balance pages whose card was changed by any process, as notified by repository.watch_balances().
+
+    A "*" payload (too many cards to list) or None (notifications were missed) drops every entry.
+    """
+    if payload in (None, "*"):
+        balance_cache.clear()
+    else:
+        balance_cache.invalidate(*(balance_key(uuid) for uuid in payload.split(",")))
+
+
+def transactions_committed(entries):
+    """
+    Hand committed transaction log entries to the in-process consumers.
+
+    Each entry is (log id, uuid, user name, transaction type, reason, signed amount, timestamp).
+    """
+    for entry in entries:
+        fraud_engine.record(*entry)
+
 
-            # For other operational errors, retry
-            retries += 1
-            print(f"Database connection error (attempt {retries}/{MAX_DB_RETRIES}): {error_msg}")
+# --- STATIC ASSETS ---
+# Fingerprinted assets never change under the same URL, so browsers may keep them for a year
+ASSET_MAX_AGE = 365 * 24 * 3600
 
-            if retries < MAX_DB_RETRIES:
-                time.sleep(DB_RETRY_DELAY)
+# static path -> fingerprinted path, as written by `python assets.py`; empty until a build has run
+asset_manifest = load_manifest()
 
-    # If we've exhausted retries, re-raise the last error
-    print(f"Failed to connect to database after {MAX_DB_RETRIES} attempts")
-    raise last_error
+
+@app.route("/assets/<path:filename>", methods=["GET"])
+def hashed_asset(filename):
+    """ Serve a fingerprinted asset from static/dist, precompressed if the client accepts br or gzip. """
+    variant, encoding = pick_variant(DIST_DIR, filename, request.accept_encodings)
+    response = send_from_directory(DIST_DIR, variant, mimetype=mimetypes.guess_type(filename)[0],
+                                   max_age=ASSET_MAX_AGE)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def asset_url_for(endpoint, **values):
+    """ url_for() for templates: static files with a built, fingerprinted copy link to that copy instead. """
+    if endpoint == "static" and values.get("filename") in asset_manifest:
+        return url_for("hashed_asset", filename=asset_manifest[values.pop("filename")], **values)
+    return url_for(endpoint, **values)
+
+
+app.jinja_env.globals["url_for"] = asset_url_for
 
 
 # --- ROOT ROUTE ---
@@ -82,13 +239,30 @@ def home():
             ), 400
 
         try:
-            with get_db() as conn:
-                with conn.cursor() as cur:
-                    cur.execute("SELECT name, scraps FROM credit_card WHERE uuid = %s", (uuid_str,))
-                    user = cur.fetchone()
-
-            if user:
-                return render_template("balance.html", name=user[0], scraps=user[1], uuid=uuid_str)
+            view = balance_cache.get(uuid_str)
+            if view is None:
+                # Taken before the read, so a write that commits meanwhile keeps this view out of the cache
+                version = balance_cache.version()
+                with get_db() as store:
+                    # Balance and recent history in one round trip
+                    page = store.balance_page(uuid_str, BALANCE_HISTORY_SIZE)
+                if page:
+                    view = balance_view(uuid_str, *page)
+                    balance_cache.put(uuid_str, view, version=version)
+
+            if view:
+                if is_not_modified(view["etag"], view["last_modified"]):
+                    response = Response(status=304)
+                else:
+                    response = make_response(render_template(
+                        "balance.html", name=view["name"], scraps=view["scraps"], uuid=uuid_str,
+                        transactions=view["transactions"]))
+                # Browsers must revalidate, which costs a cache lookup rather than a page render
+                response.set_etag(view["etag"])
+                if view["last_modified"]:
+                    response.last_modified = view["last_modified"].astimezone(timezone.utc)
+                response.headers["Cache-Control"] = "private, no-cache"
+                return response
             else:
                 # Return a proper error page for user not found
                 return render_template(
@@ -113,6 +287,16 @@ def home():
     return render_template("index.html")
 
 
+def is_not_modified(etag, last_modified):
+    """ Check the request's If-None-Match / If-Modified-Since validators against the current state. """
+    if request.if_none_match:
+        # Weak comparison: compressed responses carry the weak form of the same tag
+        return request.if_none_match.contains_weak(etag)
+    if last_modified and request.if_modified_since:
+        return last_modified.astimezone(timezone.utc).replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
 # --- ADMIN PANEL ---
 @app.route("/admin", methods=["GET"])
 def admin_panel():
@@ -121,20 +305,79 @@ def admin_panel():
     return render_template("admin.html")
 
 
+# --- PAGINATION ---
+# Rows per page on the admin listing pages, unless overridden with ?per_page=
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def page_size_arg():
+    """ Read ?per_page= from the request, clamped to 1..MAX_PAGE_SIZE. """
+    try:
+        return max(1, min(int(request.args.get("per_page", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+    except ValueError:
+        return DEFAULT_PAGE_SIZE
+
+
+def encode_cursor(values):
+    """ Turn the sort key of the last row on a page into an opaque URL-safe cursor. """
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """ Decode a cursor from encode_cursor(); returns None for a missing or malformed cursor. """
+    if not cursor:
+        return None
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        return None
+
+
+def column_page(columns, rows, next_cursor=None, total_estimate=None):
+    """
+    Pack rows into {"columns": [...], "values": [[first column], [second column], ...]}.
+
+    One array per column keeps field names out of every row, so a page of JSON stays small; the admin
+    pages render it through static/js/virtual-table.js.
+    """
+    values = [list(column) for column in zip(*rows)] if rows else [[] for _ in columns]
+    return {"columns": columns, "values": values, "next": next_cursor, "total_estimate": total_estimate}
+
+
 # --- LOGS PAGE ---
+def logs_page(search_query, mode, after, per_page, count=False):
+    """ Return one column_page() of logs matching a search, continuing after the cursor `after`. """
+    with get_db() as store:
+        total_estimate = None
+        if count:
+            total_estimate = store.count_logs(search_query, mode)
+
+        # Keyset pagination: continue strictly after the last (timestamp, id) of the previous page
+        logs = store.list_logs(search_query, mode,
+                               after=(datetime.fromisoformat(after[0]), after[1]) if after else None,
+                               limit=per_page + 1)
+
+    next_cursor = None
+    if len(logs) > per_page:
+        logs = logs[:per_page]
+        next_cursor = encode_cursor([logs[-1][3].isoformat(), logs[-1][4]])
+    rows = [(str(uuid), name, reason, timestamp.isoformat()) for uuid, name, reason, timestamp, _ in logs]
+    return column_page(["uuid", "name", "reason", "timestamp"], rows, next_cursor, total_estimate)
+
+
 @app.route("/admin/logs", methods=["GET", "POST"])
 def admin_logs():
     if not session.get("logged_in"):
         return redirect(url_for("login"))
-    search_query = request.form.get("search", "")
+    search_query = request.form.get("search", request.args.get("search", ""))
+    mode = search_mode(request.form.get("mode", request.args.get("mode")))
+    per_page = page_size_arg()
     try:
-        with get_db() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "SELECT uuid, name, reason, timestamp FROM transaction_logs WHERE name ILIKE %s ORDER BY timestamp DESC",
-                    ('%' + search_query + '%',))
-                logs = cur.fetchall()
-        return render_template("logs.html", logs=logs, search_query=search_query)
+        # The first page is embedded in the HTML; the virtualized table fetches the rest from /api/logs
+        page = logs_page(search_query, mode, decode_cursor(request.args.get("after")), per_page,
+                         count=bool(request.args.get("count")))
+        return render_template("logs.html", page=page, search_query=search_query, mode=mode, per_page=per_page)
     except Exception as e:
         print(f"Error in admin_logs: {str(e)}")
         return render_template(
@@ -147,6 +390,21 @@ def admin_logs():
         ), 500
 
 
+@app.route("/api/logs", methods=["GET"])
+def logs_api():
+    if not session.get("logged_in"):
+        return jsonify({"success": False, "message": "Not authorized"}), 403
+
+    try:
+        page = logs_page(request.args.get("search", ""), search_mode(request.args.get("mode")),
+                         decode_cursor(request.args.get("after")), page_size_arg(),
+                         count=bool(request.args.get("count")))
+        return jsonify({"success": True, **page})
+    except Exception as e:
+        print(f"Error in logs_api: {str(e)}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
 @app.route("/login", methods=["GET", "POST"])
 def login():
     error = None
@@ -178,14 +436,14 @@ def logout():
 def admin_users():
     if not session.get("logged_in"):
         return redirect(url_for("login"))
-    search_query = request.form.get("search", "")
+    search_query = request.form.get("search", request.args.get("search", ""))
+    mode = search_mode(request.form.get("mode", request.args.get("mode")))
+    per_page = page_size_arg()
     try:
-        with get_db() as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT uuid, name, scraps FROM credit_card WHERE name ILIKE %s ORDER BY name ASC",
-                            ('%' + search_query + '%',))
-                users = cur.fetchall()
-        return render_template("users.html", users=users, search_query=search_query)
+        # The first page is embedded in the HTML; the virtualized table fetches the rest from /api/users
+        page = users_page(search_query, mode, decode_cursor(request.args.get("after")), per_page,
+                          count=bool(request.args.get("count")))
+        return render_template("users.html", page=page, search_query=search_query, mode=mode, per_page=per_page)
     except Exception as e:
         print(f"Error in admin_users: {str(e)}")
         return render_template(
@@ -198,6 +456,66 @@ def admin_users():
         ), 500
 
 
+def users_page(search_query, mode, after, per_page, count=False):
+    """ Return one column_page() of users matching a search, continuing after the cursor `after`. """
+    with get_db() as store:
+        total_estimate = None
+        if count:
+            total_estimate = store.count_users(search_query, mode)
+
+        if mode == "fuzzy" and search_query:
+            # Fuzzy search returns the single best-ranked page instead of paging alphabetically
+            users = store.rank_users(search_query, mode, limit=per_page)
+        else:
+            # Keyset pagination: continue strictly after the last (name, uuid) of the previous page
+            users = store.list_users(search_query, mode, after=after, limit=per_page + 1)
+
+    next_cursor = None
+    if len(users) > per_page:
+        users = users[:per_page]
+        next_cursor = encode_cursor([users[-1][1], str(users[-1][0])])
+    rows = [(str(uuid), name, scraps) for uuid, name, scraps in users]
+    return column_page(["uuid", "name", "scraps"], rows, next_cursor, total_estimate)
+
+
+@app.route("/api/users", methods=["GET"])
+def users_api():
+    if not session.get("logged_in"):
+        return jsonify({"success": False, "message": "Not authorized"}), 403
+
+    try:
+        page = users_page(request.args.get("search", ""), search_mode(request.args.get("mode")),
+                          decode_cursor(request.args.get("after")), page_size_arg(),
+                          count=bool(request.args.get("count")))
+        return jsonify({"success": True, **page})
+    except Exception as e:
+        print(f"Error in users_api: {str(e)}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
+# --- USER SEARCH API ---
+@app.route("/api/search-users", methods=["GET"])
+def search_users():
+    if not session.get("logged_in"):
+        return jsonify({"success": False, "message": "Not authorized"}), 403
+
+    query = request.args.get("q", "")
+    mode = search_mode(request.args.get("mode", "prefix"))
+    limit = page_size_arg()
+    if not query:
+        return jsonify({"success": True, "users": []})
+
+    try:
+        with get_db() as store:
+            users = [{"uuid": str(row[0]), "name": row[1], "scraps": row[2]}
+                     for row in store.rank_users(query, mode, limit=limit)]
+
+        return jsonify({"success": True, "users": users})
+    except Exception as e:
+        print(f"Error in search_users: {str(e)}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
 @app.route("/admin/add_user", methods=["POST"])
 def add_user():
     if not session.get("logged_in"):
@@ -205,13 +523,10 @@ def add_user():
 
     data = request.json
     try:
-        with get_db() as conn:
-            with conn.cursor() as cur:
-                # Insert the new user and get the UUID of the newly added user
-                cur.execute("INSERT INTO credit_card (name, scraps) VALUES (%s, %s) RETURNING uuid",
-                            (data["name"], data["scraps"]))
-                new_uuid = cur.fetchone()[0]  # Get the first column of the first row (the UUID)
-                conn.commit()
+        with get_db() as store:
+            # Insert the new user and get the UUID of the newly added user
+            new_uuid, initial_scraps = store.add_user(data["name"], data["scraps"])
+            store.bump_counters(users=1, scraps=initial_scraps)
 
         # Return the success message with the newly created UUID
         return jsonify({
@@ -228,6 +543,17 @@ def add_user():
         })
 
 
+def write_behind_tap(uuid, transaction_type, amount, reason):
+    """
+    Hand a tap to the group-commit writer and wait until the transaction holding it has committed.
+
+    Returns (status, entry, new scraps) as produced by store.apply_taps(). Raises WriterQueueFullError if
+    the tap was not applied and may be retried, WriterOutcomeUnknownError if it may have been.
+    """
+    future = tap_writer.submit((str(uid.UUID(str(uuid))), transaction_type, amount, reason))
+    return tap_writer.result(future, WRITE_BEHIND_ACK_TIMEOUT)
+
+
 @app.route("/admin/purchase", methods=["POST"])
 def purchase():
     if not session.get("logged_in"):
@@ -235,22 +561,33 @@ def purchase():
     data = request.json
     try:
         scraps_amount = int(data["scraps"])
-        with get_db() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "UPDATE credit_card SET scraps = scraps - %s WHERE uuid = %s AND scraps >= %s RETURNING scraps",
-                    (scraps_amount, data["uuid"], scraps_amount))
+        # Include the amount in the reason for better tracking
+        reason = f"{data['reason']} (-{scraps_amount} scraps)"
 
-                if not cur.rowcount:
+        if tap_writer:
+            status, entry, new_scraps = write_behind_tap(data["uuid"], "Purchase", -scraps_amount, reason)
+            if status != "applied":
+                return jsonify({"message": "❌ Not enough scraps!"})
+        else:
+            with get_db() as store:
+                updated = store.debit(data["uuid"], scraps_amount)
+                if not updated:
                     return jsonify({"message": "❌ Not enough scraps!"})
+                new_scraps, user_name = updated
 
-                # Include the amount in the reason for better tracking
-                reason = f"{data['reason']} (-{scraps_amount} scraps)"
-
-                cur.execute("INSERT INTO transaction_logs (uuid, name, reason) VALUES (%s, %s, %s)",
-                            (data["uuid"], "Purchase", reason))
-                conn.commit()
+                entry = store.log_transaction(data["uuid"], user_name, "Purchase", reason, -scraps_amount)
+                store.bump_counters(transactions=1, scraps=-scraps_amount, transaction_type="Purchase")
+        cache_balance_change(entry, new_scraps)
+        transactions_committed([entry])
         return jsonify({"message": "💸 Purchase successful!"})
+    except (WriterQueueFullError, WriterClosedError) as e:
+        print(f"Error in purchase: {str(e)}")
+        return jsonify({"message": "❌ Server is busy, please retry"}), 503
+    except WriterOutcomeUnknownError as e:
+        # The tap may still commit: a retry could apply it twice
+        print(f"Error in purchase: {str(e)}")
+        balance_cache.invalidate(balance_key(data["uuid"]))
+        return jsonify({"message": "⏳ Purchase is still being recorded, check the balance before retrying"}), 202
     except Exception as e:
         print(f"Error in purchase: {str(e)}")
         return jsonify({"message": f"❌ Error processing purchase: {str(e)}"})
@@ -263,27 +600,163 @@ def reimbursement():
     data = request.json
     try:
         scraps_amount = int(data["scraps"])
-        with get_db() as conn:
-            with conn.cursor() as cur:
-                cur.execute("UPDATE credit_card SET scraps = scraps + %s WHERE uuid = %s RETURNING scraps",
-                            (scraps_amount, data["uuid"]))
+        # Include the amount in the reason for better tracking
+        reason = f"{data['reason']} (+{scraps_amount} scraps)"
 
-                if not cur.rowcount:
+        if tap_writer:
+            status, entry, new_scraps = write_behind_tap(data["uuid"], "Reimbursement", scraps_amount, reason)
+            if status != "applied":
+                return jsonify({"message": "❌ User not found!"})
+        else:
+            with get_db() as store:
+                updated = store.credit(data["uuid"], scraps_amount)
+                if not updated:
                     return jsonify({"message": "❌ User not found!"})
+                new_scraps, user_name = updated
 
-                # Include the amount in the reason for better tracking
-                reason = f"{data['reason']} (+{scraps_amount} scraps)"
-
-                cur.execute("INSERT INTO transaction_logs (uuid, name, reason) VALUES (%s, %s, %s)",
-                            (data["uuid"], "Reimbursement", reason))
-                conn.commit()
+                entry = store.log_transaction(data["uuid"], user_name, "Reimbursement", reason, scraps_amount)
+                store.bump_counters(transactions=1, scraps=scraps_amount, transaction_type="Reimbursement")
+        cache_balance_change(entry, new_scraps)
+        transactions_committed([entry])
         return jsonify({"message": "🔁 Reimbursement successful!"})
+    except (WriterQueueFullError, WriterClosedError) as e:
+        print(f"Error in reimbursement: {str(e)}")
+        return jsonify({"message": "❌ Server is busy, please retry"}), 503
+    except WriterOutcomeUnknownError as e:
+        # The tap may still commit: a retry could apply it twice
+        print(f"Error in reimbursement: {str(e)}")
+        balance_cache.invalidate(balance_key(data["uuid"]))
+        return jsonify({"message": "⏳ Reimbursement is still being recorded, check the balance before retrying"}), 202
     except Exception as e:
         print(f"Error in reimbursement: {str(e)}")
         return jsonify({"message": f"❌ Error processing reimbursement: {str(e)}"})
 
 
+# --- BULK TAPS ---
+# Tap operation -> (transaction log name, sign of the balance change)
+TAP_OPERATIONS = {
+    "purchase": ("Purchase", -1),
+    "reimbursement": ("Reimbursement", 1),
+}
+# Most taps accepted by one bulk request
+MAX_BULK_TAPS = int(os.getenv('MAX_BULK_TAPS', 5000))
+
+TAP_MESSAGES = {
+    ("applied", "Purchase"): "💸 Purchase successful!",
+    ("applied", "Reimbursement"): "🔁 Reimbursement successful!",
+    "insufficient_scraps": "❌ Not enough scraps!",
+    "not_found": "❌ User not found!",
+}
+
+
+def parse_tap(item):
+    """ Validate one bulk tap; returns (uuid, type, signed amount, reason) or raises ValueError. """
+    if not isinstance(item, dict) or item.get("type") not in TAP_OPERATIONS:
+        raise ValueError("type must be 'purchase' or 'reimbursement'")
+    transaction_type, sign = TAP_OPERATIONS[item["type"]]
+    uuid = str(uid.UUID(str(item.get("uuid"))))
+    scraps_amount = int(item.get("scraps"))
+    if scraps_amount <= 0:
+        raise ValueError("scraps must be a positive number")
+    sign_text = "+" if sign > 0 else "-"
+    reason = f"{item.get('reason', '')} ({sign_text}{scraps_amount} scraps)"
+    return uuid, transaction_type, sign * scraps_amount, reason
+
+
+@app.route("/admin/bulk-taps", methods=["POST"])
+def bulk_taps():
+    """
+    Apply many purchases/reimbursements in one transaction, e.g. when a terminal replays queued taps.
+
+    Body: {"operations": [{"type": "purchase", "uuid": ..., "scraps": 5, "reason": ...}, ...]}. Taps are
+    applied in order and each one succeeds or fails on its own; the response has one result per tap.
+    """
+    if not session.get("logged_in"):
+        return jsonify({"success": False, "message": "Not authorized"}), 403
+
+    data = request.json or {}
+    operations = data.get("operations")
+    if not isinstance(operations, list):
+        return jsonify({"success": False, "message": "operations must be a list"}), 400
+    if len(operations) > MAX_BULK_TAPS:
+        return jsonify({"success": False, "message": f"At most {MAX_BULK_TAPS} operations per request"}), 400
+
+    results = [None] * len(operations)
+    taps = []
+    positions = []
+    for index, item in enumerate(operations):
+        try:
+            taps.append(parse_tap(item))
+            positions.append(index)
+        except (TypeError, ValueError) as e:
+            results[index] = {"index": index, "success": False, "status": "invalid", "message": f"❌ {str(e)}"}
+
+    try:
+        outcomes = []
+        if taps:
+            with get_db() as store:
+                outcomes = store.apply_taps(taps)
+    except Exception as e:
+        print(f"Error in bulk_taps: {str(e)}")
+        return jsonify({"success": False, "message": f"❌ Error processing taps: {str(e)}"}), 500
+
+    entries = []
+    for index, tap, (status, entry, new_scraps) in zip(positions, taps, outcomes):
+        if status == "applied":
+            cache_balance_change(entry, new_scraps)
+            entries.append(entry)
+            results[index] = {"index": index, "success": True, "status": status,
+                              "message": TAP_MESSAGES[(status, tap[1])], "scraps": new_scraps}
+        else:
+            results[index] = {"index": index, "success": False, "status": status, "message": TAP_MESSAGES[status]}
+    transactions_committed(entries)
+
+    return jsonify({
+        "success": True,
+        "applied": len(entries),
+        "failed": len(operations) - len(entries),
+        "results": results
+    })
+
+
 # --- BATCH OPERATIONS ---
+# Operation type -> (transaction log name, sign of the balance change)
+BATCH_OPERATIONS = {
+    "add_scraps": ("Batch Add", 1),
+    "remove_scraps": ("Batch Remove", -1),
+}
+
+
+def apply_batch(store, operation_type, filter_query, amount, reason, after_uuid=None, limit=None,
+                filter_mode=DEFAULT_SEARCH_MODE):
+    """
+    Update balances and write one log row per affected user in a single set-based statement.
+
+    With `limit`, only the next `limit` matching users after `after_uuid` (in uuid order) are touched.
+    Returns the transactions_committed() entries in uuid order; the last uuid is the keyset position
+    for the next chunk.
+    """
+    transaction_type, sign = BATCH_OPERATIONS[operation_type]
+    sign_text = "+" if sign > 0 else "-"
+    log_reason = f"{reason} ({sign_text}{amount} scraps)"
+    return store.apply_batch(transaction_type, sign * amount, log_reason, filter_query, filter_mode,
+                             after_uuid=after_uuid, limit=limit)
+
+
+def invalidate_balances(entries, everyone=False):
+    """ Drop cached balances touched by a batch; a batch over every user just empties the cache. """
+    if everyone:
+        balance_cache.clear()
+    else:
+        balance_cache.invalidate(*(balance_key(entry[1]) for entry in entries))
+
+
+def batch_message(operation_type, amount, affected_count):
+    if operation_type == "add_scraps":
+        return f"✅ Added {amount} scraps to {affected_count} users!"
+    return f"✅ Removed {amount} scraps from {affected_count} users!"
+
+
 @app.route("/admin/batch-operation", methods=["POST"])
 def batch_operation():
     if not session.get("logged_in"):
@@ -292,61 +765,31 @@ def batch_operation():
     data = request.json
     operation_type = data.get("operation_type")
     filter_query = data.get("filter", "")
-    amount = data.get("amount", 0)
+    filter_mode = search_mode(data.get("filter_mode"))
     reason = data.get("reason", "Batch Operation")
 
+    if operation_type not in BATCH_OPERATIONS:
+        return jsonify({"success": False, "message": "Invalid operation type"})
+
     try:
-        with get_db() as conn:
-            with conn.cursor() as cur:
-                if operation_type == "add_scraps":
-                    # Add scraps to filtered users
-                    if filter_query:
-                        cur.execute(
-                            "UPDATE credit_card SET scraps = scraps + %s WHERE name ILIKE %s RETURNING uuid, name",
-                            (amount, '%' + filter_query + '%'))
-                    else:
-                        cur.execute("UPDATE credit_card SET scraps = scraps + %s RETURNING uuid, name",
-                                    (amount,))
-
-                    affected_users = cur.fetchall()
-                    affected_count = len(affected_users)
-
-                    # Log the batch transaction for each user
-                    for user in affected_users:
-                        cur.execute("INSERT INTO transaction_logs (uuid, name, reason) VALUES (%s, %s, %s)",
-                                    (user[0], "Batch Add", f"{reason} (+{amount} scraps)"))
-
-                    message = f"✅ Added {amount} scraps to {affected_count} users!"
-
-                elif operation_type == "remove_scraps":
-                    # Remove scraps from filtered users (only if they have enough)
-                    if filter_query:
-                        cur.execute(
-                            "UPDATE credit_card SET scraps = scraps - %s WHERE name ILIKE %s AND scraps >= %s RETURNING uuid, name",
-                            (amount, '%' + filter_query + '%', amount))
-                    else:
-                        cur.execute(
-                            "UPDATE credit_card SET scraps = scraps - %s WHERE scraps >= %s RETURNING uuid, name",
-                            (amount, amount))
-
-                    affected_users = cur.fetchall()
-                    affected_count = len(affected_users)
-
-                    # Log the batch transaction for each user
-                    for user in affected_users:
-                        cur.execute("INSERT INTO transaction_logs (uuid, name, reason) VALUES (%s, %s, %s)",
-                                    (user[0], "Batch Remove", f"{reason} (-{amount} scraps)"))
-
-                    message = f"✅ Removed {amount} scraps from {affected_count} users!"
+        amount = int(data.get("amount", 0))
+        chunk_size = int(data.get("chunk_size") or 0)
 
-                else:
-                    return jsonify({"success": False, "message": "Invalid operation type"})
+        if chunk_size > 0:
+            # Chunked mode: commit every chunk and stream progress as newline-delimited JSON
+            return Response(stream_with_context(
+                batch_operation_chunks(operation_type, filter_query, filter_mode, amount, reason, chunk_size)),
+                mimetype="application/x-ndjson")
 
-                conn.commit()
+        with get_db() as store:
+            entries = apply_batch(store, operation_type, filter_query, amount, reason, filter_mode=filter_mode)
+        invalidate_balances(entries, everyone=not filter_query)
+        transactions_committed(entries)
+        affected_count = len(entries)
 
         return jsonify({
             "success": True,
-            "message": message,
+            "message": batch_message(operation_type, amount, affected_count),
             "affected_count": affected_count
         })
     except Exception as e:
@@ -354,33 +797,115 @@ def batch_operation():
         return jsonify({"success": False, "message": f"❌ Error in batch operation: {str(e)}"})
 
 
+def batch_operation_chunks(operation_type, filter_query, filter_mode, amount, reason, chunk_size):
+    """ Run a batch operation chunk by chunk, yielding one JSON progress line per committed chunk. """
+    affected_count = 0
+    chunks = 0
+    last_uuid = None
+    try:
+        with get_db() as store:
+            while True:
+                entries = apply_batch(store, operation_type, filter_query, amount, reason,
+                                      after_uuid=last_uuid, limit=chunk_size, filter_mode=filter_mode)
+                store.commit()
+                if not entries:
+                    break
+                invalidate_balances(entries)
+                transactions_committed(entries)
+
+                chunks += 1
+                affected_count += len(entries)
+                last_uuid = entries[-1][1]
+                yield json.dumps({"chunk": chunks, "affected_count": affected_count}) + "\n"
+
+        yield json.dumps({
+            "success": True,
+            "message": batch_message(operation_type, amount, affected_count),
+            "affected_count": affected_count
+        }) + "\n"
+    except Exception as e:
+        print(f"Error in batch operation: {str(e)}")
+        yield json.dumps({
+            "success": False,
+            "message": f"❌ Error in batch operation after {affected_count} users: {str(e)}",
+            "affected_count": affected_count
+        }) + "\n"
+
+
 # --- DATA EXPORT ---
+# Rows fetched per round trip from the server-side export cursor
+EXPORT_CHUNK_ROWS = 2000
+
+
+def stream_csv(export, header, compress=False):
+    """
+    Yield a CSV document chunk by chunk from `export(store)`, which yields lists of rows.
+
+    Only EXPORT_CHUNK_ROWS rows are held in memory at a time. With `compress`, the chunks are gzip encoded.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def flush():
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate(0)
+        return compressor.compress(data) if compressor else data
+
+    with get_db() as store:
+        chunks = export(store)
+        try:
+            # Fetch the first rows before the header so query errors surface on the first chunk
+            first_rows = next(chunks, [])
+            writer.writerow(header)
+            writer.writerows(first_rows)
+            yield flush()
+            for rows in chunks:
+                writer.writerows(rows)
+                yield flush()
+        finally:
+            # Close the server-side cursor while its connection is still ours, even if the client went away
+            chunks.close()
+
+    if compressor:
+        yield compressor.flush()
+
+
+def resume_stream(first_chunk, chunks):
+    """ Yield an already fetched first chunk and then the rest of `chunks`; closing this closes `chunks`. """
+    try:
+        yield first_chunk
+        yield from chunks
+    finally:
+        chunks.close()
+
+
+def csv_response(export, header, filename_prefix):
+    """ Build a streamed CSV download; `?gzip=1` sends it as a .csv.gz file. """
+    compress = request.args.get("gzip", "").lower() in ("1", "true", "yes")
+    chunks = stream_csv(export, header, compress=compress)
+    # Run the query before sending headers so connection and SQL errors still produce an error status
+    first_chunk = next(chunks)
+
+    filename = f"{filename_prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    if compress:
+        filename += ".gz"
+    return Response(
+        resume_stream(first_chunk, chunks),
+        mimetype="application/gzip" if compress else "text/csv",
+        headers={"Content-disposition": f"attachment; filename={filename}"}
+    )
+
+
 @app.route("/admin/export-users", methods=["GET"])
 def export_users():
     if not session.get("logged_in"):
         return redirect(url_for("login"))
 
     try:
-        with get_db() as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT uuid, name, scraps FROM credit_card ORDER BY name ASC")
-                users = cur.fetchall()
-
-        # Create CSV content
-        csv_content = "UUID,Name,Scraps\n"
-        for user in users:
-            # Escape commas in names
-            name = f'"{user[1]}"' if ',' in user[1] else user[1]
-            csv_content += f"{user[0]},{name},{user[2]}\n"
-
-        # Create response with CSV file
-        response = Response(
-            csv_content,
-            mimetype="text/csv",
-            headers={
-                "Content-disposition": f"attachment; filename=users_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"}
-        )
-        return response
+        return csv_response(lambda store: store.export_users(EXPORT_CHUNK_ROWS),
+                            ["UUID", "Name", "Scraps"], "users")
     except Exception as e:
         print(f"Error exporting users: {str(e)}")
         return f"Error exporting users: {str(e)}", 500
@@ -392,85 +917,18 @@ def export_transactions():
         return redirect(url_for("login"))
 
     try:
-        with get_db() as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT uuid, name, reason, timestamp FROM transaction_logs ORDER BY timestamp DESC")
-                transactions = cur.fetchall()
-
-        # Create CSV content
-        csv_content = "UUID,Type,Reason,Timestamp\n"
-        for transaction in transactions:
-            # Escape commas in reason
-            reason = f'"{transaction[2]}"' if ',' in transaction[2] else transaction[2]
-            csv_content += f"{transaction[0]},{transaction[1]},{reason},{transaction[3]}\n"
-
-        # Create response with CSV file
-        response = Response(
-            csv_content,
-            mimetype="text/csv",
-            headers={
-                "Content-disposition": f"attachment; filename=transactions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"}
-        )
-        return response
-    except Exception as e:
-        print(f"Error exporting transactions: {str(e)}")
-        return f"Error exporting transactions: {str(e)}", 500
+        # Optional date range, e.g. ?start=2025-03-01&end=2025-03-02T12:00
+        start = datetime.fromisoformat(request.args["start"]) if request.args.get("start") else None
+        end = datetime.fromisoformat(request.args["end"]) if request.args.get("end") else None
+    except ValueError:
+        return "Invalid date range: use ISO dates such as 2025-03-01 or 2025-03-01T12:00", 400
 
-
-# Helper function to extract amount from transaction reason
-def extract_amount_from_reason(transaction_type, reason):
     try:
-        # Log the input for debugging
-        print(f"Extracting amount from: Type={transaction_type}, Reason={reason}")
-
-        # Different patterns based on transaction type
-        if transaction_type in ["Purchase", "Batch Remove"]:
-            # Look for pattern like "(-X scraps)" or just numbers
-            minus_pattern = r'$$-(\d+)\s*scraps$$'
-            minus_match = re.search(minus_pattern, reason)
-            if minus_match:
-                amount = int(minus_match.group(1))
-                print(f"Found amount with minus pattern: {amount}")
-                return amount
-
-            # Try another pattern like "- X scraps"
-            alt_minus_pattern = r'-\s*(\d+)\s*scraps'
-            alt_minus_match = re.search(alt_minus_pattern, reason)
-            if alt_minus_match:
-                amount = int(alt_minus_match.group(1))
-                print(f"Found amount with alt minus pattern: {amount}")
-                return amount
-
-        elif transaction_type in ["Reimbursement", "Batch Add"]:
-            # Look for pattern like "(+X scraps)" or just numbers
-            plus_pattern = r'$$\+(\d+)\s*scraps$$'
-            plus_match = re.search(plus_pattern, reason)
-            if plus_match:
-                amount = int(plus_match.group(1))
-                print(f"Found amount with plus pattern: {amount}")
-                return amount
-
-            # Try another pattern like "+ X scraps"
-            alt_plus_pattern = r'\+\s*(\d+)\s*scraps'
-            alt_plus_match = re.search(alt_plus_pattern, reason)
-            if alt_plus_match:
-                amount = int(alt_plus_match.group(1))
-                print(f"Found amount with alt plus pattern: {amount}")
-                return amount
-
-        # If specific patterns fail, try to find any number in the reason
-        numbers = re.findall(r'\d+', reason)
-        if numbers:
-            amount = int(numbers[0])
-            print(f"Found amount with generic number pattern: {amount}")
-            return amount
-
-        # If no amount found, log it and return default
-        print(f"No amount found in reason: {reason}")
-        return None
+        return csv_response(lambda store: store.export_transactions(EXPORT_CHUNK_ROWS, start=start, end=end),
+                            ["UUID", "Type", "Reason", "Timestamp"], "transactions")
     except Exception as e:
-        print(f"Error extracting amount: {str(e)}")
-        return None
+        print(f"Error exporting transactions: {str(e)}")
+        return f"Error exporting transactions: {str(e)}", 500
 
 
 # --- USER TRANSACTIONS API ---
@@ -482,40 +940,39 @@ def user_transactions():
         return jsonify({"success": False, "message": "UUID is required"}), 400
 
     try:
-        with get_db() as conn:
-            with conn.cursor() as cur:
-                # Get user transactions
-                cur.execute("""
-                    SELECT name, reason, timestamp 
-                    FROM transaction_logs 
-                    WHERE uuid = %s 
-                    ORDER BY timestamp DESC 
-                    LIMIT 10
-                """, (uuid,))
-
-                transactions = []
-                for row in cur.fetchall():
-                    transaction_type = row[0]
-                    reason = row[1]
-                    timestamp = row[2]
-
-                    transactions.append({
-                        "type": transaction_type,
-                        "reason": reason,
-                        "timestamp": timestamp.isoformat()
-                    })
-
-                return jsonify({
-                    "success": True,
-                    "transactions": transactions
+        with get_db() as store:
+            # Get user transactions
+            transactions = []
+            for row in store.recent_transactions(uuid, limit=10):
+                transaction_type = row[0]
+                reason = row[1]
+                timestamp = row[2]
+
+                transactions.append({
+                    "type": transaction_type,
+                    "reason": reason,
+                    "timestamp": timestamp.isoformat()
                 })
 
+            return jsonify({
+                "success": True,
+                "transactions": transactions
+            })
+
     except Exception as e:
         print(f"Error in user_transactions: {str(e)}")
         return jsonify({"success": False, "message": str(e)}), 500
 
 
 # --- TRANSACTION ANALYTICS ---
+# Supported chart resolutions -> label format for each bucket
+ANALYTICS_RESOLUTIONS = {
+    "hour": "%Y-%m-%d %H:00",
+    "day": "%Y-%m-%d",
+    "week": "%Y-%m-%d",
+}
+
+
 @app.route("/api/transaction-analytics", methods=["GET"])
 def transaction_analytics():
     if not session.get("logged_in"):
@@ -523,80 +980,50 @@ def transaction_analytics():
 
     hours = int(request.args.get("hours", 24))
     transaction_type = request.args.get("type", "all")
+    resolution = request.args.get("resolution", "hour")
+    if resolution not in ANALYTICS_RESOLUTIONS:
+        return jsonify({"success": False, "message": "Invalid resolution"}), 400
 
     try:
         # Calculate time range
         end_time = datetime.now()
         start_time = end_time - timedelta(hours=hours)
 
-        with get_db() as conn:
-            with conn.cursor() as cur:
-                # Build query based on transaction type
-                if transaction_type == "all":
-                    query = """
-                        SELECT 
-                            DATE_TRUNC('hour', timestamp) as hour_timestamp,
-                            name,
-                            COUNT(*) as count
-                        FROM transaction_logs
-                        WHERE timestamp >= %s AND timestamp <= %s
-                        GROUP BY DATE_TRUNC('hour', timestamp), name
-                        ORDER BY hour_timestamp
-                    """
-                    cur.execute(query, (start_time, end_time))
-                else:
-                    query = """
-                        SELECT 
-                            DATE_TRUNC('hour', timestamp) as hour_timestamp,
-                            name,
-                            COUNT(*) as count
-                        FROM transaction_logs
-                        WHERE timestamp >= %s AND timestamp <= %s AND name = %s
-                        GROUP BY DATE_TRUNC('hour', timestamp), name
-                        ORDER BY hour_timestamp
-                    """
-                    cur.execute(query, (start_time, end_time, transaction_type))
-
-                results = cur.fetchall()
-
-        # Process results into a format suitable for charts
-        hours_labels = []
-        purchases = []
-        reimbursements = []
-
-        # Create a dictionary to store counts by hour
-        hour_data = {}
-
-        for row in results:
-            hour_str = row[0].strftime("%Y-%m-%d %H:00")
-            if hour_str not in hour_data:
-                hour_data[hour_str] = {"Purchase": 0, "Reimbursement": 0}
-
-            transaction_name = row[1]
-            if transaction_name in ["Purchase", "Reimbursement"]:
-                hour_data[hour_str][transaction_name] = row[2]
-
-        # Fill in missing hours in the range
-        current_hour = start_time.replace(minute=0, second=0, microsecond=0)
-        while current_hour <= end_time:
-            hour_str = current_hour.strftime("%Y-%m-%d %H:00")
-            if hour_str not in hour_data:
-                hour_data[hour_str] = {"Purchase": 0, "Reimbursement": 0}
-            current_hour += timedelta(hours=1)
-
-        # Sort hours and create final arrays
-        sorted_hours = sorted(hour_data.keys())
-        for hour in sorted_hours:
-            hours_labels.append(hour)
-            purchases.append(hour_data[hour]["Purchase"])
-            reimbursements.append(hour_data[hour]["Reimbursement"])
+        with get_db() as store:
+            # One row per bucket, including empty ones, read from the hourly rollup
+            results = store.analytics(resolution, start_time, end_time,
+                                      transaction_type if transaction_type != "all" else None)
+
+        # Every known type gets a series, plus any other type found in the rollup
+        label_format = ANALYTICS_RESOLUTIONS[resolution]
+        types = list(TRANSACTION_KINDS) if transaction_type == "all" else [transaction_type]
+        labels = []
+        counts = {name: [] for name in types}
+        amounts = {name: [] for name in types}
+
+        for bucket, name, count, amount in results:
+            label = bucket.strftime(label_format)
+            if not labels or labels[-1] != label:
+                labels.append(label)
+                for series in list(counts.values()) + list(amounts.values()):
+                    series.append(0)
+            if name is None:
+                continue
+            if name not in counts:
+                counts[name] = [0] * len(labels)
+                amounts[name] = [0] * len(labels)
+            counts[name][-1] = int(count)
+            amounts[name][-1] = int(amount)
 
         return jsonify({
             "success": True,
             "data": {
-                "labels": hours_labels,
-                "purchases": purchases,
-                "reimbursements": reimbursements
+                "labels": labels,
+                "resolution": resolution,
+                "purchases": counts.get("Purchase", [0] * len(labels)),
+                "reimbursements": counts.get("Reimbursement", [0] * len(labels)),
+                "counts": counts,
+                "amounts": amounts
             }
         })
     except Exception as e:
@@ -611,19 +1038,9 @@ def dashboard_stats():
         return jsonify({"success": False, "message": "Not authorized"}), 403
 
     try:
-        with get_db() as conn:
-            with conn.cursor() as cur:
-                # Get total users
-                cur.execute("SELECT COUNT(*) FROM credit_card")
-                total_users = cur.fetchone()[0]
-
-                # Get total transactions
-                cur.execute("SELECT COUNT(*) FROM transaction_logs")
-                total_transactions = cur.fetchone()[0]
-
-                # Get total scraps
-                cur.execute("SELECT SUM(scraps) FROM credit_card")
-                total_scraps = cur.fetchone()[0] or 0
+        with get_db() as store:
+            # Totals are maintained by the write routes, see bump_counters()
+            total_users, total_transactions, total_scraps = store.dashboard_counters()
 
         return jsonify({
             "success": True,
@@ -636,6 +1053,165 @@ def dashboard_stats():
         return jsonify({"success": False, "message": str(e)}), 500
 
 
+# --- LEDGER RECONCILIATION ---
+# Most mismatched cards listed by the reconciliation endpoint
+RECONCILE_REPORT_LIMIT = 100
+
+
+@app.route("/api/reconciliation", methods=["GET"])
+def reconciliation():
+    """
+    Compare every card's scraps with its opening balance plus the logged deltas.
+
+    Each call reads at most RECONCILE_BATCH_ROWS new log rows into the stored running totals, so it returns
+    in bounded time however large the log is; while the totals are still catching up, "caughtUp" is false
+    and no drift is reported yet. `python migrations.py reconcile` runs the same check to completion.
+    """
+    if not session.get("logged_in"):
+        return jsonify({"success": False, "message": "Not authorized"}), 403
+
+    try:
+        limit = max(1, min(int(request.args.get("limit", RECONCILE_REPORT_LIMIT)), RECONCILE_REPORT_LIMIT))
+        with get_db() as store:
+            result = store.reconcile_ledger(limit=limit)
+
+        return jsonify({
+            "success": True,
+            "caughtUp": result["caught_up"],
+            "processed": result["processed"],
+            "position": result["position"],
+            "unparsed": result["unparsed"],
+            "mismatched": result["mismatched"],
+            "drift": [{"uuid": str(uuid), "name": name, "scraps": scraps, "expected": expected, "drift": drift}
+                      for uuid, name, scraps, expected, drift in result["drift"] or []],
+            # Cards that predate reconciliation open at an inferred balance, which hides any earlier drift
+            "openingAdjusted": result["adjusted"],
+            "openingAdjustments": [{"uuid": str(uuid), "name": name, "scraps": scraps, "adjustment": adjustment}
+                                   for uuid, name, scraps, adjustment in result["adjustments"]]
+        })
+    except Exception as e:
+        print(f"Error in reconciliation: {str(e)}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
+# --- HEALTH CHECKS ---
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """ Liveness: the process is up and serving requests; the database is not consulted. """
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """ Readiness: 503 while the database circuit breaker is open; never opens a connection itself. """
+    health = repository.health()
+    if not health["ready"]:
+        return jsonify({"status": "unavailable", **health}), 503, {"Retry-After": str(int(DB_BREAKER_PROBE_INTERVAL))}
+    return jsonify({"status": "ready", **health})
+
+
+# --- POOL STATS ---
+@app.route("/api/pool-stats", methods=["GET"])
+def pool_stats():
+    if not session.get("logged_in"):
+        return jsonify({"success": False, "message": "Not authorized"}), 403
+
+    return jsonify({"success": True, "pool": repository.stats(),
+                    "writer": tap_writer.stats() if tap_writer else None})
+
+
+# --- CACHE STATS ---
+@app.route("/api/cache-stats", methods=["GET"])
+def cache_stats():
+    if not session.get("logged_in"):
+        return jsonify({"success": False, "message": "Not authorized"}), 403
+
+    return jsonify({"success": True, "balance_cache": balance_cache.stats()})
+
+
+# --- METRICS ---
+# Bearer token that lets Prometheus scrape /metrics; without one, only a logged-in admin can read it
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+request_metrics = Metrics()
+before_render_template.connect(lambda sender, **extra: template_started(), app, weak=False)
+template_rendered.connect(lambda sender, **extra: template_finished(), app, weak=False)
+
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_endpoint = request.endpoint or "unmatched"
+    g.request_stats = request_metrics.start_request(g.metrics_endpoint)
+
+
+def count_response_bytes(chunks, stats):
+    """ Pass a streamed body through while adding its size to the request's stats. """
+    try:
+        for chunk in chunks:
+            stats.response_bytes += len(chunk)
+            yield chunk
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+@app.after_request
+def finish_request_metrics(response):
+    stats = g.pop("request_stats", None)
+    if stats is None:
+        return response
+    if response.is_streamed:
+        response.response = count_response_bytes(response.response, stats)
+    else:
+        stats.response_bytes = response.content_length or 0
+    # Recorded once the body has been sent, so streamed exports count their full duration
+    endpoint, method = g.metrics_endpoint, request.method
+    response.call_on_close(lambda: request_metrics.finish_request(stats, endpoint, method, response.status_code))
+    return response
+
+
+@app.teardown_request
+def abandon_request_metrics(error=None):
+    # Requests that failed before after_request ran are recorded as server errors
+    stats = g.pop("request_stats", None)
+    if stats is not None:
+        request_metrics.finish_request(stats, g.metrics_endpoint, request.method, 500)
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    authorized = session.get("logged_in") or (
+        METRICS_TOKEN and request.headers.get("Authorization") == f"Bearer {METRICS_TOKEN}")
+    if not authorized:
+        return jsonify({"success": False, "message": "Not authorized"}), 403
+
+    gauges = {}
+    for key, value in repository.stats().items():
+        if isinstance(value, (int, float)):
+            gauges[f"scrapyard_db_pool_{key}"] = (f"Database connection pool {key.replace('_', ' ')}", value)
+    for key, value in balance_cache.stats().items():
+        gauges[f"scrapyard_balance_cache_{key}"] = (f"Balance cache {key.replace('_', ' ')}", value)
+    if tap_writer:
+        for key, value in tap_writer.stats().items():
+            gauges[f"scrapyard_group_commit_{key}"] = (f"Group-commit writer {key.replace('_', ' ')}", value)
+    return Response(request_metrics.render(gauges), mimetype="text/plain; version=0.0.4")
+
+
+# --- COMPRESSION ---
+# Responses smaller than this (in bytes) are sent as they are; compressing them saves less than it costs
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+# Compression effort for dynamic responses: fast settings that still get most of the size reduction
+COMPRESS_GZIP_LEVEL = int(os.getenv('COMPRESS_GZIP_LEVEL', 6))
+COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', 4))
+
+
+# Registered after finish_request_metrics, so it runs first and the metrics count the bytes actually sent
+@app.after_request
+def compress(response):
+    return compress_response(response, request.accept_encodings, min_size=COMPRESS_MIN_SIZE,
+                             gzip_level=COMPRESS_GZIP_LEVEL, brotli_quality=COMPRESS_BROTLI_QUALITY)
+
+
 # --- FRAUD DETECTION ---
 @app.route("/api/fraud-detection", methods=["GET"])
 def fraud_detection():
@@ -643,203 +1219,23 @@ def fraud_detection():
         return jsonify({"success": False, "message": "Not authorized"}), 403
 
     try:
-        with get_db() as conn:
-            with conn.cursor() as cur:
-                # Get time range (hours by default)
-                hours = int(request.args.get("hours", 12))
-                end_time = datetime.now()
-                start_time = end_time - timedelta(hours=hours)
-
-                # 1. Detect frequent transactions from same UUID
-                cur.execute("""
-                    SELECT uuid, COUNT(*) as transaction_count
-                    FROM transaction_logs
-                    WHERE timestamp >= %s
-                    GROUP BY uuid
-                    HAVING COUNT(*) > 5
-                    ORDER BY transaction_count DESC
-                    LIMIT 10
-                """, (start_time,))
-
-                frequent_users = []
-                for row in cur.fetchall():
-                    # Get username
-                    cur.execute("SELECT name FROM credit_card WHERE uuid = %s", (row[0],))
-                    user_name = cur.fetchone()[0] if cur.rowcount > 0 else "Unknown"
-
-                    frequent_users.append({
-                        "uuid": row[0],
-                        "name": user_name,
-                        "transaction_count": row[1],
-                        "risk_level": "high" if row[1] > 30 else "medium"
-                    })
-
-                # 2. Detect duplicate reasons (same reason used multiple times)
-                cur.execute("""
-                    SELECT uuid, reason, COUNT(*) as reason_count
-                    FROM transaction_logs
-                    WHERE timestamp >= %s AND name = 'Purchase'
-                    GROUP BY uuid, reason
-                    HAVING COUNT(*) > 2
-                    ORDER BY reason_count DESC
-                    LIMIT 10
-                """, (start_time,))
-
-                duplicate_reasons = []
-                for row in cur.fetchall():
-                    # Get username
-                    cur.execute("SELECT name FROM credit_card WHERE uuid = %s", (row[0],))
-                    user_name = cur.fetchone()[0] if cur.rowcount > 0 else "Unknown"
-
-                    duplicate_reasons.append({
-                        "uuid": row[0],
-                        "name": user_name,
-                        "reason": row[1],
-                        "count": row[2],
-                        "risk_level": "high" if row[2] > 5 else "medium"
-                    })
-
-                # 3. Detect unusual transaction patterns (purchase followed by reimbursement)
-                cur.execute("""
-                    WITH user_transactions AS (
-                        SELECT 
-                            uuid, 
-                            name as transaction_type, 
-                            timestamp,
-                            LAG(name) OVER (PARTITION BY uuid ORDER BY timestamp) as prev_type,
-                            LAG(timestamp) OVER (PARTITION BY uuid ORDER BY timestamp) as prev_timestamp
-                        FROM transaction_logs
-                        WHERE timestamp >= %s
-                    )
-                    SELECT 
-                        uuid, 
-                        COUNT(*) as pattern_count
-                    FROM user_transactions
-                    WHERE 
-                        transaction_type = 'Reimbursement' AND 
-                        prev_type = 'Purchase' AND
-                        timestamp - prev_timestamp < interval '1 hour'
-                    GROUP BY uuid
-                    HAVING COUNT(*) > 2
-                    ORDER BY pattern_count DESC
-                    LIMIT 10
-                """, (start_time,))
-
-                unusual_patterns = []
-                for row in cur.fetchall():
-                    # Get username
-                    cur.execute("SELECT name FROM credit_card WHERE uuid = %s", (row[0],))
-                    user_name = cur.fetchone()[0] if cur.rowcount > 0 else "Unknown"
-
-                    unusual_patterns.append({
-                        "uuid": row[0],
-                        "name": user_name,
-                        "pattern": "Purchase-Reimbursement cycle",
-                        "count": row[1],
-                        "risk_level": "high" if row[1] > 3 else "medium"
-                    })
-
-                # 4. Detect unusual transaction times (outside normal hours 8am-8pm)
-                unusual_times = []  # Empty list since we're removing this risk factor
-
-                # 5. Detect sudden balance changes
-                cur.execute(r"""
-                    WITH balance_changes AS (
-    SELECT 
-        tl.uuid,
-        tl.name AS transaction_type,
-        CASE 
-            WHEN tl.name IN ('Purchase', 'Batch Remove') THEN -1
-            WHEN tl.name IN ('Reimbursement', 'Batch Add') THEN 1
-            ELSE 0
-        END AS direction,
-        tl.reason,
-        tl.timestamp
-    FROM transaction_logs tl
-    WHERE timestamp >= %s
-)
-SELECT 
-    uuid, 
-    COUNT(*) AS large_changes
-FROM balance_changes
-WHERE 
-    reason ~ '[-+]?\d{2,}'  -- Matches numbers 30 and above (positive or negative)
-    AND ABS(CAST((regexp_match(reason, '[-+]?\d{2,}'))[1] AS INTEGER)) >= 30
-GROUP BY uuid
-HAVING COUNT(*) > 2
-ORDER BY large_changes DESC
-LIMIT 10;
-                """, (start_time,))
-
-                large_changes = []
-                for row in cur.fetchall():
-                    # Get username
-                    cur.execute("SELECT name FROM credit_card WHERE uuid = %s", (row[0],))
-                    user_name = cur.fetchone()[0] if cur.rowcount > 0 else "Unknown"
-
-                    large_changes.append({
-                        "uuid": row[0],
-                        "name": user_name,
-                        "count": row[1],
-                        "risk_level": "high" if row[1] > 4 else "medium"
-                    })
-
-                # Calculate overall risk score for each user
-                all_uuids = set()
-                for item in frequent_users + duplicate_reasons + unusual_patterns + unusual_times + large_changes:
-                    all_uuids.add(item["uuid"])
-
-                risk_scores = {}
-                for uuid in all_uuids:
-                    risk_score = 0
-
-                    # Add scores from frequent transactions
-                    for item in frequent_users:
-                        if item["uuid"] == uuid:
-                            risk_score += 30 if item["risk_level"] == "high" else 15
-
-                    # Add scores from duplicate reasons
-                    for item in duplicate_reasons:
-                        if item["uuid"] == uuid:
-                            risk_score += 25 if item["risk_level"] == "high" else 10
-
-                    # Add scores from unusual patterns
-                    for item in unusual_patterns:
-                        if item["uuid"] == uuid:
-                            risk_score += 40 if item["risk_level"] == "high" else 20
-
-                    # Add scores from large changes
-                    for item in large_changes:
-                        if item["uuid"] == uuid:
-                            risk_score += 35 if item["risk_level"] == "high" else 15
-
-                    # Get username
-                    cur.execute("SELECT name FROM credit_card WHERE uuid = %s", (uuid,))
-                    user_name = cur.fetchone()[0] if cur.rowcount > 0 else "Unknown"
-
-                    risk_scores[uuid] = {
-                        "uuid": uuid,
-                        "name": user_name,
-                        "score": risk_score,
-                        "level": "high" if risk_score > 70 else "medium" if risk_score > 30 else "low"
-                    }
-
-                # Sort risk scores by score (descending)
-                sorted_risk_scores = sorted(
-                    risk_scores.values(),
-                    key=lambda x: x["score"],
-                    reverse=True
-                )
-
-                return jsonify({
-                    "success": True,
-                    "frequent_users": frequent_users,
-                    "duplicate_reasons": duplicate_reasons,
-                    "unusual_patterns": unusual_patterns,
-                    "unusual_times": unusual_times,
-                    "large_changes": large_changes,
-                    "risk_scores": sorted_risk_scores[:10]  # Top 10 highest risk users
-                })
+        # Get time range (hours by default)
+        hours = int(request.args.get("hours", 12))
+        start_time = datetime.now() - timedelta(hours=hours)
+
+        with get_db() as store:
+            if hours > fraud_engine.window_hours:
+                # Older than the in-process window: fall back to scanning the table
+                findings = store.detect_fraud(start_time)
+            else:
+                fraud_engine.sync(store)
+                findings = fraud_engine.findings(start_time)
+
+        return jsonify({
+            "success": True,
+            **findings,
+            "risk_scores": score_risks(findings)  # Top 10 highest risk users
+        })
 
     except Exception as e:
         print(f"Error in fraud_detection: {str(e)}")
@@ -850,13 +1246,24 @@ if __name__ == "__main__":
     print("Starting Flask application...")
     try:
         # Test database connection on startup
-        with get_db() as conn_main:
-            with conn_main.cursor() as cur_main:
-                cur_main.execute("SELECT 1")
+        repository.setup()
+        with get_db() as store:
+            fraud_engine.rebuild(store)
         print("Database connection successful")
+        # Keep the balance cache coherent with the other workers behind server_wrapper.py
+        repository.watch_balances(balance_changed)
+
+        if tap_writer:
+            # Turn SIGTERM into a normal exit so the atexit hook drains the write queue
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
-        # Run with Waitress
-        serve(app, host="0.0.0.0", port=5000)
+        listen_fds = os.getenv("LISTEN_FDS")
+        if listen_fds:
+            # Started by server_wrapper.py: serve its shared socket and drain gracefully when stopped
+            serve_worker(app, listen_fds, threads=WAITRESS_THREADS)
+        else:
+            # Run with Waitress
+            serve(app, host="0.0.0.0", port=PORT, threads=WAITRESS_THREADS)
     except Exception as err:
         print(f"Failed to start application: {str(err)}")
         sys.exit(1)
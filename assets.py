@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Static asset build step.
+
+    python assets.py
+
+Minifies the stylesheets and scripts under static/, writes each one to static/dist/ under a
+content-hashed name (css/styles.css -> css/styles.<hash>.css) alongside precompressed .gz and, when the
+optional brotli package is installed, .br copies, and records the mapping in static/dist/manifest.json.
+app.py serves these files under /assets/ with immutable cache headers and points url_for('static', ...)
+at them. Without a manifest (no build has run) it keeps serving the plain files from static/.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_NAME = "manifest.json"
+# Precompressed variants in order of preference, as (Content-Encoding, file suffix)
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def minify_css(text):
+    """ Drop comments and the whitespace CSS does not need. """
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s*([{};,>])\s*", r"\1", text)
+    text = re.sub(r":\s+", ":", text)
+    return text.replace(";}", "}").strip()
+
+
+def minify_js(text):
+    """
+    Drop indentation, blank lines and whole-line // comments.
+
+    Line breaks are kept, so automatic semicolon insertion sees the same code as before.
+    """
+    lines = (line.strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line and not line.startswith("//"))
+
+
+# Minifier for each kind of file the build handles
+MINIFIERS = {".css": minify_css, ".js": minify_js}
+
+
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def build(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    """
+    Build every asset under `static_dir` into `dist_dir` and return the manifest.
+
+    Files from earlier builds are left in place, so pages rendered before a deploy can still load the
+    assets they reference.
+    """
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        if os.path.abspath(root) == os.path.abspath(static_dir) and os.path.basename(dist_dir) in dirs:
+            dirs.remove(os.path.basename(dist_dir))
+        for name in sorted(files):
+            stem, ext = os.path.splitext(name)
+            if ext not in MINIFIERS:
+                continue
+            source = os.path.join(root, name)
+            with open(source, encoding="utf-8") as f:
+                data = MINIFIERS[ext](f.read()).encode()
+
+            relative = os.path.relpath(source, static_dir).replace(os.sep, "/")
+            hashed = f"{stem}.{fingerprint(data)}{ext}"
+            if os.path.dirname(relative):
+                hashed = f"{os.path.dirname(relative)}/{hashed}"
+            target = os.path.join(dist_dir, *hashed.split("/"))
+            write_file(target, data)
+            # mtime=0 keeps the gzip bytes identical across builds of the same content
+            write_file(target + ".gz", gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli:
+                write_file(target + ".br", brotli.compress(data, quality=11))
+            manifest[relative] = hashed
+
+    write_file(os.path.join(dist_dir, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def load_manifest(dist_dir=DIST_DIR):
+    """ Return the {static path: fingerprinted path} mapping of the last build, or {} if there is none. """
+    try:
+        with open(os.path.join(dist_dir, MANIFEST_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def pick_variant(dist_dir, filename, accept_encodings):
+    """
+    Choose the file to send for `filename`: its best precompressed copy the client accepts, if one exists.
+
+    `accept_encodings` is the request's parsed Accept-Encoding header. Returns (file name, Content-Encoding),
+    with None as the encoding for the uncompressed file.
+    """
+    for encoding, suffix in ENCODINGS:
+        if accept_encodings[encoding] and os.path.isfile(os.path.join(dist_dir, *(filename + suffix).split("/"))):
+            return filename + suffix, encoding
+    return filename, None
+
+
+if __name__ == "__main__":
+    try:
+        built = build()
+    except Exception as err:
+        print(f"Asset build failed: {str(err)}")
+        sys.exit(1)
+    for path, hashed in sorted(built.items()):
+        print(f"{path} -> dist/{hashed}")
+    if not brotli:
+        print("brotli is not installed; only gzip variants were written")
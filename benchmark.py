@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+Load and latency benchmark for every route.
+
+For each scale, a SQLite database is seeded with fixtures.py (and cached under bench_data/), the app is
+started as a separate waitress process on a copy of it, and every scenario is driven by concurrent
+keep-alive clients. Results go to a JSON file:
+
+    {"meta": {...}, "scales": {"100k": {"peak_rss_kb": ..., "scenarios": {"purchase": {"p50_ms": ...}}}}}
+
+    python benchmark.py --scales 1k,100k --output bench_results.json
+    python benchmark.py --scales 1k --baseline bench_baseline.json      # exit 1 on regressions
+    python benchmark.py --scales 1k --output bench_baseline.json        # store a new baseline
+    python benchmark.py --scales 100k --compression-report               # bytes and latency saved by compression
+
+With --backend postgres the app runs against DATABASE_URL as it is: nothing is seeded or reset, so point
+it at a scratch database loaded by `python fixtures.py --backend postgres` with the scale's --users/--logs and
+the same --seed, so the generated card uuids exist.
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from fixtures import FIRST_NAMES, generate_users, seed
+from sqlite_repository import SQLiteRepository
+
+# Scale name -> (users, transaction logs)
+SCALES = {
+    "1k": (100, 1_000),
+    "100k": (1_000, 100_000),
+    "5m": (50_000, 5_000_000),
+}
+
+# Seeded databases are kept here and reused by later runs with the same scale and seed
+DATA_DIR = "bench_data"
+ADMIN_USERNAME = "bench"
+ADMIN_PASSWORD = "bench"
+
+# Relative slack before a change against the baseline counts as a regression
+DEFAULT_TOLERANCE = 0.25
+# Accept-Encoding sent by the clients in the second pass of --compression-report
+COMPRESSED_ENCODING = "br, gzip"
+
+
+# --- HTTP CLIENT ---
+class Client:
+    """ One keep-alive connection, carrying the admin session cookie once logged in. """
+
+    def __init__(self, port, accept_encoding="identity"):
+        self.port = port
+        self.accept_encoding = accept_encoding
+        self.cookie = None
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=300)
+
+    def request(self, method, path, body=None, headers=None):
+        """ Send a request and read the whole body; returns (status, body size in bytes as sent). """
+        headers = {"Accept-Encoding": self.accept_encoding, **(headers or {})}
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            # The server closed the keep-alive connection; retry once on a fresh one
+            self.conn.close()
+            self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=300)
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+
+        size = 0
+        while True:
+            chunk = response.read(65536)
+            if not chunk:
+                break
+            size += len(chunk)
+        cookie = response.getheader("Set-Cookie")
+        if cookie:
+            self.cookie = cookie.split(";", 1)[0]
+        return response.status, size
+
+    def get(self, path):
+        return self.request("GET", path)
+
+    def post_json(self, path, data):
+        return self.request("POST", path, json.dumps(data), {"Content-Type": "application/json"})
+
+    def login(self):
+        form = urllib.parse.urlencode({"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD})
+        status, _ = self.request("POST", "/login", form, {"Content-Type": "application/x-www-form-urlencoded"})
+        if status != 302:
+            raise RuntimeError(f"Benchmark login failed with status {status}")
+
+    def close(self):
+        self.conn.close()
+
+
+# --- SCENARIOS ---
+# Each scenario takes (client, users, rng) and returns (status, bytes)
+def tap_lookup(client, users, rng):
+    return client.get(f"/?uuid={rng.choice(users)[0]}")
+
+
+def purchase(client, users, rng):
+    return client.post_json("/admin/purchase", {"uuid": rng.choice(users)[0], "scraps": rng.randint(1, 5),
+                                                 "reason": "Benchmark purchase"})
+
+
+def reimbursement(client, users, rng):
+    return client.post_json("/admin/reimbursement", {"uuid": rng.choice(users)[0], "scraps": rng.randint(1, 5),
+                                                     "reason": "Benchmark reimbursement"})
+
+
+def bulk_taps(client, users, rng):
+    # A terminal replaying 100 queued taps in one request
+    return client.post_json("/admin/bulk-taps", {"operations": [
+        {"type": rng.choice(["purchase", "reimbursement"]), "uuid": rng.choice(users)[0],
+         "scraps": rng.randint(1, 5), "reason": "Benchmark tap"} for _ in range(100)]})
+
+
+def batch_operation(client, users, rng):
+    # A prefix filter touches a realistic slice of users rather than everyone
+    return client.post_json("/admin/batch-operation", {"operation_type": "add_scraps", "amount": 1,
+                                                       "filter": rng.choice(FIRST_NAMES), "filter_mode": "prefix",
+                                                       "reason": "Benchmark batch"})
+
+
+def logs_page(client, users, rng):
+    return client.get(rng.choice(["/admin/logs", "/admin/logs?search=Purchase&mode=prefix"]))
+
+
+def users_page(client, users, rng):
+    return client.get(f"/admin/users?search={rng.choice(FIRST_NAMES)}")
+
+
+def export_users(client, users, rng):
+    return client.get("/admin/export-users")
+
+
+def export_transactions(client, users, rng):
+    # The last day of logs keeps the download size comparable across scales
+    start = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%dT%H:%M")
+    return client.get(f"/admin/export-transactions?start={start}")
+
+
+def analytics(client, users, rng):
+    return client.get(rng.choice(["/api/transaction-analytics?hours=24",
+                                  "/api/transaction-analytics?hours=720&resolution=day"]))
+
+
+def fraud_detection(client, users, rng):
+    return client.get(rng.choice(["/api/fraud-detection?hours=12", "/api/fraud-detection?hours=168"]))
+
+
+# Scenario name -> (function, requests per run, whether it runs as the admin). Every request must answer 200;
+# the public balance page redirects a logged-in session to /admin, so tap lookups run anonymously
+SCENARIOS = {
+    "tap_lookup": (tap_lookup, 400, False),
+    "purchase": (purchase, 200, True),
+    "reimbursement": (reimbursement, 200, True),
+    "bulk_taps": (bulk_taps, 40, True),
+    "batch_operation": (batch_operation, 20, True),
+    "logs_page": (logs_page, 200, True),
+    "users_page": (users_page, 200, True),
+    "export_users": (export_users, 10, True),
+    "export_transactions": (export_transactions, 10, True),
+    "analytics": (analytics, 100, True),
+    "fraud_detection": (fraud_detection, 40, True),
+}
+
+
+def percentile(sorted_values, fraction):
+    """ Nearest-rank percentile of an already sorted list. """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(port, users, scenario, requests_count, concurrency, seed_value, accept_encoding="identity"):
+    """ Drive one scenario with `concurrency` clients and summarise the latencies. """
+    func, _, admin = SCENARIOS[scenario]
+    counter = iter(range(requests_count))
+    counter_lock = threading.Lock()
+    latencies = []
+    errors = 0
+    total_bytes = 0
+    results_lock = threading.Lock()
+
+    def worker(worker_id):
+        nonlocal errors, total_bytes
+        rng = random.Random(f"{seed_value}:{scenario}:{worker_id}")
+        client = Client(port, accept_encoding)
+        try:
+            if admin:
+                client.login()
+            while True:
+                with counter_lock:
+                    if next(counter, None) is None:
+                        return
+                started = time.perf_counter()
+                try:
+                    status, size = func(client, users, rng)
+                except (http.client.HTTPException, OSError):
+                    status, size = 0, 0
+                elapsed = (time.perf_counter() - started) * 1000
+                with results_lock:
+                    latencies.append(elapsed)
+                    total_bytes += size
+                    if status != 200:
+                        errors += 1
+        finally:
+            client.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(worker, i) for i in range(concurrency)]:
+            future.result()
+    wall_time = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "concurrency": concurrency,
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "max_ms": round(latencies[-1], 3) if latencies else 0.0,
+        "throughput_rps": round(len(latencies) / wall_time, 2) if wall_time else 0.0,
+        "bytes": total_bytes,
+    }
+
+
+# --- SERVER ---
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(env, port, timeout=120):
+    """ Start app.py in a child process and wait until it answers. """
+    process = subprocess.Popen([sys.executable, "app.py"], env={**os.environ, **env, "PORT": str(port)},
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited during startup with code {process.returncode}")
+        try:
+            client = Client(port)
+            client.get("/")
+            client.close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"Server did not start within {timeout} seconds")
+
+
+def stop_server(process):
+    """ Stop the server and return its peak resident set size in KiB. """
+    process.terminate()
+    try:
+        _, status, usage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        return None
+    process.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in KiB on Linux but in bytes on macOS
+    return usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+
+
+def seeded_database(scale, seed_value):
+    """ Return the path of a seeded template database for a scale, creating it on first use. """
+    users, logs = SCALES[scale]
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, f"{scale}-seed{seed_value}.sqlite3")
+    if not os.path.exists(path):
+        print(f"Seeding {scale}: {users} users, {logs} transaction logs...")
+        started = time.perf_counter()
+        repository = SQLiteRepository(path + ".tmp")
+        try:
+            seed(repository, users=users, logs=logs, seed_value=seed_value)
+            with repository.transaction() as store:
+                store.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            repository.close()
+        os.replace(path + ".tmp", path)
+        print(f"Seeded {scale} in {time.perf_counter() - started:.1f}s")
+    return path
+
+
+def run_scale(scale, args):
+    """ Benchmark every selected scenario at one scale; returns the scale's result entry. """
+    env = {"ADMIN_USERNAME": ADMIN_USERNAME, "ADMIN_PASSWORD": ADMIN_PASSWORD,
+           "WAITRESS_THREADS": str(args.threads)}
+    if args.backend == "sqlite":
+        # Writes during the run go to a copy, so every run starts from the same seeded data
+        working_path = os.path.join(DATA_DIR, f"{scale}-run.sqlite3")
+        shutil.copyfile(seeded_database(scale, args.seed), working_path)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(working_path + suffix):
+                os.remove(working_path + suffix)
+        env.update({"DATA_BACKEND": "sqlite", "SQLITE_PATH": working_path})
+    else:
+        env["DATA_BACKEND"] = "postgres"
+
+    users = generate_users(SCALES[scale][0], seed=args.seed)
+    port = free_port()
+    process = start_server(env, port)
+    scenarios = {}
+    compressed = {}
+    try:
+        for scenario in args.scenarios:
+            requests_count = max(1, int(SCENARIOS[scenario][1] * args.requests_factor))
+            result = run_scenario(port, users, scenario, requests_count, args.concurrency, args.seed,
+                                  args.accept_encoding)
+            scenarios[scenario] = result
+            print(f"  {scale:>5} {scenario:<20} p50 {result['p50_ms']:>9.2f}ms  p95 {result['p95_ms']:>9.2f}ms  "
+                  f"p99 {result['p99_ms']:>9.2f}ms  {result['throughput_rps']:>8.1f} req/s  "
+                  f"{result['errors']} errors")
+        if args.compression_report:
+            # Same scenarios again, this time accepting compressed responses
+            for scenario in args.scenarios:
+                requests_count = max(1, int(SCENARIOS[scenario][1] * args.requests_factor))
+                compressed[scenario] = run_scenario(port, users, scenario, requests_count, args.concurrency,
+                                                    args.seed, COMPRESSED_ENCODING)
+    finally:
+        peak_rss_kb = stop_server(process)
+    print(f"  {scale:>5} peak server RSS {peak_rss_kb} KiB")
+    entry = {"users": SCALES[scale][0], "logs": SCALES[scale][1], "peak_rss_kb": peak_rss_kb,
+             "scenarios": scenarios}
+    if compressed:
+        entry["compressed_scenarios"] = compressed
+        print_compression_report(scale, args.accept_encoding, scenarios, compressed)
+    return entry
+
+
+def print_compression_report(scale, accept_encoding, plain, compressed):
+    """ Print bytes per request and p50/p95 latency with and without response compression. """
+    print(f"  {scale:>5} compression ({accept_encoding} -> {COMPRESSED_ENCODING}):")
+    for scenario, before in plain.items():
+        after = compressed[scenario]
+        bytes_before = before["bytes"] / max(before["requests"], 1)
+        bytes_after = after["bytes"] / max(after["requests"], 1)
+        saved = 1 - bytes_after / bytes_before if bytes_before else 0.0
+        print(f"  {scale:>5} {scenario:<20} {bytes_before:>11.0f} -> {bytes_after:>11.0f} B/req "
+              f"({saved:>4.0%} saved)  p50 {before['p50_ms']:>8.2f} -> {after['p50_ms']:>8.2f}ms  "
+              f"p95 {before['p95_ms']:>8.2f} -> {after['p95_ms']:>8.2f}ms")
+
+
+# --- BASELINE ---
+def compare(results, baseline, tolerance):
+    """ Return a description of every metric that got worse than the baseline by more than `tolerance`. """
+    regressions = []
+    for scale, current in results["scales"].items():
+        previous = baseline.get("scales", {}).get(scale)
+        if not previous:
+            continue
+        if previous.get("peak_rss_kb") and current.get("peak_rss_kb") and \
+                current["peak_rss_kb"] > previous["peak_rss_kb"] * (1 + tolerance):
+            regressions.append(f"{scale}: peak RSS {previous['peak_rss_kb']} -> {current['peak_rss_kb']} KiB")
+        for scenario, now in current["scenarios"].items():
+            before = previous.get("scenarios", {}).get(scenario)
+            if not before:
+                continue
+            for metric in ("p50_ms", "p95_ms", "p99_ms"):
+                if now[metric] > before[metric] * (1 + tolerance):
+                    regressions.append(f"{scale}/{scenario}: {metric} {before[metric]} -> {now[metric]}")
+            if now["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+                regressions.append(f"{scale}/{scenario}: throughput_rps "
+                                   f"{before['throughput_rps']} -> {now['throughput_rps']}")
+            if now["errors"] > before["errors"]:
+                regressions.append(f"{scale}/{scenario}: errors {before['errors']} -> {now['errors']}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrapyard route benchmark")
+    parser.add_argument("--scales", default="1k,100k", help=f"comma separated, from {', '.join(SCALES)}")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma separated scenario names")
+    parser.add_argument("--backend", choices=["sqlite", "postgres"], default="sqlite")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients per scenario")
+    parser.add_argument("--threads", type=int, default=8, help="waitress threads in the server")
+    parser.add_argument("--requests-factor", type=float, default=1.0, help="scale every scenario's request count")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="baseline results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--accept-encoding", default="identity", help="Accept-Encoding header sent by the clients")
+    parser.add_argument("--compression-report", action="store_true",
+                        help=f"rerun the scenarios with Accept-Encoding: {COMPRESSED_ENCODING} and report the savings")
+    args = parser.parse_args()
+    args.scenarios = [name for name in args.scenarios.split(",") if name]
+
+    unknown = [name for name in args.scales.split(",") if name not in SCALES] + \
+              [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        print(f"Unknown scale or scenario: {', '.join(unknown)}")
+        sys.exit(2)
+
+    results = {
+        "meta": {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "backend": args.backend,
+            "concurrency": args.concurrency,
+            "threads": args.threads,
+            "requests_factor": args.requests_factor,
+            "accept_encoding": args.accept_encoding,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "scales": {},
+    }
+    for scale_name in args.scales.split(","):
+        results["scales"][scale_name] = run_scale(scale_name, args)
+
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        if not os.path.exists(args.baseline):
+            print(f"Baseline {args.baseline} not found; copy {args.output} there to create it")
+            sys.exit(1)
+        with open(args.baseline) as baseline_file:
+            found = compare(results, json.load(baseline_file), args.tolerance)
+        if found:
+            print(f"PERFORMANCE REGRESSION against {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for line in found:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
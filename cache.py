@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """ Thread-safe LRU cache with a bounded size and a per-entry time to live. """
+
+    def __init__(self, max_size=10000, ttl=30):
+        self.max_size = max_size
+        # Entries older than this (in seconds) are treated as missing
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        # key -> (value, expires_at), least recently used first
+        self._entries = OrderedDict()
+        # Bumped by every write-side change; key -> version of its last change, at most max_size of them.
+        # Changes older than _floor have been forgotten (or were a clear()), so puts read before it are dropped
+        self._version = 0
+        self._changed = OrderedDict()
+        self._floor = 0
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, key):
+        """ Return the cached value for `key`, or None if it is missing or expired. """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def version(self):
+        """ Return a token to pass to put() for a value about to be read from the source. """
+        with self._lock:
+            return self._version
+
+    def put(self, key, value, version=None):
+        """
+        Cache `value` under `key`. With the `version` taken before `value` was read, the put is skipped if
+        the key was invalidated or updated since, as `value` may predate that change.
+        """
+        with self._lock:
+            if version is not None and (version < self._floor or self._changed.get(key, 0) > version):
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def update(self, key, func):
+        """ Replace a live entry with func(value); missing or expired entries are left alone. """
+        with self._lock:
+            self._mark_changed(key)
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries[key] = (func(entry[0]), entry[1])
+
+    def _mark_changed(self, key):
+        self._version += 1
+        self._changed[key] = self._version
+        self._changed.move_to_end(key)
+        while len(self._changed) > self.max_size:
+            _, forgotten = self._changed.popitem(last=False)
+            self._floor = max(self._floor, forgotten)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._mark_changed(key)
+                if self._entries.pop(key, None) is not None:
+                    self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._stats["invalidations"] += len(self._entries)
+            self._entries.clear()
+            self._version += 1
+            self._changed.clear()
+            self._floor = self._version
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                **self._stats,
+            }
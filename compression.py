@@ -0,0 +1,114 @@
+"""
+Response compression negotiated from Accept-Encoding.
+
+app.py runs compress_response() on every response. Bodies that are already encoded, of a type that does not
+shrink, or smaller than the minimum size go out untouched. Streamed bodies (the CSV exports) are
+compressed chunk by chunk, with each chunk flushed to the client as soon as it is compressed, so nothing is
+buffered and a download starts as quickly as before. Brotli is used when the optional brotli package is
+installed and the client prefers it; gzip otherwise.
+"""
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Media types worth compressing; images, archives and the like are already compressed
+COMPRESSIBLE_TYPES = {
+    "text/html", "text/css", "text/csv", "text/plain", "text/javascript",
+    "application/javascript", "application/json", "image/svg+xml",
+}
+# Encodings this module can produce, preferred first when the client rates them equally
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli else ("gzip",)
+
+
+def choose_encoding(accept_encodings):
+    """ Return the supported encoding the client rates highest ("br" or "gzip"), or None. """
+    best, best_quality = None, 0
+    for encoding in SUPPORTED_ENCODINGS:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class GzipEncoder:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, wbits=31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        """ Emit everything compressed so far without ending the stream. """
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+def make_encoder(encoding, gzip_level, brotli_quality):
+    return BrotliEncoder(brotli_quality) if encoding == "br" else GzipEncoder(gzip_level)
+
+
+def compress_stream(chunks, encoder):
+    """ Compress a streamed body chunk by chunk, flushing after each one so the client is never kept waiting. """
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            if chunk:
+                yield encoder.compress(chunk) + encoder.flush()
+        yield encoder.finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def compress_response(response, accept_encodings, min_size=1024, gzip_level=6, brotli_quality=4):
+    """
+    Compress a Flask response in place when it is worth it and the client accepts a supported encoding.
+
+    Buffered bodies shorter than `min_size` bytes are left alone. Strong ETags become weak, since the
+    encoded bytes differ from the representation the tag was computed for.
+    """
+    if response.status_code < 200 or response.status_code in (204, 206, 304) or response.direct_passthrough:
+        return response
+    if "Content-Encoding" in response.headers or response.mimetype not in COMPRESSIBLE_TYPES:
+        return response
+    if not response.is_streamed and (response.content_length or 0) < min_size:
+        return response
+
+    # The body depends on Accept-Encoding from here on, whether or not this client gets it compressed
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None:
+        return response
+
+    encoder = make_encoder(encoding, gzip_level, brotli_quality)
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoder)
+        response.headers.pop("Content-Length", None)
+    else:
+        response.set_data(encoder.compress(response.get_data()) + encoder.finish())
+    response.headers["Content-Encoding"] = encoding
+
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,390 @@
+import select
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+
+
+class PoolExhaustedError(Exception):
+    """ Raised when no pooled connection becomes free within the checkout timeout. """
+
+
+class DatabaseUnavailableError(Exception):
+    """ Raised without touching the database while the circuit breaker is open. """
+
+
+def is_connection_failure(error, conn):
+    """
+    True when `error` means the connection itself failed, not just the statement running on it.
+
+    That is a closed connection, an InterfaceError, or an OperationalError with no SQLSTATE (the socket
+    broke), a class 08 connection exception or a 57P0x server shutdown. Other OperationalErrors, such as
+    QueryCanceledError from a statement timeout, leave the connection usable after a rollback.
+    """
+    if conn.closed or isinstance(error, psycopg2.InterfaceError):
+        return True
+    if isinstance(error, psycopg2.OperationalError):
+        return error.pgcode is None or error.pgcode.startswith(("08", "57P0"))
+    return False
+
+
+class CircuitBreaker:
+    """
+    Shared record of whether the database is reachable.
+
+    After `failure_threshold` consecutive connection failures the circuit opens: callers of check() fail
+    fast with DatabaseUnavailableError instead of each waiting on a connection attempt. While it is open,
+    a background thread calls `probe` every `probe_interval` seconds and closes the circuit as soon as
+    one succeeds.
+    """
+
+    def __init__(self, probe, failure_threshold=3, probe_interval=5):
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+
+        self._lock = threading.Lock()
+        self._open = False
+        self._failures = 0
+        self._opened_at = None
+        self._last_error = None
+        self._stats = {"circuit_trips": 0, "probes": 0, "probe_failures": 0, "rejected": 0}
+
+    @property
+    def is_open(self):
+        return self._open
+
+    def check(self):
+        """ Raise DatabaseUnavailableError if the circuit is open. """
+        if self._open:
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise DatabaseUnavailableError(f"Database unavailable: {self._last_error}")
+
+    def record_success(self):
+        if self._failures:
+            with self._lock:
+                self._failures = 0
+
+    def record_failure(self, error):
+        with self._lock:
+            self._failures += 1
+            self._last_error = str(error).strip()
+            if self._open or self._failures < self.failure_threshold:
+                return
+            self._open = True
+            self._opened_at = time.monotonic()
+            self._stats["circuit_trips"] += 1
+        print(f"Database circuit opened after {self.failure_threshold} failures: {self._last_error}")
+        threading.Thread(target=self._probe_until_closed, name="db-circuit-probe", daemon=True).start()
+
+    def _probe_until_closed(self):
+        while True:
+            time.sleep(self.probe_interval)
+            try:
+                self.probe()
+            except Exception as e:
+                with self._lock:
+                    self._stats["probes"] += 1
+                    self._stats["probe_failures"] += 1
+                    self._last_error = str(e).strip()
+                continue
+            with self._lock:
+                self._stats["probes"] += 1
+                self._open = False
+                self._failures = 0
+                down_for = time.monotonic() - self._opened_at
+            print(f"Database circuit closed after {down_for:.1f} seconds")
+            return
+
+    def stats(self):
+        with self._lock:
+            return {
+                "circuit_open": int(self._open),
+                "consecutive_failures": self._failures,
+                "circuit_open_seconds": round(time.monotonic() - self._opened_at, 3) if self._open else 0,
+                **self._stats,
+            }
+
+    def health(self):
+        """ Return readiness details without opening a connection. """
+        with self._lock:
+            return {"ready": not self._open, "last_error": self._last_error if self._open else None}
+
+
+class NotificationListener:
+    """
+    LISTEN on one channel over a dedicated connection and call `callback(payload)` for each notification.
+
+    Runs in a daemon thread. When the connection drops it reconnects after `retry_delay` seconds and calls
+    `callback(None)` once listening again, since anything sent in between was missed.
+    """
+
+    def __init__(self, dsn, channel, callback, connect_timeout=5, retry_delay=5):
+        self.dsn = dsn
+        self.channel = channel
+        self.callback = callback
+        self.connect_timeout = connect_timeout
+        self.retry_delay = retry_delay
+        self.notifications = 0
+        self.reconnects = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"listen-{channel}", daemon=True)
+        self._thread.start()
+
+    def _listen(self):
+        conn = psycopg2.connect(self.dsn, sslmode="require", connect_timeout=self.connect_timeout)
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {self.channel}")
+            if self.reconnects:
+                self.callback(None)
+            while not self._stopped.is_set():
+                if select.select([conn], [], [], 1.0)[0]:
+                    conn.poll()
+                    while conn.notifies:
+                        self.notifications += 1
+                        self.callback(conn.notifies.pop(0).payload)
+        finally:
+            conn.close()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self._listen()
+            except Exception as e:
+                print(f"Error in {self.channel} listener: {str(e)}")
+                self.reconnects += 1
+                self._stopped.wait(self.retry_delay)
+
+    def close(self):
+        self._stopped.set()
+        self._thread.join(2)
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of PostgreSQL connections with checkout validation and age-based recycling.
+
+    Connection failures feed a CircuitBreaker: once it opens, checkouts fail fast instead of each request
+    thread waiting on its own connection attempt.
+    """
+
+    def __init__(self, dsn, max_size=4, max_age=1800, checkout_timeout=10, validate_after=5,
+                 max_retries=3, retry_delay=2, connect_timeout=5, failure_threshold=3, probe_interval=5):
+        self.dsn = dsn
+        self.max_size = max_size
+        # Connections older than this (in seconds) are closed instead of being reused
+        self.max_age = max_age
+        # How long a request waits for a free connection before giving up (in seconds)
+        self.checkout_timeout = checkout_timeout
+        # Connections idle for longer than this (in seconds) are pinged before being handed out
+        self.validate_after = validate_after
+        # Startup connection attempts (see wait_until_available); request-time attempts are not retried
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.connect_timeout = connect_timeout
+        self.breaker = CircuitBreaker(self._probe, failure_threshold=failure_threshold,
+                                      probe_interval=probe_interval)
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        # Idle connections as (conn, created_at, last_used_at), most recently used last
+        self._idle = []
+        self._created_at = {}
+        self._stats = {
+            "connections_opened": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "checkout_timeouts": 0,
+            "validation_failures": 0,
+            "recycled": 0,
+        }
+
+    def _open(self):
+        conn = psycopg2.connect(self.dsn, sslmode="require", connect_timeout=self.connect_timeout)
+        conn.autocommit = False
+        return conn
+
+    def _probe(self):
+        """ Recovery check run by the circuit breaker: a fresh connection that answers SELECT 1. """
+        conn = self._open()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+        finally:
+            conn.close()
+
+    def _connect(self):
+        """ Open a new database connection; a failure counts towards opening the circuit. """
+        try:
+            conn = self._open()
+        except psycopg2.OperationalError as e:
+            self.breaker.record_failure(e)
+            raise
+        self.breaker.record_success()
+        return conn
+
+    def wait_until_available(self):
+        """ At startup, try to reach the database with the retry mechanism before serving anything. """
+        retries = 0
+        last_error = None
+
+        while retries < self.max_retries:
+            try:
+                self._probe()
+                return
+            except psycopg2.OperationalError as e:
+                last_error = e
+                error_msg = str(e)
+
+                # Check if this is the specific DNS resolution error
+                if "could not translate host name" in error_msg and "to address" in error_msg:
+                    print(f"Critical database connection error: {error_msg}")
+                    # This will be caught by the server wrapper and trigger a restart
+                    sys.exit(1)
+
+                # For other operational errors, retry
+                retries += 1
+                print(f"Database connection error (attempt {retries}/{self.max_retries}): {error_msg}")
+
+                if retries < self.max_retries:
+                    time.sleep(self.retry_delay)
+
+        # If we've exhausted retries, re-raise the last error
+        print(f"Failed to connect to database after {self.max_retries} attempts")
+        raise last_error
+
+    def _discard(self, conn):
+        with self._lock:
+            self._created_at.pop(id(conn), None)
+            self._stats["connections_closed"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, conn, last_used):
+        """ Check that an idle connection is still open and, if it sat idle for a while, still answers. """
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.validate_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """ Check a connection out of the pool, opening a new one if no healthy idle connection exists. """
+        self.breaker.check()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            with self._lock:
+                self._stats["checkout_timeouts"] += 1
+            raise PoolExhaustedError(
+                f"No database connection available after {self.checkout_timeout} seconds")
+
+        try:
+            while True:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    conn, created_at, last_used = self._idle.pop()
+
+                if time.monotonic() - created_at >= self.max_age:
+                    with self._lock:
+                        self._stats["recycled"] += 1
+                    self._discard(conn)
+                    continue
+
+                if not self._is_usable(conn, last_used):
+                    with self._lock:
+                        self._stats["validation_failures"] += 1
+                    self._discard(conn)
+                    continue
+
+                with self._lock:
+                    self._stats["checkouts"] += 1
+                return conn
+
+            conn = self._connect()
+            with self._lock:
+                self._created_at[id(conn)] = time.monotonic()
+                self._stats["connections_opened"] += 1
+                self._stats["checkouts"] += 1
+            return conn
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, discard=False):
+        """ Return a connection to the pool, closing it if it is broken, too old or left mid-transaction. """
+        try:
+            with self._lock:
+                created_at = self._created_at.get(id(conn), 0)
+
+            if not discard and not conn.closed:
+                try:
+                    if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+
+            if discard or conn.closed or time.monotonic() - created_at >= self.max_age:
+                self._discard(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, created_at, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """ Check out a connection for a block: commit on success, roll back on error, then return it. """
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+            if not conn.closed:
+                conn.commit()
+                self.breaker.record_success()
+        except BaseException as e:
+            # Only a failed connection counts towards the circuit; a slow or failing query does not
+            broken = is_connection_failure(e, conn)
+            if broken:
+                self.breaker.record_failure(e)
+            else:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            raise
+        finally:
+            self.putconn(conn, discard=broken)
+
+    def stats(self):
+        """ Return a snapshot of pool usage counters. """
+        with self._lock:
+            open_count = len(self._created_at)
+            idle_count = len(self._idle)
+            return {
+                "max_size": self.max_size,
+                "open": open_count,
+                "idle": idle_count,
+                "in_use": open_count - idle_count,
+                **self._stats,
+                **self.breaker.stats(),
+            }
+
+    def closeall(self):
+        """ Close every idle connection (connections in use are closed when they are returned). """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _, _ in idle:
+            self._discard(conn)
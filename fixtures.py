@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Synthetic users and transaction logs for profiling and load tests.
+
+    python fixtures.py --backend sqlite --sqlite-path bench.sqlite3 --users 10000 --logs 5000000
+
+Generation is deterministic for a given --seed. Logs are spread over the last --days days and streamed
+into the database in batches, so millions of rows never have to fit in memory at once.
+"""
+import argparse
+import os
+import random
+import sys
+import uuid as uid
+from datetime import datetime, timedelta
+
+from db import ConnectionPool
+from repository import PostgresRepository
+from sqlite_repository import SQLiteRepository
+
+FIRST_NAMES = ["Ada", "Alan", "Alex", "Ayla", "Ben", "Cleo", "Dana", "Eli", "Finn", "Grace", "Hugo", "Ivy",
+               "Jade", "Kai", "Lena", "Milo", "Nora", "Omar", "Pia", "Quinn", "Rosa", "Sam", "Tara", "Uma",
+               "Vik", "Wren", "Xena", "Yuki", "Zane"]
+LAST_NAMES = ["Archer", "Baker", "Chen", "Diaz", "Evans", "Fischer", "Garcia", "Hughes", "Ito", "Jensen",
+              "Khan", "Lopez", "Moreau", "Novak", "Okafor", "Patel", "Rossi", "Silva", "Tanaka", "Weber"]
+PURCHASE_REASONS = ["Sticker pack", "Soldering kit", "LED strip", "Snack", "Arduino", "Raspberry Pi",
+                    "Hoodie", "Filament", "Jumper wires", "Energy drink"]
+REIMBURSEMENT_REASONS = ["Workshop helper", "Returned item", "Bug bounty", "Demo prize", "Cleanup crew"]
+BATCH_REASONS = ["Daily allowance", "Event bonus", "Correction"]
+
+
+def generate_users(count, seed=0):
+    """ Return `count` (uuid, name, scraps) rows. """
+    rng = random.Random(seed)
+    return [(str(uid.UUID(int=rng.getrandbits(128), version=4)),
+             f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", rng.randint(0, 200))
+            for _ in range(count)]
+
+
+def generate_logs(users, count, days=30, seed=0, end=None):
+    """
+    Yield `count` (uuid, type, reason, timestamp, signed amount) rows spread over the `days` before `end`.
+
+    The mix is roughly 70% purchases, 25% reimbursements and 5% batch adjustments, in timestamp order.
+    """
+    rng = random.Random(seed)
+    end = end or datetime.now()
+    start = end - timedelta(days=days)
+    step = (end - start) / max(count, 1)
+    for i in range(count):
+        uuid = rng.choice(users)[0]
+        roll = rng.random()
+        amount = rng.randint(1, 50)
+        if roll < 0.70:
+            transaction_type, reason, amount = "Purchase", rng.choice(PURCHASE_REASONS), -amount
+        elif roll < 0.95:
+            transaction_type, reason = "Reimbursement", rng.choice(REIMBURSEMENT_REASONS)
+        elif roll < 0.98:
+            transaction_type, reason = "Batch Add", rng.choice(BATCH_REASONS)
+        else:
+            transaction_type, reason, amount = "Batch Remove", rng.choice(BATCH_REASONS), -amount
+        sign = "+" if amount > 0 else "-"
+        yield uuid, transaction_type, f"{reason} ({sign}{abs(amount)} scraps)", start + step * i, amount
+
+
+def seed(repository, users=1000, logs=10000, days=30, seed_value=0):
+    """ Create or migrate the schema if needed and load generated fixtures through `repository`. """
+    repository.migrate()
+    repository.setup()
+    user_rows = generate_users(users, seed=seed_value)
+    with repository.transaction() as store:
+        store.load_fixtures(user_rows, generate_logs(user_rows, logs, days=days, seed=seed_value))
+    return user_rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load synthetic Scrapyard fixtures")
+    parser.add_argument("--backend", choices=["postgres", "sqlite"], default="sqlite")
+    parser.add_argument("--sqlite-path", default=os.getenv("SQLITE_PATH", "scrapyard.sqlite3"))
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--logs", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.backend == "sqlite":
+        target = SQLiteRepository(args.sqlite_path)
+    else:
+        target = PostgresRepository(ConnectionPool(os.getenv("DATABASE_URL"), max_size=1))
+
+    try:
+        seed(target, users=args.users, logs=args.logs, days=args.days, seed_value=args.seed)
+        print(f"Loaded {args.users} users and {args.logs} transaction logs into {args.backend}")
+    except Exception as err:
+        print(f"Loading fixtures failed: {str(err)}")
+        sys.exit(1)
+    finally:
+        target.close()
@@ -0,0 +1,195 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+
+class WriterQueueFullError(Exception):
+    """ Raised when a tap could not be queued, or was withdrawn after waiting too long; it was not applied. """
+
+
+class WriterClosedError(Exception):
+    """ Raised when a tap is submitted after the writer started shutting down. """
+
+
+class WriterOutcomeUnknownError(Exception):
+    """
+    Raised when a tap may or may not have been committed: its batch failed at COMMIT, or it was still being
+    written when the caller stopped waiting. Retrying it could apply it twice.
+    """
+
+
+# Queue marker that tells the writer thread to finish
+_STOP = object()
+
+
+class GroupCommitWriter:
+    """
+    Background writer that applies purchase/reimbursement taps in shared transactions.
+
+    Request threads submit() a (uuid, type, signed amount, reason) tap and wait on the returned future.
+    The writer thread takes whatever has queued up (up to `max_batch` taps, waiting at most `max_wait`
+    seconds for more), applies the batch through store.apply_taps() in one transaction, and resolves each
+    future with that tap's (status, entry, new scraps) only after the commit. The queue is bounded: when it
+    is full, submit() blocks for up to `enqueue_timeout` seconds and then raises WriterQueueFullError.
+
+    When a batch fails before COMMIT its taps are retried one by one; when COMMIT itself fails the server may
+    already have applied the batch, so its taps fail with WriterOutcomeUnknownError instead of being replayed.
+    """
+
+    def __init__(self, repository, max_batch=200, max_wait=0.002, queue_size=1000, enqueue_timeout=2):
+        self.repository = repository
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.enqueue_timeout = enqueue_timeout
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._closed = False
+        self._stop_seen = False
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "rejected": 0, "batches": 0, "committed": 0, "failed": 0,
+                       "largest_batch": 0, "cancelled": 0, "uncertain": 0}
+        self._thread = threading.Thread(target=self._run, name="group-commit-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, tap):
+        """ Queue a tap; returns a Future that resolves once the transaction holding it has committed. """
+        if self._closed:
+            raise WriterClosedError("The transaction writer is shutting down")
+        future = Future()
+        try:
+            self._queue.put((tap, future), timeout=self.enqueue_timeout)
+        except queue.Full:
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise WriterQueueFullError(f"Write queue still full after {self.enqueue_timeout} seconds")
+        with self._lock:
+            self._stats["submitted"] += 1
+        return future
+
+    def result(self, future, timeout):
+        """
+        Wait up to `timeout` seconds for a submitted tap's outcome.
+
+        A tap still queued by then is withdrawn and WriterQueueFullError raised, so the caller can safely
+        retry it; a tap already being written raises WriterOutcomeUnknownError.
+        """
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                with self._lock:
+                    self._stats["cancelled"] += 1
+                raise WriterQueueFullError(f"Tap still queued after {timeout} seconds and was withdrawn")
+            raise WriterOutcomeUnknownError(f"Tap still being written after {timeout} seconds")
+
+    def _next_batch(self):
+        """ Block for the first tap, then collect what else arrives within max_wait; None means stop. """
+        item = self._queue.get()
+        if item is _STOP:
+            self._stop_seen = True
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # Finish this batch first, then stop
+                self._stop_seen = True
+                break
+            batch.append(item)
+        return batch
+
+    def _apply(self, batch):
+        """ Apply and commit a batch; errors raised once COMMIT has started become WriterOutcomeUnknownError. """
+        committing = False
+        try:
+            with self.repository.transaction() as store:
+                outcomes = store.apply_taps([tap for tap, _ in batch])
+                committing = True
+        except Exception as e:
+            if committing:
+                raise WriterOutcomeUnknownError(f"Commit of {len(batch)} taps failed: {str(e)}") from e
+            raise
+        for (_, future), outcome in zip(batch, outcomes):
+            future.set_result(outcome)
+
+    def _flush(self, batch):
+        # Skip taps withdrawn by callers that stopped waiting; the rest can no longer be cancelled
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        committed, failed, uncertain = 0, 0, 0
+        try:
+            self._apply(batch)
+            committed = len(batch)
+        except WriterOutcomeUnknownError as e:
+            print(f"Error in group commit of {len(batch)} taps: {str(e)}")
+            for _, future in batch:
+                future.set_exception(e)
+            uncertain = len(batch)
+        except Exception as e:
+            print(f"Error in group commit of {len(batch)} taps: {str(e)}")
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                failed = 1
+            else:
+                # Nothing was committed: retry each tap on its own so one bad tap cannot fail the others
+                for item in batch:
+                    try:
+                        self._apply([item])
+                        committed += 1
+                    except WriterOutcomeUnknownError as item_error:
+                        item[1].set_exception(item_error)
+                        uncertain += 1
+                    except Exception as item_error:
+                        item[1].set_exception(item_error)
+                        failed += 1
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["committed"] += committed
+            self._stats["failed"] += failed
+            self._stats["uncertain"] += uncertain
+            self._stats["largest_batch"] = max(self._stats["largest_batch"], len(batch))
+
+    def _run(self):
+        while not self._stop_seen:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            self._flush(batch)
+
+        # Anything that slipped in behind the stop marker is still written before the thread exits
+        leftovers = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftovers.append(item)
+        for start in range(0, len(leftovers), self.max_batch):
+            self._flush(leftovers[start:start + self.max_batch])
+
+    def close(self, timeout=30):
+        """ Stop accepting taps, write everything already queued, and wait up to `timeout` seconds for it. """
+        if self._closed:
+            return
+        self._closed = True
+        deadline = time.monotonic() + timeout
+        try:
+            # The writer keeps draining while this waits, so a full queue normally frees a slot quickly
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            print(f"Group commit writer still has {self._queue.qsize()} taps queued after {timeout} seconds; "
+                  f"not waiting for them")
+            return
+        self._thread.join(max(0.0, deadline - time.monotonic()))
+
+    def stats(self):
+        with self._lock:
+            return {"queued": self._queue.qsize(), "queue_size": self._queue.maxsize, **self._stats}
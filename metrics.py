@@ -0,0 +1,185 @@
+"""
+Per-request metrics in Prometheus text format.
+
+app.py starts a RequestStats for every request; the repositories report each SQL statement and each
+connection checkout to it through track_query() / track_connection_wait(), and template rendering is
+timed through Flask's template signals. When the response has been sent, the totals are folded into
+per-endpoint histograms. Every observation is a few additions under one lock, cheap enough to leave on.
+"""
+import bisect
+import threading
+import time
+
+# Upper bounds of the histogram buckets (+Inf is implied)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100, 1000)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+# Metric name -> (help text, buckets)
+HISTOGRAMS = {
+    "scrapyard_http_request_duration_seconds": ("Time from request start until the response is sent",
+                                                LATENCY_BUCKETS),
+    "scrapyard_db_queries_per_request": ("SQL statements executed per request", QUERY_COUNT_BUCKETS),
+    "scrapyard_db_duration_seconds": ("Time per request spent executing SQL", LATENCY_BUCKETS),
+    "scrapyard_db_connection_wait_seconds": ("Time per request spent waiting for a database connection",
+                                             LATENCY_BUCKETS),
+    "scrapyard_template_duration_seconds": ("Time per request spent rendering templates", LATENCY_BUCKETS),
+    "scrapyard_http_response_size_bytes": ("Response body size", SIZE_BUCKETS),
+}
+
+_local = threading.local()
+
+
+class RequestStats:
+    """ Totals collected while one request is handled. """
+
+    __slots__ = ("started", "queries", "db_seconds", "connection_seconds", "template_seconds",
+                 "template_started", "response_bytes")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.connection_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_started = None
+        self.response_bytes = 0
+
+
+def current():
+    """ Return the RequestStats of the request running on this thread, or None outside requests. """
+    return getattr(_local, "stats", None)
+
+
+def track_query(seconds):
+    stats = current()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += seconds
+
+
+def track_connection_wait(seconds):
+    stats = current()
+    if stats is not None:
+        stats.connection_seconds += seconds
+
+
+def template_started():
+    stats = current()
+    if stats is not None:
+        stats.template_started = time.perf_counter()
+
+
+def template_finished():
+    stats = current()
+    if stats is not None and stats.template_started is not None:
+        stats.template_seconds += time.perf_counter() - stats.template_started
+        stats.template_started = None
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels):
+    return ",".join(f'{key}="{escape_label(value)}"' for key, value in labels)
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """ Registry of per-endpoint request histograms and in-flight gauges. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (metric name, label pairs) -> Histogram
+        self._histograms = {}
+        # endpoint -> requests currently being handled
+        self._in_progress = {}
+
+    def start_request(self, endpoint):
+        """ Begin collecting for the request on this thread and count it as in progress. """
+        _local.stats = RequestStats()
+        with self._lock:
+            self._in_progress[endpoint] = self._in_progress.get(endpoint, 0) + 1
+        return _local.stats
+
+    def finish_request(self, stats, endpoint, method, status):
+        """ Fold a finished request's totals into the histograms. """
+        if getattr(_local, "stats", None) is stats:
+            _local.stats = None
+        duration = time.perf_counter() - stats.started
+        request_labels = (("endpoint", endpoint), ("method", method), ("status", status))
+        endpoint_labels = (("endpoint", endpoint),)
+        observations = (
+            ("scrapyard_http_request_duration_seconds", request_labels, duration),
+            ("scrapyard_db_queries_per_request", endpoint_labels, stats.queries),
+            ("scrapyard_db_duration_seconds", endpoint_labels, stats.db_seconds),
+            ("scrapyard_db_connection_wait_seconds", endpoint_labels, stats.connection_seconds),
+            ("scrapyard_template_duration_seconds", endpoint_labels, stats.template_seconds),
+            ("scrapyard_http_response_size_bytes", endpoint_labels, stats.response_bytes),
+        )
+        with self._lock:
+            self._in_progress[endpoint] -= 1
+            for name, labels, value in observations:
+                histogram = self._histograms.get((name, labels))
+                if histogram is None:
+                    histogram = self._histograms[(name, labels)] = Histogram(HISTOGRAMS[name][1])
+                histogram.observe(value)
+
+    def render(self, gauges=None):
+        """
+        Return every metric in the Prometheus text exposition format.
+
+        `gauges` maps extra gauge names to (help text, value) and is appended as-is.
+        """
+        with self._lock:
+            histograms = sorted(
+                (name, labels, list(h.counts), h.sum, h.count) for (name, labels), h in self._histograms.items())
+            in_progress = sorted(self._in_progress.items())
+
+        lines = []
+        current_name = None
+        for name, labels, counts, total, count in histograms:
+            if name != current_name:
+                current_name = name
+                lines.append(f"# HELP {name} {HISTOGRAMS[name][0]}")
+                lines.append(f"# TYPE {name} histogram")
+            label_text = format_labels(labels)
+            cumulative = 0
+            for bound, bucket_count in zip(HISTOGRAMS[name][1], counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{label_text},le="+Inf"}} {count}')
+            lines.append(f"{name}_sum{{{label_text}}} {format_value(total)}")
+            lines.append(f"{name}_count{{{label_text}}} {count}")
+
+        lines.append("# HELP scrapyard_http_requests_in_progress Requests currently being handled")
+        lines.append("# TYPE scrapyard_http_requests_in_progress gauge")
+        for endpoint, value in in_progress:
+            lines.append(f"scrapyard_http_requests_in_progress{{{format_labels([('endpoint', endpoint)])}}} {value}")
+
+        for name, (help_text, value) in sorted((gauges or {}).items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {format_value(value)}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,611 @@
+#!/usr/bin/env python3
+import argparse
+import gzip
+import os
+import re
+import sys
+from datetime import date, datetime
+
+import psycopg2
+
+# Arbitrary key for the advisory lock that keeps concurrent workers from migrating at the same time
+MIGRATION_LOCK_KEY = 7_310_421
+# Monthly transaction_logs partitions kept ready beyond the current month
+LOG_PARTITIONS_AHEAD = int(os.getenv("LOG_PARTITIONS_AHEAD", 3))
+# Full months of transaction_logs kept in the database before the current one, enforced by
+# `python migrations.py maintain-partitions` (run it from cron); 0 keeps everything
+LOG_RETENTION_MONTHS = int(os.getenv("LOG_RETENTION_MONTHS", 0))
+# Directory that receives the gzipped CSV of each archived partition
+LOG_ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive"))
+
+# Rows each dashboard counter and hourly rollup is spread over; a write bumps the slot of its connection's
+# backend, so concurrent transactions rarely wait on each other's row lock. Readers add the slots up
+COUNTER_SLOTS = int(os.getenv("COUNTER_SLOTS", 16))
+
+# Arbitrary key for the advisory lock that keeps two reconciliation runs from counting the same rows
+RECONCILE_LOCK_KEY = 7_310_422
+# Most new transaction log rows one reconciliation pass reads
+RECONCILE_BATCH_ROWS = int(os.getenv("RECONCILE_BATCH_ROWS", 100000))
+# Rows logged more recently than this (in seconds) wait for the next pass, so a transaction that takes a
+# log id but commits late is not skipped over
+RECONCILE_SETTLE_SECONDS = int(os.getenv("RECONCILE_SETTLE_SECONDS", 60))
+
+# Monthly partitions are named transaction_logs_YYYY_MM
+PARTITION_NAME = re.compile(r"^transaction_logs_(\d{4})_(\d{2})$")
+
+
+# --- TRANSACTION LOG PARTITIONS ---
+def add_months(month, months):
+    """ Return the first day of the month `months` after (or before, if negative) `month`. """
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"transaction_logs_{month:%Y_%m}"
+
+
+def list_partitions(cur):
+    """ Return {month: attached} for every monthly partition table, including detached ones not yet archived. """
+    cur.execute("""
+        SELECT c.relname, i.inhrelid IS NOT NULL
+        FROM pg_class c
+        LEFT JOIN pg_inherits i ON i.inhrelid = c.oid
+        WHERE c.relkind = 'r' AND c.relname LIKE 'transaction_logs_%'
+    """)
+    partitions = {}
+    for name, attached in cur.fetchall():
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = attached
+    return partitions
+
+
+def create_partition(cur, month):
+    """
+    Attach the partition for `month`, first moving in any rows the default partition caught for it.
+
+    The default partition only holds rows logged for a month that had no partition yet (backdated fixtures,
+    or a process that outlived its pre-created months); PostgreSQL refuses to attach a range while the
+    default still holds rows from it.
+    """
+    name = partition_name(month)
+    start, end = month.isoformat(), add_months(month, 1).isoformat()
+    cur.execute(f"CREATE TABLE {name} (LIKE transaction_logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM transaction_logs_default WHERE timestamp >= %s AND timestamp < %s RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """, (start, end))
+    cur.execute(f"ALTER TABLE transaction_logs ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", (start, end))
+
+
+def ensure_partitions(cur, months_ahead=LOG_PARTITIONS_AHEAD):
+    """
+    Create the partitions for this month and the next `months_ahead`, plus any month found in the default
+    partition. Returns the months created.
+    """
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+    existing = list_partitions(cur)
+    cur.execute("SELECT DISTINCT date_trunc('month', timestamp)::date FROM transaction_logs_default "
+                "WHERE timestamp IS NOT NULL")
+    months = {row[0] for row in cur.fetchall()}
+    current = date.today().replace(day=1)
+    months.update(add_months(current, offset) for offset in range(months_ahead + 1))
+
+    created = sorted(month for month in months if month not in existing)
+    for month in created:
+        create_partition(cur, month)
+    return created
+
+
+def partition_transaction_logs(cur):
+    """
+    Rebuild transaction_logs as a table partitioned by month of timestamp.
+
+    Existing rows are copied into their monthly partitions inside the migration transaction, so on a large
+    table this runs for about as long as a full table copy and index build. Rows outside every partition
+    land in transaction_logs_default until ensure_partitions() gives their month a partition.
+    """
+    cur.execute("ALTER TABLE transaction_logs RENAME TO transaction_logs_unpartitioned")
+    # The id sequence belongs to the old table; detach it so dropping that table keeps the sequence
+    cur.execute("SELECT pg_get_serial_sequence('transaction_logs_unpartitioned', 'id')")
+    sequence = cur.fetchone()[0]
+    cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY NONE")
+    cur.execute("""
+        CREATE TABLE transaction_logs (LIKE transaction_logs_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+        PARTITION BY RANGE (timestamp)
+    """)
+    cur.execute("CREATE TABLE transaction_logs_default PARTITION OF transaction_logs DEFAULT")
+
+    cur.execute("SELECT DISTINCT date_trunc('month', timestamp)::date FROM transaction_logs_unpartitioned "
+                "WHERE timestamp IS NOT NULL")
+    months = {row[0] for row in cur.fetchall()}
+    current = date.today().replace(day=1)
+    months.update(add_months(current, offset) for offset in range(LOG_PARTITIONS_AHEAD + 1))
+    for month in sorted(months):
+        create_partition(cur, month)
+
+    cur.execute("INSERT INTO transaction_logs SELECT * FROM transaction_logs_unpartitioned")
+    cur.execute("DROP TABLE transaction_logs_unpartitioned")
+    cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY transaction_logs.id")
+
+    # Indexes are built after the copy; a unique index on a partitioned table must include the partition key
+    cur.execute("""
+        CREATE UNIQUE INDEX transaction_logs_id_idx ON transaction_logs (id, timestamp);
+        CREATE INDEX transaction_logs_timestamp_id_idx ON transaction_logs (timestamp DESC, id DESC);
+        CREATE INDEX transaction_logs_uuid_timestamp_idx ON transaction_logs (uuid, timestamp);
+        CREATE INDEX transaction_logs_kind_timestamp_idx ON transaction_logs (kind, timestamp);
+        CREATE INDEX transaction_logs_name_trgm_idx ON transaction_logs USING GIN (name gin_trgm_ops);
+        CREATE INDEX transaction_logs_name_prefix_idx ON transaction_logs (lower(name) text_pattern_ops);
+    """)
+
+
+def archive_path(archive_dir, name):
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    if os.path.exists(path):
+        # The month was archived before and rows logged for it later got a new partition
+        path = os.path.join(archive_dir, f"{name}.{datetime.now():%Y%m%d%H%M%S}.csv.gz")
+    return path
+
+
+def archive_partitions(conn, retention_months=LOG_RETENTION_MONTHS, archive_dir=LOG_ARCHIVE_DIR):
+    """
+    Move partitions older than `retention_months` full months out of the database into gzipped CSV files.
+
+    Each partition is detached (and committed) first, so queries stop reading it, then copied to
+    `archive_dir`/transaction_logs_YYYY_MM.csv.gz and dropped only once the file is safely on disk. A run
+    interrupted in between leaves a detached table that the next run archives. Dashboard counters, analytics
+    rollups and reconciliation totals are kept, so totals, charts and ledger checks still cover archived
+    months. Returns the files written.
+
+    Restore a month with: gunzip -c <file> | psql -c "\\copy transaction_logs FROM STDIN WITH (FORMAT csv, HEADER)"
+    """
+    cutoff = add_months(date.today().replace(day=1), -retention_months)
+    written = []
+    with conn.cursor() as cur:
+        # Count the rows about to leave the database into the reconciliation totals first
+        while True:
+            caught_up = advance_ledger(cur)[3]
+            conn.commit()
+            if caught_up:
+                break
+
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+        try:
+            for month, attached in sorted(list_partitions(cur).items()):
+                if month >= cutoff:
+                    continue
+                name = partition_name(month)
+                if attached:
+                    cur.execute(f"ALTER TABLE transaction_logs DETACH PARTITION {name}")
+                    conn.commit()
+
+                os.makedirs(archive_dir, exist_ok=True)
+                path = archive_path(archive_dir, name)
+                partial = path + ".partial"
+                with open(partial, "wb") as raw:
+                    with gzip.GzipFile(fileobj=raw, mode="wb") as f:
+                        cur.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", f)
+                    raw.flush()
+                    os.fsync(raw.fileno())
+                os.replace(partial, path)
+
+                cur.execute(f"DROP TABLE {name}")
+                conn.commit()
+                written.append(path)
+                print(f"Archived {name} to {path}")
+        finally:
+            conn.rollback()
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+            conn.commit()
+    return written
+
+
+# Ordered schema migrations as (version, name, sql), where sql may also be a function run with the cursor.
+# Never edit an applied migration, append a new one.
+MIGRATIONS = [
+    (1, "transaction_logs id and lookup indexes", """
+        ALTER TABLE transaction_logs ADD COLUMN IF NOT EXISTS id BIGSERIAL;
+        CREATE UNIQUE INDEX IF NOT EXISTS transaction_logs_id_idx ON transaction_logs (id);
+        CREATE INDEX IF NOT EXISTS transaction_logs_timestamp_idx ON transaction_logs (timestamp);
+        CREATE INDEX IF NOT EXISTS transaction_logs_uuid_timestamp_idx ON transaction_logs (uuid, timestamp);
+    """),
+    (2, "structured amount and kind on transaction_logs", """
+        CREATE TYPE transaction_kind AS ENUM ('purchase', 'reimbursement', 'batch_add', 'batch_remove');
+        ALTER TABLE transaction_logs ADD COLUMN IF NOT EXISTS amount INTEGER;
+        ALTER TABLE transaction_logs ADD COLUMN IF NOT EXISTS kind transaction_kind;
+        CREATE INDEX IF NOT EXISTS transaction_logs_kind_timestamp_idx ON transaction_logs (kind, timestamp);
+        CREATE TABLE IF NOT EXISTS maintenance_checkpoints (
+            name TEXT PRIMARY KEY,
+            position BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+    """),
+    (3, "keyset pagination indexes", """
+        CREATE INDEX IF NOT EXISTS transaction_logs_timestamp_id_idx ON transaction_logs (timestamp DESC, id DESC);
+        CREATE INDEX IF NOT EXISTS credit_card_name_uuid_idx ON credit_card (name, uuid);
+    """),
+    (4, "trigram and prefix name search indexes", """
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS credit_card_name_trgm_idx ON credit_card USING GIN (name gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS credit_card_name_prefix_idx ON credit_card (lower(name) text_pattern_ops);
+        CREATE INDEX IF NOT EXISTS transaction_logs_name_trgm_idx ON transaction_logs USING GIN (name gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS transaction_logs_name_prefix_idx
+            ON transaction_logs (lower(name) text_pattern_ops);
+    """),
+    (5, "dashboard counters", """
+        CREATE TABLE IF NOT EXISTS dashboard_counters (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            total_users BIGINT NOT NULL DEFAULT 0,
+            total_transactions BIGINT NOT NULL DEFAULT 0,
+            total_scraps BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+        INSERT INTO dashboard_counters (id, total_users, total_transactions, total_scraps)
+        SELECT TRUE,
+               (SELECT COUNT(*) FROM credit_card),
+               (SELECT COUNT(*) FROM transaction_logs),
+               (SELECT COALESCE(SUM(scraps), 0) FROM credit_card)
+        ON CONFLICT DO NOTHING;
+    """),
+    (6, "hourly transaction rollups", """
+        CREATE TABLE IF NOT EXISTS transaction_rollups (
+            hour TIMESTAMP NOT NULL,
+            name TEXT NOT NULL,
+            count BIGINT NOT NULL DEFAULT 0,
+            amount BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, name)
+        );
+        INSERT INTO transaction_rollups (hour, name, count, amount)
+        SELECT date_trunc('hour', timestamp), name, COUNT(*), COALESCE(SUM(amount), 0)
+        FROM transaction_logs
+        GROUP BY 1, 2
+        ON CONFLICT DO NOTHING;
+    """),
+    (7, "monthly partitions of transaction_logs", partition_transaction_logs),
+    (8, "ledger reconciliation totals", r"""
+        -- Existing cards open at whatever makes them reconcile today, so only drift from now on is flagged.
+        -- Their starting scraps were never logged, so that inferred opening is kept in opening_adjustment for
+        -- opening_adjustments() to report; cards created from now on record a known opening and leave it NULL
+        ALTER TABLE credit_card ADD COLUMN IF NOT EXISTS opening_scraps INTEGER;
+        ALTER TABLE credit_card ADD COLUMN IF NOT EXISTS opening_adjustment INTEGER;
+        UPDATE credit_card c SET opening_scraps = c.scraps - COALESCE((
+            SELECT SUM(COALESCE(t.amount, substring(t.reason FROM '\(([-+]\d+) scraps\)\s*$')::INTEGER))
+            FROM transaction_logs t
+            WHERE t.uuid = c.uuid
+        ), 0);
+        UPDATE credit_card SET opening_adjustment = opening_scraps;
+        ALTER TABLE credit_card ALTER COLUMN opening_scraps SET DEFAULT 0, ALTER COLUMN opening_scraps SET NOT NULL;
+        CREATE TABLE IF NOT EXISTS ledger_totals (
+            uuid UUID PRIMARY KEY,
+            logged BIGINT NOT NULL DEFAULT 0,
+            rows BIGINT NOT NULL DEFAULT 0
+        );
+    """),
+    (9, "balance change notifications", """
+        -- One notification per statement: the changed uuids, or "*" when too many changed to list
+        CREATE OR REPLACE FUNCTION notify_balance_changed() RETURNS trigger AS $$
+        DECLARE
+            changed TEXT;
+        BEGIN
+            SELECT CASE WHEN COUNT(*) > 100 THEN '*' ELSE string_agg(uuid::text, ',') END INTO changed
+            FROM changed_cards;
+            IF changed IS NOT NULL THEN
+                PERFORM pg_notify('balance_changed', changed);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        DROP TRIGGER IF EXISTS credit_card_balance_changed ON credit_card;
+        CREATE TRIGGER credit_card_balance_changed AFTER UPDATE ON credit_card
+            REFERENCING NEW TABLE AS changed_cards
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_balance_changed();
+    """),
+    (10, "slotted dashboard counters and rollups", """
+        -- Dropping id drops the single-row primary key and check with it; the existing totals become slot 0
+        ALTER TABLE dashboard_counters ADD COLUMN slot SMALLINT NOT NULL DEFAULT 0;
+        ALTER TABLE dashboard_counters DROP COLUMN id;
+        ALTER TABLE dashboard_counters ADD PRIMARY KEY (slot);
+        ALTER TABLE transaction_rollups ADD COLUMN slot SMALLINT NOT NULL DEFAULT 0;
+        ALTER TABLE transaction_rollups DROP CONSTRAINT transaction_rollups_pkey;
+        ALTER TABLE transaction_rollups ADD PRIMARY KEY (hour, name, slot);
+    """),
+]
+
+
+def apply_migrations(conn):
+    """ Apply every migration that has not been recorded in schema_migrations yet. """
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+            )
+        """)
+        cur.execute("SELECT version FROM schema_migrations")
+        applied = {row[0] for row in cur.fetchall()}
+
+        for version, name, sql in MIGRATIONS:
+            if version in applied:
+                continue
+            print(f"Applying migration {version}: {name}")
+            if callable(sql):
+                sql(cur)
+            else:
+                cur.execute(sql)
+            cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+    conn.commit()
+
+
+def pending_migrations(cur):
+    """ Return (version, name) for every migration not recorded in schema_migrations yet, without applying any. """
+    cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+    applied = set()
+    if cur.fetchone()[0]:
+        cur.execute("SELECT version FROM schema_migrations")
+        applied = {row[0] for row in cur.fetchall()}
+    return [(version, name) for version, name, _ in MIGRATIONS if version not in applied]
+
+
+def recount_dashboard_counters(cur):
+    """
+    Recompute the dashboard totals from the source tables (full scans; for setup and repair only).
+
+    Archived partitions are no longer in transaction_logs, so after archiving the recount drops them.
+    """
+    # Hold off bump_counters() while the slots are folded into slot 0
+    cur.execute("LOCK TABLE dashboard_counters IN EXCLUSIVE MODE")
+    cur.execute("DELETE FROM dashboard_counters WHERE slot <> 0")
+    cur.execute("""
+        INSERT INTO dashboard_counters (slot, total_users, total_transactions, total_scraps, updated_at)
+        SELECT 0,
+               (SELECT COUNT(*) FROM credit_card),
+               (SELECT COUNT(*) FROM transaction_logs),
+               (SELECT COALESCE(SUM(scraps), 0) FROM credit_card),
+               NOW()
+        ON CONFLICT (slot) DO UPDATE SET
+            total_users = EXCLUDED.total_users,
+            total_transactions = EXCLUDED.total_transactions,
+            total_scraps = EXCLUDED.total_scraps,
+            updated_at = EXCLUDED.updated_at
+    """)
+
+
+def rebuild_rollups(cur):
+    """ Recompute transaction_rollups from transaction_logs, e.g. after backfilling amounts. """
+    cur.execute("LOCK TABLE transaction_rollups IN EXCLUSIVE MODE")
+    cur.execute("DELETE FROM transaction_rollups")
+    cur.execute("""
+        INSERT INTO transaction_rollups (hour, name, count, amount)
+        SELECT date_trunc('hour', timestamp), name, COUNT(*), COALESCE(SUM(amount), 0)
+        FROM transaction_logs
+        GROUP BY 1, 2
+    """)
+
+
+def get_checkpoint(cur, name):
+    """ Return the stored position for a maintenance job, or 0 if it has never run. """
+    cur.execute("SELECT position FROM maintenance_checkpoints WHERE name = %s", (name,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def set_checkpoint(cur, name, position):
+    cur.execute("""
+        INSERT INTO maintenance_checkpoints (name, position, updated_at) VALUES (%s, %s, NOW())
+        ON CONFLICT (name) DO UPDATE SET position = EXCLUDED.position, updated_at = EXCLUDED.updated_at
+    """, (name, position))
+
+
+def advance_ledger(cur, max_rows=RECONCILE_BATCH_ROWS, settle_seconds=RECONCILE_SETTLE_SECONDS):
+    """
+    Add up to `max_rows` transaction log rows past the "reconcile_ledger" checkpoint into ledger_totals.
+
+    Rows are read in id order and the pass stops at the first one logged within the last `settle_seconds`.
+    Rows without an amount fall back to the "(+N scraps)" suffix of their reason. Returns
+    (rows read, checkpoint position, rows with no amount, caught up). Run it in its own transaction.
+    """
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (RECONCILE_LOCK_KEY,))
+    position = get_checkpoint(cur, "reconcile_ledger")
+    cur.execute(r"""
+        WITH candidates AS (
+            SELECT id, uuid, timestamp,
+                   COALESCE(amount, substring(reason FROM '\(([-+]\d+) scraps\)\s*$')::INTEGER) AS amount
+            FROM transaction_logs
+            WHERE id > %(position)s
+            ORDER BY id
+            LIMIT %(limit)s
+        ), batch AS (
+            SELECT * FROM candidates
+            WHERE id < (SELECT COALESCE(MIN(id), %(max_id)s) FROM candidates
+                        WHERE timestamp >= LOCALTIMESTAMP - %(settle)s * interval '1 second')
+        ), totals AS (
+            INSERT INTO ledger_totals (uuid, logged, rows)
+            SELECT uuid, COALESCE(SUM(amount), 0), COUNT(*) FROM batch GROUP BY uuid
+            ON CONFLICT (uuid) DO UPDATE SET
+                logged = ledger_totals.logged + EXCLUDED.logged,
+                rows = ledger_totals.rows + EXCLUDED.rows
+        )
+        SELECT COUNT(*), MAX(id), COUNT(*) FILTER (WHERE amount IS NULL) FROM batch
+    """, {"position": position, "limit": max_rows, "max_id": 2 ** 63 - 1, "settle": settle_seconds})
+    processed, last_id, unparsed = cur.fetchone()
+    if processed:
+        position = last_id
+        set_checkpoint(cur, "reconcile_ledger", position)
+    # Fewer rows than allowed means the pass ran out of rows or reached the settle window
+    return processed, position, unparsed, processed < max_rows
+
+
+def ledger_drift(cur, position, limit=100):
+    """
+    Return (mismatched users, rows) comparing each card's scraps to its opening balance plus logged deltas.
+
+    The totals in ledger_totals cover the log up to `position`; the few rows after it are added on the fly,
+    in the same statement as the balances are read, so in-flight taps never show up as drift. Rows are
+    (uuid, name, scraps, expected scraps, drift), largest drift first, at most `limit` of them.
+    """
+    cur.execute(r"""
+        WITH pending AS (
+            SELECT uuid,
+                   SUM(COALESCE(amount, substring(reason FROM '\(([-+]\d+) scraps\)\s*$')::INTEGER)) AS logged
+            FROM transaction_logs
+            WHERE id > %(position)s
+            GROUP BY uuid
+        ), ledger AS (
+            SELECT c.uuid, c.name, c.scraps,
+                   c.opening_scraps + COALESCE(t.logged, 0) + COALESCE(p.logged, 0) AS expected
+            FROM credit_card c
+            LEFT JOIN ledger_totals t ON t.uuid = c.uuid
+            LEFT JOIN pending p ON p.uuid = c.uuid
+        )
+        SELECT uuid, name, scraps, expected, scraps - expected AS drift, COUNT(*) OVER ()
+        FROM ledger
+        WHERE scraps <> expected
+        ORDER BY abs(scraps - expected) DESC, uuid
+        LIMIT %(limit)s
+    """, {"position": position, "limit": limit})
+    rows = cur.fetchall()
+    return (rows[0][5] if rows else 0), [row[:5] for row in rows]
+
+
+def opening_adjustments(cur, limit=100):
+    """
+    Return (adjusted cards, rows) for the cards whose opening balance migration 8 inferred from the log.
+
+    Those cards reconcile by construction, so this is where drift from before reconciliation existed shows:
+    a negative adjustment can only be drift, a positive one is the card's starting scraps plus any drift.
+    Rows are (uuid, name, scraps, adjustment), negative adjustments first, at most `limit` of them.
+    """
+    cur.execute("""
+        SELECT uuid, name, scraps, opening_adjustment, COUNT(*) OVER ()
+        FROM credit_card
+        WHERE opening_adjustment <> 0
+        ORDER BY opening_adjustment < 0 DESC, abs(opening_adjustment) DESC, uuid
+        LIMIT %s
+    """, (limit,))
+    rows = cur.fetchall()
+    return (rows[0][4] if rows else 0), [row[:4] for row in rows]
+
+
+def backfill_amounts(conn, chunk_size=5000):
+    """
+    Fill amount and kind on historical transaction_logs rows from the "(+N scraps)" suffix of reason.
+
+    Rows are processed in id order, one committed chunk at a time, and the last processed id is stored
+    in maintenance_checkpoints so an interrupted run picks up where it stopped.
+    """
+    total = 0
+    with conn.cursor() as cur:
+        last_id = get_checkpoint(cur, "backfill_amounts")
+
+        while True:
+            cur.execute(r"""
+                WITH chunk AS (
+                    SELECT id, timestamp FROM transaction_logs WHERE id > %s ORDER BY id LIMIT %s
+                )
+                UPDATE transaction_logs tl
+                SET amount = COALESCE(tl.amount, substring(tl.reason FROM '\(([-+]\d+) scraps\)\s*$')::INTEGER),
+                    kind = COALESCE(tl.kind, (CASE tl.name
+                        WHEN 'Purchase' THEN 'purchase'
+                        WHEN 'Reimbursement' THEN 'reimbursement'
+                        WHEN 'Batch Add' THEN 'batch_add'
+                        WHEN 'Batch Remove' THEN 'batch_remove'
+                    END)::transaction_kind)
+                FROM chunk
+                -- Matching on timestamp too lets each row be found in its own partition only
+                WHERE tl.id = chunk.id AND tl.timestamp IS NOT DISTINCT FROM chunk.timestamp
+                RETURNING tl.id
+            """, (last_id, chunk_size))
+            ids = [row[0] for row in cur.fetchall()]
+            if not ids:
+                break
+
+            last_id = max(ids)
+            total += len(ids)
+            set_checkpoint(cur, "backfill_amounts", last_id)
+            conn.commit()
+            print(f"Backfilled {total} rows (up to id {last_id})")
+
+    conn.commit()
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrapyard database maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("migrate", help="apply pending schema migrations")
+    backfill_parser = subparsers.add_parser("backfill-amounts", help="fill amount/kind on historical logs")
+    backfill_parser.add_argument("--chunk-size", type=int, default=5000)
+    subparsers.add_parser("recount-counters", help="recompute the dashboard counters from the tables")
+    subparsers.add_parser("rebuild-rollups", help="recompute the hourly analytics rollups from the logs")
+    partitions_parser = subparsers.add_parser("maintain-partitions",
+                                              help="create upcoming log partitions and archive expired ones")
+    partitions_parser.add_argument("--months-ahead", type=int, default=LOG_PARTITIONS_AHEAD)
+    partitions_parser.add_argument("--retention-months", type=int, default=LOG_RETENTION_MONTHS,
+                                   help="full months to keep before the current one; 0 archives nothing")
+    partitions_parser.add_argument("--archive-dir", default=LOG_ARCHIVE_DIR)
+    reconcile_parser = subparsers.add_parser("reconcile", help="check card balances against the logged deltas")
+    reconcile_parser.add_argument("--batch-rows", type=int, default=RECONCILE_BATCH_ROWS)
+    reconcile_parser.add_argument("--limit", type=int, default=100, help="mismatched cards to list")
+    args = parser.parse_args()
+
+    connection = psycopg2.connect(os.getenv("DATABASE_URL"), sslmode="require")
+    try:
+        apply_migrations(connection)
+        if args.command == "backfill-amounts":
+            backfilled = backfill_amounts(connection, chunk_size=args.chunk_size)
+            print(f"Backfill complete: {backfilled} rows processed")
+            if backfilled:
+                # Rollups seeded before the backfill carry no amounts for historical rows
+                with connection.cursor() as cursor:
+                    rebuild_rollups(cursor)
+                connection.commit()
+                print("Analytics rollups rebuilt")
+        elif args.command == "recount-counters":
+            with connection.cursor() as cursor:
+                recount_dashboard_counters(cursor)
+            connection.commit()
+            print("Dashboard counters recounted")
+        elif args.command == "rebuild-rollups":
+            with connection.cursor() as cursor:
+                rebuild_rollups(cursor)
+            connection.commit()
+            print("Analytics rollups rebuilt")
+        elif args.command == "maintain-partitions":
+            with connection.cursor() as cursor:
+                created = ensure_partitions(cursor, months_ahead=args.months_ahead)
+            connection.commit()
+            print(f"Created {len(created)} partitions: {', '.join(map(partition_name, created)) or 'none needed'}")
+            if args.retention_months:
+                archived = archive_partitions(connection, args.retention_months, args.archive_dir)
+                print(f"Archived {len(archived)} partitions to {args.archive_dir}")
+        elif args.command == "reconcile":
+            with connection.cursor() as cursor:
+                while True:
+                    read, checkpoint, missing, caught_up = advance_ledger(cursor, max_rows=args.batch_rows)
+                    connection.commit()
+                    print(f"Reconciled {read} rows (up to id {checkpoint}, {missing} without an amount)")
+                    if caught_up:
+                        break
+                mismatched, drift_rows = ledger_drift(cursor, checkpoint, limit=args.limit)
+            connection.commit()
+            for card_uuid, card_name, scraps, expected, drift in drift_rows:
+                print(f"{card_uuid}  {card_name}: {scraps} scraps, {expected} expected ({drift:+d})")
+            print(f"{mismatched} cards do not match their ledger")
+            with connection.cursor() as cursor:
+                adjusted, adjustment_rows = opening_adjustments(cursor, limit=args.limit)
+            connection.commit()
+            for card_uuid, card_name, scraps, adjustment in adjustment_rows:
+                print(f"{card_uuid}  {card_name}: opened at {adjustment:+d} scraps not in the log ({scraps} now)")
+            print(f"{adjusted} cards had an opening balance inferred when reconciliation started")
+            if mismatched:
+                sys.exit(2)
+    except Exception as err:
+        print(f"Maintenance command failed: {str(err)}")
+        sys.exit(1)
+    finally:
+        connection.close()
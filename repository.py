@@ -0,0 +1,608 @@
+"""
+Data access for the routes in app.py.
+
+Routes never build SQL themselves: they open a transaction on a repository and call methods on the store
+it yields. PostgresRepository is the production backend; SQLiteRepository (sqlite_repository.py) offers
+the same methods for local profiling and load tests. Every store method takes and returns plain Python
+values, with timestamps as naive local datetimes.
+"""
+import json
+import threading
+import time
+import uuid as uid
+import weakref
+from contextlib import contextmanager
+
+import psycopg2.extensions
+from psycopg2.extras import execute_values
+
+from db import NotificationListener
+from fraud import detect_fraud
+from metrics import track_connection_wait, track_query
+from migrations import (COUNTER_SLOTS, MIGRATION_LOCK_KEY, RECONCILE_BATCH_ROWS, advance_ledger,
+                        apply_migrations, ensure_partitions, ledger_drift, opening_adjustments, pending_migrations,
+                        rebuild_rollups, recount_dashboard_counters)
+from search import DEFAULT_SEARCH_MODE, name_filter, rank_order
+
+# Typed kind stored alongside the display name of each transaction log row
+TRANSACTION_KINDS = {
+    "Purchase": "purchase",
+    "Reimbursement": "reimbursement",
+    "Batch Add": "batch_add",
+    "Batch Remove": "batch_remove",
+}
+
+# Hot tap-path statements, prepared once per connection and then run by name
+PREPARED_STATEMENTS = {
+    # Balance and recent history in one round trip
+    "balance_page": """
+        SELECT c.name, c.scraps, t.name, t.reason, t.timestamp, t.id
+        FROM credit_card c
+        LEFT JOIN LATERAL (
+            SELECT name, reason, timestamp, id
+            FROM transaction_logs
+            WHERE uuid = c.uuid
+            ORDER BY timestamp DESC, id DESC
+            LIMIT $1
+        ) t ON TRUE
+        WHERE c.uuid = $2
+        ORDER BY t.timestamp DESC, t.id DESC
+    """,
+    "recent_transactions": """
+        SELECT name, reason, timestamp
+        FROM transaction_logs
+        WHERE uuid = $1
+        ORDER BY timestamp DESC
+        LIMIT $2
+    """,
+    "debit": "UPDATE credit_card SET scraps = scraps - $1 WHERE uuid = $2 AND scraps >= $1 RETURNING scraps, name",
+    "credit": "UPDATE credit_card SET scraps = scraps + $1 WHERE uuid = $2 RETURNING scraps, name",
+    "log_transaction": "INSERT INTO transaction_logs (uuid, name, reason, amount, kind) "
+                       "VALUES ($1, $2, $3, $4, $5) RETURNING id, timestamp",
+}
+
+
+def where_sql(conditions):
+    """ Join WHERE conditions with AND; returns an empty string when there are none. """
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    """ Cursor that reports every statement, and every fetch from a server-side cursor, to the request metrics. """
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            track_query(time.perf_counter() - started)
+
+    def fetchmany(self, size=None):
+        if self.name is None:
+            return super().fetchmany(size)
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(size)
+        finally:
+            track_query(time.perf_counter() - started)
+
+
+class PreparedStatements:
+    """
+    Server-side prepared statements, registered lazily on each pooled connection.
+
+    A prepared statement lives as long as the session that created it, so the first store on a connection
+    to run a statement PREPAREs it and every later one only EXECUTEs it by name, skipping parsing and
+    planning. Connections are tracked weakly: when the pool closes one, its registrations go with it.
+    """
+
+    def __init__(self, statements):
+        self.statements = statements
+        self._lock = threading.Lock()
+        # connection -> names of the statements prepared on it
+        self._prepared = weakref.WeakKeyDictionary()
+        self._stats = {name: {"prepares": 0, "executions": 0} for name in statements}
+
+    def execute(self, cur, name, params):
+        """ Run statement `name` with `params` on `cur`, preparing it first if its connection has not yet. """
+        with self._lock:
+            prepared = self._prepared.setdefault(cur.connection, set())
+        if name not in prepared:
+            # PREPARE is not transactional: the statement survives even if this transaction rolls back
+            cur.execute(f"PREPARE {name} AS {self.statements[name]}")
+            prepared.add(name)
+            with self._lock:
+                self._stats[name]["prepares"] += 1
+        cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        with self._lock:
+            self._stats[name]["executions"] += 1
+
+    def stats(self):
+        """ Return prepare/execution totals plus per-statement counts and reuse rates. """
+        with self._lock:
+            per_statement = {name: {**counts, "reuse_rate": round(1 - counts["prepares"] / counts["executions"], 4)
+                                    if counts["executions"] else 0.0}
+                             for name, counts in self._stats.items()}
+            prepared_connections = len(self._prepared)
+        prepares = sum(counts["prepares"] for counts in per_statement.values())
+        executions = sum(counts["executions"] for counts in per_statement.values())
+        return {
+            "prepared_connections": prepared_connections,
+            "statements_prepared": prepares,
+            "prepared_executions": executions,
+            "prepared_reuse_rate": round(1 - prepares / executions, 4) if executions else 0.0,
+            "prepared_statements": per_statement,
+        }
+
+
+class PostgresRepository:
+    """ Repository backed by the pooled PostgreSQL connections from db.ConnectionPool. """
+
+    backend = "postgres"
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.statements = PreparedStatements(PREPARED_STATEMENTS)
+
+    @contextmanager
+    def transaction(self):
+        """ Yield a PostgresStore for one transaction: committed on success, rolled back on error. """
+        started = time.perf_counter()
+        with self.pool.connection() as conn:
+            track_connection_wait(time.perf_counter() - started)
+            with conn.cursor(cursor_factory=TimedCursor) as cur:
+                yield PostgresStore(conn, cur, self.statements)
+
+    def setup(self):
+        """
+        Check connectivity and that the schema is up to date, and make sure the upcoming transaction_logs
+        partitions exist.
+
+        Migrations, archival and reconciliation can run for a long time on a large table, far longer than a
+        worker may take to start, so they are left to `python migrations.py migrate` / `maintain-partitions`;
+        a worker refuses to start while migrations are pending.
+        """
+        self.pool.wait_until_available()
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                pending = pending_migrations(cur)
+                if pending:
+                    raise RuntimeError(f"{len(pending)} schema migrations pending (from {pending[0][0]}: "
+                                       f"{pending[0][1]}); run `python migrations.py migrate` first")
+                # Skip partition upkeep while a maintenance command holds the lock rather than wait for it
+                cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+                if cur.fetchone()[0]:
+                    ensure_partitions(cur)
+            conn.commit()
+
+    def migrate(self):
+        """ Apply pending schema migrations, like `python migrations.py migrate`; for tools, not workers. """
+        with self.pool.connection() as conn:
+            apply_migrations(conn)
+
+    def watch_balances(self, callback):
+        """
+        Call `callback` with the comma-separated uuids of cards whose balance any process changed, "*" when a
+        statement changed too many to list, or None after missed notifications. Returns the listener.
+        """
+        return NotificationListener(self.pool.dsn, "balance_changed", callback,
+                                    connect_timeout=self.pool.connect_timeout)
+
+    def stats(self):
+        return {"backend": self.backend, **self.pool.stats(), **self.statements.stats()}
+
+    def health(self):
+        """ Return {"ready": ...} from the pool's circuit breaker, without opening a connection. """
+        return {"backend": self.backend, **self.pool.breaker.health()}
+
+    def close(self):
+        self.pool.closeall()
+
+
+class PostgresStore:
+    """ Queries and writes bound to one connection and transaction. """
+
+    def __init__(self, conn, cur, statements):
+        self.conn = conn
+        self.cur = cur
+        self.statements = statements
+
+    def commit(self):
+        """ Commit the work done so far; later calls run in a new transaction. """
+        self.conn.commit()
+
+    # --- Reads ---
+    def balance_page(self, uuid, history_size):
+        """
+        Return (name, scraps, history) for a card, or None if it does not exist.
+
+        `history` holds up to `history_size` (type, reason, timestamp, log id) tuples, newest first.
+        """
+        self.statements.execute(self.cur, "balance_page", (history_size, uuid))
+        rows = self.cur.fetchall()
+        if not rows:
+            return None
+        return rows[0][0], rows[0][1], [row[2:] for row in rows if row[5] is not None]
+
+    def recent_transactions(self, uuid, limit=10):
+        """ Return the latest (type, reason, timestamp) rows logged for a card. """
+        self.statements.execute(self.cur, "recent_transactions", (uuid, limit))
+        return self.cur.fetchall()
+
+    def _approximate_count(self, query, params):
+        """ Return the planner's row estimate for a query; a cheap stand-in for an exact COUNT(*). """
+        self.cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+        plan = self.cur.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    def count_logs(self, search="", mode=DEFAULT_SEARCH_MODE):
+        """ Estimate how many transaction logs match a name search. """
+        condition, params = name_filter(search, mode)
+        return self._approximate_count(
+            f"SELECT 1 FROM transaction_logs {where_sql([condition] if condition else [])}", params)
+
+    def list_logs(self, search="", mode=DEFAULT_SEARCH_MODE, after=None, limit=50):
+        """
+        Return up to `limit` (uuid, type, reason, timestamp, id) log rows, newest first.
+
+        `after` is the (timestamp, id) of the last row of the previous page.
+        """
+        condition, params = name_filter(search, mode)
+        conditions = [condition] if condition else []
+        if after:
+            # Keyset pagination: continue strictly after the last (timestamp, id) of the previous page. The
+            # plain timestamp bound is implied by the row comparison, but only it lets the planner skip
+            # the newer partitions
+            conditions.append("(timestamp, id) < (%s, %s) AND timestamp <= %s")
+            params += list(after) + [after[0]]
+        self.cur.execute(
+            f"SELECT uuid, name, reason, timestamp, id FROM transaction_logs {where_sql(conditions)} "
+            "ORDER BY timestamp DESC, id DESC LIMIT %s",
+            params + [limit])
+        return self.cur.fetchall()
+
+    def count_users(self, search="", mode=DEFAULT_SEARCH_MODE):
+        """ Estimate how many users match a name search. """
+        condition, params = name_filter(search, mode)
+        return self._approximate_count(
+            f"SELECT 1 FROM credit_card {where_sql([condition] if condition else [])}", params)
+
+    def list_users(self, search="", mode=DEFAULT_SEARCH_MODE, after=None, limit=50):
+        """
+        Return up to `limit` (uuid, name, scraps) rows in name order.
+
+        `after` is the (name, uuid) of the last row of the previous page.
+        """
+        condition, params = name_filter(search, mode)
+        conditions = [condition] if condition else []
+        if after:
+            # Keyset pagination: continue strictly after the last (name, uuid) of the previous page
+            conditions.append("(name, uuid) > (%s, %s)")
+            params += list(after)
+        self.cur.execute(f"SELECT uuid, name, scraps FROM credit_card {where_sql(conditions)} "
+                         "ORDER BY name ASC, uuid ASC LIMIT %s", params + [limit])
+        return self.cur.fetchall()
+
+    def rank_users(self, search, mode=DEFAULT_SEARCH_MODE, limit=50):
+        """ Return up to `limit` (uuid, name, scraps) rows matching `search`, closest matches first. """
+        condition, params = name_filter(search, mode)
+        order_sql, order_params = rank_order(search)
+        self.cur.execute(f"SELECT uuid, name, scraps FROM credit_card {where_sql([condition])} "
+                         f"ORDER BY {order_sql}, name ASC LIMIT %s", params + order_params + [limit])
+        return self.cur.fetchall()
+
+    def dashboard_counters(self):
+        """ Return (total users, total transactions, total scraps) as maintained by bump_counters(). """
+        self.cur.execute("""
+            SELECT COALESCE(SUM(total_users), 0)::BIGINT, COALESCE(SUM(total_transactions), 0)::BIGINT,
+                   COALESCE(SUM(total_scraps), 0)::BIGINT
+            FROM dashboard_counters
+        """)
+        return self.cur.fetchone()
+
+    def analytics(self, resolution, start, end, transaction_type=None):
+        """
+        Return (bucket, type, count, amount) rows from the hourly rollup, one bucket per `resolution` step.
+
+        Every bucket between `start` and `end` appears at least once, with a None type when it is empty.
+        """
+        type_filter = ""
+        params = {"resolution": resolution, "step": f"1 {resolution}", "start": start, "end": end}
+        if transaction_type:
+            type_filter = "AND name = %(type)s"
+            params["type"] = transaction_type
+
+        # Read the hourly rollup and let the database emit one row per bucket, including empty ones
+        self.cur.execute(f"""
+            WITH buckets AS (
+                SELECT generate_series(
+                    date_trunc(%(resolution)s, %(start)s::timestamp),
+                    date_trunc(%(resolution)s, %(end)s::timestamp),
+                    %(step)s::interval
+                ) AS bucket
+            ), totals AS (
+                SELECT date_trunc(%(resolution)s, hour) AS bucket, name,
+                       SUM(count) AS count, SUM(amount) AS amount
+                FROM transaction_rollups
+                WHERE hour >= date_trunc('hour', %(start)s::timestamp) AND hour <= %(end)s {type_filter}
+                GROUP BY 1, 2
+            )
+            SELECT b.bucket, t.name, COALESCE(t.count, 0), COALESCE(t.amount, 0)
+            FROM buckets b
+            LEFT JOIN totals t ON t.bucket = b.bucket
+            ORDER BY b.bucket
+        """, params)
+        return self.cur.fetchall()
+
+    def detect_fraud(self, start_time):
+        """ Run every fraud detector over the logs since `start_time`, see fraud.detect_fraud(). """
+        return detect_fraud(self.cur, start_time)
+
+    def fraud_events(self, since):
+        """
+        Return (log id, uuid, user name, type, reason, amount, timestamp) rows for the fraud engine.
+
+        Rows are logged at or after `since`, in timestamp order. The `since` bound keeps the scan to the
+        partitions inside the window.
+        """
+        self.cur.execute("""
+            SELECT tl.id, tl.uuid, c.name, tl.name, tl.reason, tl.amount, tl.timestamp
+            FROM transaction_logs tl
+            LEFT JOIN credit_card c ON c.uuid = tl.uuid
+            WHERE tl.timestamp >= %s
+            ORDER BY tl.timestamp, tl.id
+        """, (since,))
+        return self.cur.fetchall()
+
+    def reconcile_ledger(self, max_rows=RECONCILE_BATCH_ROWS, limit=100):
+        """
+        Run one bounded reconciliation pass, see migrations.advance_ledger() and migrations.ledger_drift().
+
+        Returns {"processed", "position", "unparsed", "caught_up", "mismatched", "drift", "adjusted",
+        "adjustments"}. Until the pass has caught up with the log the comparison would be meaningless, so
+        "mismatched" and "drift" are None. "adjusted" and "adjustments" list the opening balances inferred
+        for cards that predate reconciliation, see migrations.opening_adjustments().
+        """
+        processed, position, unparsed, caught_up = advance_ledger(self.cur, max_rows=max_rows)
+        self.commit()
+        mismatched, drift = ledger_drift(self.cur, position, limit=limit) if caught_up else (None, None)
+        adjusted, adjustments = opening_adjustments(self.cur, limit=limit)
+        return {"processed": processed, "position": position, "unparsed": unparsed, "caught_up": caught_up,
+                "mismatched": mismatched, "drift": drift, "adjusted": adjusted, "adjustments": adjustments}
+
+    def _stream(self, query, params, chunk_rows):
+        """ Yield lists of up to `chunk_rows` rows from a named (server-side) cursor. """
+        with self.conn.cursor(name=f"export_{uid.uuid4().hex}", cursor_factory=TimedCursor) as cur:
+            cur.itersize = chunk_rows
+            cur.execute(query, params)
+            while True:
+                rows = cur.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                yield rows
+
+    def export_users(self, chunk_rows):
+        """ Yield every (uuid, name, scraps) row in name order, `chunk_rows` at a time. """
+        return self._stream("SELECT uuid, name, scraps FROM credit_card ORDER BY name ASC", (), chunk_rows)
+
+    def export_transactions(self, chunk_rows, start=None, end=None):
+        """ Yield (uuid, type, reason, timestamp) log rows in [start, end), newest first, `chunk_rows` at a time. """
+        conditions = []
+        params = []
+        if start:
+            conditions.append("timestamp >= %s")
+            params.append(start)
+        if end:
+            conditions.append("timestamp < %s")
+            params.append(end)
+        return self._stream(f"SELECT uuid, name, reason, timestamp FROM transaction_logs {where_sql(conditions)} "
+                            "ORDER BY timestamp DESC", params, chunk_rows)
+
+    # --- Writes ---
+    def add_user(self, name, scraps):
+        """ Insert a card and return its (uuid, scraps); the starting scraps are its opening ledger balance. """
+        self.cur.execute("INSERT INTO credit_card (name, scraps, opening_scraps) VALUES (%s, %s, %s) "
+                         "RETURNING uuid, scraps", (name, scraps, scraps))
+        return self.cur.fetchone()
+
+    def debit(self, uuid, amount):
+        """ Take `amount` scraps from a card that has enough; returns (new scraps, name) or None. """
+        self.statements.execute(self.cur, "debit", (amount, uuid))
+        return self.cur.fetchone()
+
+    def credit(self, uuid, amount):
+        """ Give `amount` scraps to a card; returns (new scraps, name) or None if it does not exist. """
+        self.statements.execute(self.cur, "credit", (amount, uuid))
+        return self.cur.fetchone()
+
+    def log_transaction(self, uuid, user_name, transaction_type, reason, amount):
+        """
+        Insert a transaction log row; `amount` is the signed change applied to the user's scraps.
+
+        Returns the (log id, uuid, user name, type, reason, amount, timestamp) entry of the new row.
+        """
+        self.statements.execute(self.cur, "log_transaction",
+                                (uuid, transaction_type, reason, amount, TRANSACTION_KINDS[transaction_type]))
+        log_id, timestamp = self.cur.fetchone()
+        return log_id, uuid, user_name, transaction_type, reason, amount, timestamp
+
+    def bump_counters(self, users=0, transactions=0, scraps=0, transaction_type=None):
+        """
+        Adjust the dashboard totals inside the current transaction, so they commit or roll back with it.
+
+        With `transaction_type`, the current hour's transaction_rollups row for that type is bumped by the
+        same statement. Both go to this connection's slot (see COUNTER_SLOTS), so the row locks held until
+        COMMIT only queue transactions that happen to share a slot.
+        """
+        rollup_sql = ""
+        params = {"slots": COUNTER_SLOTS, "users": users, "transactions": transactions, "scraps": scraps,
+                  "type": transaction_type}
+        if transaction_type:
+            rollup_sql = """
+                , rollup AS (
+                    INSERT INTO transaction_rollups (hour, name, slot, count, amount)
+                    SELECT date_trunc('hour', NOW()), %(type)s, slot, %(transactions)s, %(scraps)s FROM target
+                    ON CONFLICT (hour, name, slot) DO UPDATE SET
+                        count = transaction_rollups.count + EXCLUDED.count,
+                        amount = transaction_rollups.amount + EXCLUDED.amount
+                )
+            """
+
+        self.cur.execute(f"""
+            WITH target AS (SELECT (pg_backend_pid() %% %(slots)s)::SMALLINT AS slot) {rollup_sql}
+            INSERT INTO dashboard_counters (slot, total_users, total_transactions, total_scraps, updated_at)
+            SELECT slot, %(users)s, %(transactions)s, %(scraps)s, NOW() FROM target
+            ON CONFLICT (slot) DO UPDATE SET
+                total_users = dashboard_counters.total_users + EXCLUDED.total_users,
+                total_transactions = dashboard_counters.total_transactions + EXCLUDED.total_transactions,
+                total_scraps = dashboard_counters.total_scraps + EXCLUDED.total_scraps,
+                updated_at = EXCLUDED.updated_at
+        """, params)
+
+    def apply_batch(self, transaction_type, amount, reason, search="", mode=DEFAULT_SEARCH_MODE,
+                    after_uuid=None, limit=None):
+        """
+        Add the signed `amount` to every matching user and log it, in a single set-based statement.
+
+        Removals only touch users with enough scraps. With `limit`, only the next `limit` matching users
+        after `after_uuid` (in uuid order) are touched. Returns the log entries in uuid order.
+        """
+        condition, params = name_filter(search, mode)
+        conditions = [condition] if condition else []
+        if amount < 0:
+            conditions.append("scraps >= %s")
+            params.append(-amount)
+        if after_uuid is not None:
+            conditions.append("uuid > %s")
+            params.append(after_uuid)
+
+        limit_clause = ""
+        if limit:
+            limit_clause = "ORDER BY uuid LIMIT %s"
+            params.append(limit)
+
+        self.cur.execute(f"""
+            WITH targets AS (
+                SELECT uuid FROM credit_card {where_sql(conditions)} {limit_clause} FOR UPDATE
+            ), updated AS (
+                UPDATE credit_card c SET scraps = c.scraps + %s
+                FROM targets t
+                WHERE c.uuid = t.uuid
+                RETURNING c.uuid, c.name
+            ), logged AS (
+                INSERT INTO transaction_logs (uuid, name, reason, amount, kind)
+                SELECT uuid, %s, %s, %s, %s FROM updated
+                RETURNING id, uuid, timestamp
+            )
+            SELECT l.id, l.uuid, u.name, l.timestamp
+            FROM logged l
+            JOIN updated u ON u.uuid = l.uuid
+            ORDER BY l.uuid
+        """, params + [amount, transaction_type, reason, amount, TRANSACTION_KINDS[transaction_type]])
+        entries = [(log_id, uuid, user_name, transaction_type, reason, amount, timestamp)
+                   for log_id, uuid, user_name, timestamp in self.cur.fetchall()]
+        if entries:
+            self.bump_counters(transactions=len(entries), scraps=len(entries) * amount,
+                               transaction_type=transaction_type)
+        return entries
+
+    def apply_taps(self, taps):
+        """
+        Apply (uuid, type, signed amount, reason) taps in order, with a fixed number of set-based statements.
+
+        The affected cards are locked, each tap is checked against the running balance (so a purchase only
+        succeeds if the card still has enough scraps after the taps before it), and then all balance changes
+        and log rows are written through unnest(). Returns one (status, entry, new scraps) per tap, where
+        status is "applied", "insufficient_scraps" or "not_found".
+        """
+        # Lock in uuid order so concurrent bulk requests cannot deadlock each other
+        self.cur.execute("SELECT uuid, name, scraps FROM credit_card WHERE uuid = ANY(%s::uuid[]) "
+                         "ORDER BY uuid FOR UPDATE", (sorted({tap[0] for tap in taps}),))
+        balances = {str(uuid): [name, scraps] for uuid, name, scraps in self.cur.fetchall()}
+
+        results = []
+        applied = []
+        deltas = {}
+        for uuid, transaction_type, amount, reason in taps:
+            card = balances.get(uuid)
+            if card is None:
+                results.append(["not_found", None, None])
+            elif card[1] + amount < 0:
+                results.append(["insufficient_scraps", None, None])
+            else:
+                card[1] += amount
+                deltas[uuid] = deltas.get(uuid, 0) + amount
+                results.append(["applied", None, card[1]])
+                applied.append((len(results) - 1, uuid, card[0], transaction_type, reason, amount))
+        if not applied:
+            return results
+
+        self.cur.execute("""
+            UPDATE credit_card c SET scraps = c.scraps + v.delta
+            FROM unnest(%s::uuid[], %s::integer[]) AS v(uuid, delta)
+            WHERE c.uuid = v.uuid
+        """, (list(deltas), list(deltas.values())))
+        # RETURNING cannot report which input row each log row came from, and the sequence need not follow
+        # array order, so ids are drawn up front next to each row's ordinal and matched back through them (the
+        # volatile CTE is materialized, so each row keeps the one id it drew)
+        self.cur.execute("""
+            WITH rows_in AS (
+                SELECT v.*, nextval(pg_get_serial_sequence('transaction_logs', 'id')) AS id
+                FROM unnest(%s::uuid[], %s::text[], %s::text[], %s::integer[], %s::transaction_kind[])
+                    WITH ORDINALITY AS v(uuid, name, reason, amount, kind, ordinal)
+            ), inserted AS (
+                INSERT INTO transaction_logs (id, uuid, name, reason, amount, kind)
+                SELECT id, uuid, name, reason, amount, kind FROM rows_in
+                RETURNING id, timestamp
+            )
+            SELECT rows_in.ordinal, inserted.id, inserted.timestamp
+            FROM inserted
+            JOIN rows_in ON rows_in.id = inserted.id
+            ORDER BY rows_in.ordinal
+        """, ([tap[1] for tap in applied], [tap[3] for tap in applied], [tap[4] for tap in applied],
+              [tap[5] for tap in applied], [TRANSACTION_KINDS[tap[3]] for tap in applied]))
+        for ordinal, log_id, timestamp in self.cur.fetchall():
+            index, uuid, user_name, transaction_type, reason, amount = applied[ordinal - 1]
+            results[index][1] = (log_id, uuid, user_name, transaction_type, reason, amount, timestamp)
+
+        for transaction_type in {tap[3] for tap in applied}:
+            amounts = [tap[5] for tap in applied if tap[3] == transaction_type]
+            self.bump_counters(transactions=len(amounts), scraps=sum(amounts), transaction_type=transaction_type)
+        return [tuple(result) for result in results]
+
+    def load_fixtures(self, users, logs, batch_size=10000):
+        """
+        Bulk insert generated (uuid, name, scraps) users and (uuid, type, reason, timestamp, amount) logs.
+
+        Log partitions, opening balances, the dashboard counters and analytics rollups are brought up to date
+        afterwards.
+        """
+        execute_values(self.cur, "INSERT INTO credit_card (uuid, name, scraps) VALUES %s", users,
+                       page_size=batch_size)
+        batch = []
+        logged = {}
+        for uuid, transaction_type, reason, timestamp, amount in logs:
+            logged[uuid] = logged.get(uuid, 0) + amount
+            batch.append((uuid, transaction_type, reason, timestamp, amount, TRANSACTION_KINDS[transaction_type]))
+            if len(batch) >= batch_size:
+                self._insert_logs(batch)
+                # Commit per batch so loading millions of rows never builds one huge transaction
+                self.conn.commit()
+                batch = []
+        if batch:
+            self._insert_logs(batch)
+        # Backdated rows for months without a partition went to the default partition; give them their own
+        ensure_partitions(self.cur)
+        # Generated logs are random, so open each ledger at whatever makes the card's scraps reconcile
+        execute_values(self.cur, "UPDATE credit_card c SET opening_scraps = c.scraps - v.logged "
+                                 "FROM (VALUES %s) AS v (uuid, logged) WHERE c.uuid = v.uuid::uuid",
+                       list(logged.items()), page_size=batch_size)
+        recount_dashboard_counters(self.cur)
+        rebuild_rollups(self.cur)
+
+    def _insert_logs(self, rows):
+        execute_values(self.cur, "INSERT INTO transaction_logs (uuid, name, reason, timestamp, amount, kind) "
+                                 "VALUES %s", rows, template="(%s, %s, %s, %s, %s, %s::transaction_kind)",
+                       page_size=len(rows))
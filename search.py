@@ -0,0 +1,57 @@
+"""
+Name search helpers shared by the admin pages, the search API and batch operations.
+
+Every mode is served by an index created in migrations.py:
+- "contains": ILIKE '%term%', backed by a pg_trgm GIN index
+- "prefix":   lower(name) LIKE 'term%', backed by a text_pattern_ops b-tree index
+- "fuzzy":    trigram similarity (name % term), ranked by similarity()
+
+SQLite has no pg_trgm, so sqlite_repository.py registers similarity() below as a SQL function instead.
+"""
+import re
+
+SEARCH_MODES = ("contains", "prefix", "fuzzy")
+DEFAULT_SEARCH_MODE = "contains"
+
+
+def search_mode(value):
+    """ Normalise a user-supplied mode, falling back to the default for unknown values. """
+    return value if value in SEARCH_MODES else DEFAULT_SEARCH_MODE
+
+
+def escape_like(term):
+    """ Escape LIKE wildcards so user input only ever matches literally. """
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def name_filter(term, mode=DEFAULT_SEARCH_MODE, column="name"):
+    """ Return (sql, params) for a WHERE condition matching `column` against `term`, or (None, []) for no filter. """
+    if not term:
+        return None, []
+    if mode == "prefix":
+        return f"lower({column}) LIKE %s", [escape_like(term.lower()) + "%"]
+    if mode == "fuzzy":
+        return f"{column} %% %s", [term]
+    return f"{column} ILIKE %s", ["%" + escape_like(term) + "%"]
+
+
+def rank_order(term, column="name"):
+    """ Return (sql, params) for an ORDER BY expression ranking the closest trigram matches first. """
+    return f"similarity({column}, %s) DESC", [term]
+
+
+def trigrams(text):
+    """ Return the set of trigrams pg_trgm extracts from `text`: per lowercased word, padded with blanks. """
+    grams = set()
+    for word in re.findall(r"[^\W_]+", text.lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a, b):
+    """ Python port of pg_trgm's similarity(), for backends without the extension. """
+    grams_a, grams_b = trigrams(a or ""), trigrams(b or "")
+    if not grams_a or not grams_b:
+        return 0.0
+    return len(grams_a & grams_b) / len(grams_a | grams_b)
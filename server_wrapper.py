@@ -1,116 +1,250 @@
 #!/usr/bin/env python3
+"""
+Pre-fork supervisor for app.py.
+
+    WORKERS=4 PORT=5000 python server_wrapper.py
+
+The supervisor opens the listening socket once and starts WORKERS copies of app.py that all accept from
+it. Each worker also gets a private loopback socket that the supervisor probes over HTTP; a worker that
+exits, or fails HEALTH_CHECK_FAILURES probes in a row, is replaced on its own while the others keep
+serving. Signals:
+
+    SIGHUP           rolling reload: start a new worker, wait until it answers, then retire an old one
+    SIGTERM, SIGINT  drain every worker and exit
+
+Retired workers stop accepting, finish the requests they already have, and exit, so neither a reload nor
+a restart drops connections.
+"""
+import http.client
+import os
 import signal
+import socket
 import subprocess
 import sys
 import time
 
-# Maximum number of restarts before giving up
+from worker import DRAIN_TIMEOUT
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", 5000))
+# Number of app.py worker processes
+WORKERS = int(os.getenv("WORKERS", 2))
+# Pending connections the shared socket queues while every worker is busy
+LISTEN_BACKLOG = int(os.getenv("LISTEN_BACKLOG", 1024))
+# Path requested by the health probe; any answer below 500 counts as healthy. Liveness only: a worker is
+# not restarted because the database is down, since app.py's circuit breaker already handles that
+HEALTH_CHECK_PATH = os.getenv("HEALTH_CHECK_PATH", "/healthz")
+# Time between health probes of a worker, and how long one probe may take (in seconds)
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", 5))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", 3))
+# Consecutive failed probes before a worker is replaced
+HEALTH_CHECK_FAILURES = int(os.getenv("HEALTH_CHECK_FAILURES", 3))
+# How long a new worker may take to answer its first probe (in seconds)
+STARTUP_TIMEOUT = float(os.getenv("STARTUP_TIMEOUT", 60))
+# Maximum number of restarts of one worker before giving up
 MAX_RESTARTS = 10
-# Time to wait between restarts (in seconds)
+# Time to wait between restarts of a crashed worker (in seconds)
 RESTART_DELAY = 5
 # Time window for restart counting (in seconds)
 RESTART_WINDOW = 300  # 5 minutes
 
-# Track restarts
-restart_times = []
 
+class Worker:
+    """ One app.py process serving the shared socket, plus the loopback socket it is probed on. """
 
-def signal_handler(sig):
-    """Handle termination signals by cleaning up the child process."""
-    print(f"Received signal {sig}, shutting down...")
-    if current_process:
-        print("Terminating Flask server...")
+    def __init__(self, slot, listener):
+        self.slot = slot
+        self.probe_socket = socket.create_server(("127.0.0.1", 0))
+        self.port = self.probe_socket.getsockname()[1]
+        env = dict(os.environ, LISTEN_FDS=f"{listener.fileno()},{self.probe_socket.fileno()}",
+                   WORKER_ID=str(slot))
+        # Use sys.executable to ensure we use the same Python interpreter
+        self.process = subprocess.Popen([sys.executable, "app.py"], env=env,
+                                        pass_fds=(listener.fileno(), self.probe_socket.fileno()))
+        self.started_at = time.monotonic()
+        self.ready = False
+        self.failures = 0
+        self.next_check = self.started_at
+        self.stop_deadline = None
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def probe(self):
+        """ Request HEALTH_CHECK_PATH on this worker's own socket; True if it answered below 500. """
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=HEALTH_CHECK_TIMEOUT)
         try:
-            current_process.terminate()
-            current_process.wait(timeout=5)
-        except subprocess.TimeoutExpired:
-            print("Flask server did not terminate gracefully, killing...")
-            current_process.kill()
-    else:
-        print("No running process to terminate.")
-    sys.exit(0)
-
-
-# Register signal handlers
-signal.signal(signal.SIGINT, signal_handler)
-signal.signal(signal.SIGTERM, signal_handler)
-
-
-def monitor_output(process):
-    """Monitor the process output for specific error messages."""
-    while True:
-        # Read a line from stderr
-        line = process.stderr.readline()
-        if not line and process.poll() is not None:
-            break
-
-        if line:
-            # Log
-            print(f"{line.strip().replace('INFO:werkzeug:', '').replace('INFO:__main__:', '')}")
-
-            # Check for the specific database connection error
-            if "psycopg2.OperationalError" in line and "could not translate host name" in line:
-                print("Database connection error detected! Restarting server...")
-                return True  # Signal that we need to restart
-
-            # Check for other critical errors that might require restart
-            if "Error in database connection" in line:
-                print("Database connection error detected! Restarting server...")
-                return True
-
-    # If we get here, the process exited without the specific error
-    exit_code = process.poll()
-    print(f"Flask server exited with code {exit_code}")
-    return exit_code != 0  # Restart if exit code is non-zero
-
-
-if __name__ == "__main__":
-    print("Server wrapper starting...")
-    restart_count = 0
-
-    while True:
+            conn.request("GET", HEALTH_CHECK_PATH)
+            return conn.getresponse().status < 500
+        except (OSError, http.client.HTTPException):
+            return False
+        finally:
+            conn.close()
+
+    def check(self, now):
+        """ Probe the worker if it is due; returns False once it has failed too many probes in a row. """
+        if now < self.next_check:
+            return True
+        self.next_check = now + HEALTH_CHECK_INTERVAL
+        if self.probe():
+            if not self.ready:
+                print(f"Worker {self.slot} (pid {self.pid}) is ready")
+            self.ready = True
+            self.failures = 0
+            return True
+        if not self.ready:
+            # Still starting up: only a worker that never answers within STARTUP_TIMEOUT is unhealthy
+            self.next_check = now + 1
+            return now - self.started_at < STARTUP_TIMEOUT
+        self.failures += 1
+        print(f"Worker {self.slot} (pid {self.pid}) failed health check {self.failures}/{HEALTH_CHECK_FAILURES}")
+        return self.failures < HEALTH_CHECK_FAILURES
+
+    def stop(self):
+        """ Ask the worker to drain and exit; it is killed if it is still running after the drain timeout. """
+        if self.stop_deadline is None:
+            self.stop_deadline = time.monotonic() + DRAIN_TIMEOUT + 5
+            if self.process.poll() is None:
+                self.process.terminate()
+        self.probe_socket.close()
+
+    def reap(self):
+        """ Return True once a stopped worker has exited, killing it if it overran its drain deadline. """
+        if self.process.poll() is not None:
+            return True
+        if time.monotonic() >= self.stop_deadline:
+            print(f"Worker {self.slot} (pid {self.pid}) did not drain in time, killing...")
+            self.process.kill()
+            self.process.wait()
+            return True
+        return False
+
+
+class Supervisor:
+    """ Keeps `workers` healthy app.py processes serving one shared listening socket. """
+
+    def __init__(self, workers):
+        self.listener = socket.create_server((HOST, PORT), backlog=LISTEN_BACKLOG)
+        self.workers = [None] * workers
+        # slot -> monotonic time at which a crashed worker is started again
+        self.pending = {}
+        # Workers that were asked to stop and are finishing their requests
+        self.retiring = []
+        self.restart_times = [[] for _ in range(workers)]
+        self.stop_requested = False
+        self.reload_requested = False
+
+    def spawn(self, slot):
         # Clean up old restart times
         current_time = time.time()
-        restart_times = [t for t in restart_times if current_time - t < RESTART_WINDOW]
+        self.restart_times[slot] = [t for t in self.restart_times[slot] if current_time - t < RESTART_WINDOW]
 
         # Check if we've restarted too many times
-        if len(restart_times) >= MAX_RESTARTS:
-            print(
-                f"Too many restarts ({len(restart_times)}) in the last {RESTART_WINDOW} seconds. Giving up.")
+        if len(self.restart_times[slot]) >= MAX_RESTARTS:
+            print(f"Worker {slot} restarted {len(self.restart_times[slot])} times in the last "
+                  f"{RESTART_WINDOW} seconds. Giving up.")
+            self.shutdown()
             sys.exit(1)
 
-        # Start the server
-        print("Starting Flask server...")
+        self.restart_times[slot].append(current_time)
+        worker = Worker(slot, self.listener)
+        print(f"Started worker {slot} (pid {worker.pid})")
+        return worker
+
+    def retire(self, worker):
+        worker.stop()
+        self.retiring.append(worker)
+
+    def check_workers(self):
+        now = time.monotonic()
+        for slot, due in list(self.pending.items()):
+            if now >= due:
+                del self.pending[slot]
+                self.workers[slot] = self.spawn(slot)
+
+        for slot, worker in enumerate(self.workers):
+            if worker is None:
+                continue
+            exit_code = worker.process.poll()
+            if exit_code is not None:
+                print(f"Worker {slot} (pid {worker.pid}) exited with code {exit_code}, "
+                      f"restarting in {RESTART_DELAY} seconds...")
+                worker.stop()
+                self.workers[slot] = None
+                self.pending[slot] = now + RESTART_DELAY
+            elif not worker.check(now):
+                print(f"Worker {slot} (pid {worker.pid}) is unhealthy, replacing it...")
+                self.retire(worker)
+                self.workers[slot] = self.spawn(slot)
+
+        self.retiring = [worker for worker in self.retiring if not worker.reap()]
+
+    def rolling_reload(self):
+        """ Replace the workers one at a time, retiring each old worker only once its successor answers. """
+        print("Rolling reload starting...")
+        for slot in range(len(self.workers)):
+            replacement = Worker(slot, self.listener)
+            print(f"Started replacement worker {slot} (pid {replacement.pid})")
+            while not self.stop_requested:
+                now = time.monotonic()
+                if replacement.process.poll() is not None or not replacement.check(now):
+                    print(f"Replacement worker {slot} did not become ready, keeping the old workers")
+                    self.retire(replacement)
+                    return
+                if replacement.ready:
+                    break
+                self.check_workers()
+                time.sleep(0.5)
+            if self.stop_requested:
+                self.retire(replacement)
+                return
+
+            if self.workers[slot] is not None:
+                self.retire(self.workers[slot])
+            self.pending.pop(slot, None)
+            self.workers[slot] = replacement
+        print("Rolling reload finished")
+
+    def shutdown(self):
+        print("Draining workers...")
+        for worker in self.workers:
+            if worker is not None:
+                self.retire(worker)
+        self.workers = [None] * len(self.workers)
+        self.pending.clear()
+        while self.retiring:
+            self.retiring = [worker for worker in self.retiring if not worker.reap()]
+            time.sleep(0.2)
+        self.listener.close()
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_reload)
+
+        print(f"Server wrapper listening on {HOST}:{PORT} with {len(self.workers)} workers")
+        for slot in range(len(self.workers)):
+            self.workers[slot] = self.spawn(slot)
+
+        while not self.stop_requested:
+            if self.reload_requested:
+                self.reload_requested = False
+                self.rolling_reload()
+            self.check_workers()
+            time.sleep(0.5)
+        self.shutdown()
+
+    def handle_stop(self, sig, frame):
+        """ Handle termination signals by draining the workers from the main loop. """
+        print(f"Received signal {sig}, shutting down...")
+        self.stop_requested = True
+
+    def handle_reload(self, sig, frame):
+        print(f"Received signal {sig}, reloading workers...")
+        self.reload_requested = True
 
-        # Use sys.executable to ensure we use the same Python interpreter
-        current_process = subprocess.Popen(
-            [sys.executable, "app.py"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-            bufsize=1  # Line buffered
-        )
-
-        # Record the restart time
-        restart_times.append(time.time())
-        restart_count += 1
-
-        # Monitor the server output
-        needs_restart = monitor_output(current_process)
-
-        # If the server doesn't need to restart, we're done
-        if not needs_restart:
-            break
-
-        print(f"Waiting {RESTART_DELAY} seconds before restarting...")
-        time.sleep(RESTART_DELAY)
-
-        # Try to terminate the process if it's still running
-        if current_process.poll() is None:
-            print("Terminating Flask server...")
-            current_process.terminate()
-            try:
-                current_process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                print("Flask server did not terminate gracefully, killing...")
-                current_process.kill()
+
+if __name__ == "__main__":
+    print("Server wrapper starting...")
+    Supervisor(WORKERS).run()
@@ -0,0 +1,570 @@
+"""
+SQLite implementation of the repository in repository.py, for profiling and load-testing without PostgreSQL.
+
+Select it with DATA_BACKEND=sqlite and SQLITE_PATH=<file> (":memory:" keeps everything in process memory).
+The schema mirrors the migrated PostgreSQL one, with a few substitutions:
+- uuids and timestamps are stored as text, timestamps as "YYYY-MM-DD HH:MM:SS.ffffff" local time
+- "contains"/"prefix" search use LIKE, which SQLite only folds case for ASCII
+- "fuzzy" search calls search.similarity(), a Python port of pg_trgm, through a registered SQL function
+- user and log counts are exact instead of planner estimates
+"""
+import math
+import sqlite3
+import threading
+import time
+import uuid as uid
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
+
+from fraud import FraudEngine
+from metrics import track_connection_wait, track_query
+from migrations import RECONCILE_BATCH_ROWS, RECONCILE_SETTLE_SECONDS
+from repository import TRANSACTION_KINDS, where_sql
+from search import DEFAULT_SEARCH_MODE, escape_like, similarity
+
+# pg_trgm's default similarity_threshold, used by the "fuzzy" search mode
+FUZZY_THRESHOLD = 0.3
+
+# Bucket width of each analytics resolution
+RESOLUTION_STEPS = {
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+}
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS credit_card (
+        uuid TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        scraps INTEGER NOT NULL DEFAULT 0,
+        opening_scraps INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS credit_card_name_uuid_idx ON credit_card (name, uuid);
+
+    CREATE TABLE IF NOT EXISTS transaction_logs (
+        id INTEGER PRIMARY KEY,
+        uuid TEXT NOT NULL,
+        name TEXT NOT NULL,
+        reason TEXT,
+        timestamp TEXT NOT NULL,
+        amount INTEGER,
+        kind TEXT
+    );
+    CREATE INDEX IF NOT EXISTS transaction_logs_timestamp_id_idx ON transaction_logs (timestamp, id);
+    CREATE INDEX IF NOT EXISTS transaction_logs_uuid_timestamp_idx ON transaction_logs (uuid, timestamp);
+
+    CREATE TABLE IF NOT EXISTS maintenance_checkpoints (
+        name TEXT PRIMARY KEY,
+        position INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS ledger_totals (
+        uuid TEXT PRIMARY KEY,
+        logged INTEGER NOT NULL DEFAULT 0,
+        rows INTEGER NOT NULL DEFAULT 0
+    );
+
+    CREATE TABLE IF NOT EXISTS dashboard_counters (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        total_users INTEGER NOT NULL DEFAULT 0,
+        total_transactions INTEGER NOT NULL DEFAULT 0,
+        total_scraps INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT
+    );
+    INSERT OR IGNORE INTO dashboard_counters (id) VALUES (1);
+
+    CREATE TABLE IF NOT EXISTS transaction_rollups (
+        hour TEXT NOT NULL,
+        name TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        amount INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (hour, name)
+    );
+"""
+
+
+def format_timestamp(value):
+    """ Store datetimes in a fixed-width format so text comparisons order them correctly. """
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def parse_timestamp(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def truncate_timestamp(value, resolution):
+    """ SQLite stand-in for PostgreSQL's date_trunc() at an analytics resolution. """
+    value = value.replace(minute=0, second=0, microsecond=0)
+    if resolution == "hour":
+        return value
+    value = value.replace(hour=0)
+    if resolution == "week":
+        # PostgreSQL weeks start on Monday
+        value -= timedelta(days=value.weekday())
+    return value
+
+
+def name_filter(term, mode=DEFAULT_SEARCH_MODE, column="name"):
+    """ SQLite version of search.name_filter(): returns (sql, params), or (None, []) for no filter. """
+    if not term:
+        return None, []
+    if mode == "prefix":
+        return f"lower({column}) LIKE ? ESCAPE '\\'", [escape_like(term.lower()) + "%"]
+    if mode == "fuzzy":
+        return f"similarity({column}, ?) >= ?", [term, FUZZY_THRESHOLD]
+    return f"{column} LIKE ? ESCAPE '\\'", ["%" + escape_like(term) + "%"]
+
+
+sqlite3.register_adapter(datetime, format_timestamp)
+
+
+class TimedConnection(sqlite3.Connection):
+    """ Connection that reports every statement to the request metrics. """
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            track_query(time.perf_counter() - started)
+
+    def executemany(self, sql, parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            track_query(time.perf_counter() - started)
+
+
+class SQLiteRepository:
+    """ Repository backed by a SQLite database file, with one connection per thread. """
+
+    backend = "sqlite"
+
+    def __init__(self, path, busy_timeout=30):
+        self.path = path
+        # How long a writer waits for another thread's write transaction to finish (in seconds)
+        self.busy_timeout = busy_timeout
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        # An in-memory database exists once per connection, so every thread shares one and takes turns
+        self._shared_lock = threading.RLock() if path == ":memory:" else None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                               check_same_thread=False, factory=TimedConnection)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.create_function("similarity", 2, similarity, deterministic=True)
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def _connection(self):
+        if self._shared_lock is not None:
+            with self._lock:
+                shared = self._connections[0] if self._connections else None
+            return shared or self._connect()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """ Yield a SQLiteStore for one transaction: committed on success, rolled back on error. """
+        started = time.perf_counter()
+        with self._shared_lock or nullcontext():
+            conn = self._connection()
+            track_connection_wait(time.perf_counter() - started)
+            conn.execute("BEGIN")
+            try:
+                yield SQLiteStore(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def setup(self):
+        """ Create the schema if the database is new. """
+        with self._shared_lock or nullcontext():
+            self._connection().executescript(SCHEMA)
+
+    def migrate(self):
+        """ The SQLite schema has no versions; same as setup(). """
+        self.setup()
+
+    def watch_balances(self, callback):
+        """ SQLite has no notifications; cached balances from other processes expire by TTL only. """
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {"backend": self.backend, "path": self.path, "open": len(self._connections)}
+
+    def health(self):
+        """ A local database file has no outage to wait out, so it is always ready. """
+        return {"backend": self.backend, "ready": True, "last_error": None}
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+class SQLiteStore:
+    """ Queries and writes bound to one SQLite connection and transaction; see repository.PostgresStore. """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def commit(self):
+        """ Commit the work done so far; later calls run in a new transaction. """
+        self.conn.execute("COMMIT")
+        self.conn.execute("BEGIN")
+
+    # --- Reads ---
+    def balance_page(self, uuid, history_size):
+        rows = self.conn.execute("""
+            SELECT c.name, c.scraps, t.name, t.reason, t.timestamp, t.id
+            FROM credit_card c
+            LEFT JOIN (
+                SELECT uuid, name, reason, timestamp, id
+                FROM transaction_logs
+                WHERE uuid = ?
+                ORDER BY timestamp DESC, id DESC
+                LIMIT ?
+            ) t ON t.uuid = c.uuid
+            WHERE c.uuid = ?
+            ORDER BY t.timestamp DESC, t.id DESC
+        """, (uuid, history_size, uuid)).fetchall()
+        if not rows:
+            return None
+        history = [(name, reason, parse_timestamp(timestamp), log_id)
+                   for _, _, name, reason, timestamp, log_id in rows if log_id is not None]
+        return rows[0][0], rows[0][1], history
+
+    def recent_transactions(self, uuid, limit=10):
+        rows = self.conn.execute("""
+            SELECT name, reason, timestamp
+            FROM transaction_logs
+            WHERE uuid = ?
+            ORDER BY timestamp DESC
+            LIMIT ?
+        """, (uuid, limit)).fetchall()
+        return [(name, reason, parse_timestamp(timestamp)) for name, reason, timestamp in rows]
+
+    def count_logs(self, search="", mode=DEFAULT_SEARCH_MODE):
+        condition, params = name_filter(search, mode)
+        return self.conn.execute(
+            f"SELECT COUNT(*) FROM transaction_logs {where_sql([condition] if condition else [])}",
+            params).fetchone()[0]
+
+    def list_logs(self, search="", mode=DEFAULT_SEARCH_MODE, after=None, limit=50):
+        condition, params = name_filter(search, mode)
+        conditions = [condition] if condition else []
+        if after:
+            conditions.append("(timestamp, id) < (?, ?)")
+            params += list(after)
+        rows = self.conn.execute(
+            f"SELECT uuid, name, reason, timestamp, id FROM transaction_logs {where_sql(conditions)} "
+            "ORDER BY timestamp DESC, id DESC LIMIT ?",
+            params + [limit]).fetchall()
+        return [(uuid, name, reason, parse_timestamp(timestamp), log_id)
+                for uuid, name, reason, timestamp, log_id in rows]
+
+    def count_users(self, search="", mode=DEFAULT_SEARCH_MODE):
+        condition, params = name_filter(search, mode)
+        return self.conn.execute(
+            f"SELECT COUNT(*) FROM credit_card {where_sql([condition] if condition else [])}",
+            params).fetchone()[0]
+
+    def list_users(self, search="", mode=DEFAULT_SEARCH_MODE, after=None, limit=50):
+        condition, params = name_filter(search, mode)
+        conditions = [condition] if condition else []
+        if after:
+            conditions.append("(name, uuid) > (?, ?)")
+            params += list(after)
+        return self.conn.execute(f"SELECT uuid, name, scraps FROM credit_card {where_sql(conditions)} "
+                                 "ORDER BY name ASC, uuid ASC LIMIT ?", params + [limit]).fetchall()
+
+    def rank_users(self, search, mode=DEFAULT_SEARCH_MODE, limit=50):
+        condition, params = name_filter(search, mode)
+        return self.conn.execute(f"SELECT uuid, name, scraps FROM credit_card {where_sql([condition])} "
+                                 "ORDER BY similarity(name, ?) DESC, name ASC LIMIT ?",
+                                 params + [search, limit]).fetchall()
+
+    def dashboard_counters(self):
+        return self.conn.execute(
+            "SELECT total_users, total_transactions, total_scraps FROM dashboard_counters").fetchone()
+
+    def analytics(self, resolution, start, end, transaction_type=None):
+        type_filter = ""
+        params = [truncate_timestamp(start, "hour"), end]
+        if transaction_type:
+            type_filter = "AND name = ?"
+            params.append(transaction_type)
+        rows = self.conn.execute(f"""
+            SELECT hour, name, SUM(count), SUM(amount)
+            FROM transaction_rollups
+            WHERE hour >= ? AND hour <= ? {type_filter}
+            GROUP BY hour, name
+        """, params).fetchall()
+
+        # Without generate_series(), bucket the hourly rows and fill the gaps here
+        totals = {}
+        for hour, name, count, amount in rows:
+            bucket = totals.setdefault(truncate_timestamp(parse_timestamp(hour), resolution), {})
+            previous = bucket.get(name, (0, 0))
+            bucket[name] = (previous[0] + count, previous[1] + amount)
+
+        results = []
+        bucket = truncate_timestamp(start, resolution)
+        last_bucket = truncate_timestamp(end, resolution)
+        while bucket <= last_bucket:
+            named = totals.get(bucket)
+            if named:
+                results.extend((bucket, name, count, amount) for name, (count, amount) in sorted(named.items()))
+            else:
+                results.append((bucket, None, 0, 0))
+            bucket += RESOLUTION_STEPS[resolution]
+        return results
+
+    def detect_fraud(self, start_time):
+        """ Replay the logs since `start_time` through a throwaway FraudEngine; same findings as PostgreSQL. """
+        hours = math.ceil((datetime.now() - start_time).total_seconds() / 3600)
+        engine = FraudEngine(window_hours=max(hours, 1))
+        engine.rebuild(self)
+        return engine.findings(start_time)
+
+    def fraud_events(self, since):
+        rows = self.conn.execute("""
+            SELECT tl.id, tl.uuid, c.name, tl.name, tl.reason, tl.amount, tl.timestamp
+            FROM transaction_logs tl
+            LEFT JOIN credit_card c ON c.uuid = tl.uuid
+            WHERE tl.timestamp >= ?
+            ORDER BY tl.timestamp, tl.id
+        """, (format_timestamp(since),)).fetchall()
+        return [row[:6] + (parse_timestamp(row[6]),) for row in rows]
+
+    def reconcile_ledger(self, max_rows=RECONCILE_BATCH_ROWS, limit=100):
+        """
+        One bounded reconciliation pass, like PostgresStore.reconcile_ledger(); rows need a stored amount.
+
+        SQLite cards always record their opening balance, so no adjustments are ever reported.
+        """
+        row = self.conn.execute("SELECT position FROM maintenance_checkpoints WHERE name = 'reconcile_ledger'"
+                                ).fetchone()
+        position = row[0] if row else 0
+        settled = format_timestamp(datetime.now() - timedelta(seconds=RECONCILE_SETTLE_SECONDS))
+        rows = self.conn.execute("SELECT id, uuid, amount, timestamp FROM transaction_logs WHERE id > ? "
+                                 "ORDER BY id LIMIT ?", (position, max_rows)).fetchall()
+        batch = []
+        for row in rows:
+            if row[3] >= settled:
+                break
+            batch.append(row)
+
+        totals = {}
+        for _, uuid, amount, _ in batch:
+            logged, count = totals.get(uuid, (0, 0))
+            totals[uuid] = (logged + (amount or 0), count + 1)
+        self.conn.executemany("""
+            INSERT INTO ledger_totals (uuid, logged, rows) VALUES (?, ?, ?)
+            ON CONFLICT (uuid) DO UPDATE SET logged = logged + excluded.logged, rows = rows + excluded.rows
+        """, [(uuid, logged, count) for uuid, (logged, count) in totals.items()])
+        if batch:
+            position = batch[-1][0]
+            self.conn.execute("""
+                INSERT INTO maintenance_checkpoints (name, position, updated_at) VALUES ('reconcile_ledger', ?, ?)
+                ON CONFLICT (name) DO UPDATE SET position = excluded.position, updated_at = excluded.updated_at
+            """, (position, format_timestamp(datetime.now())))
+        self.commit()
+
+        caught_up = len(batch) < max_rows
+        mismatched, drift = None, None
+        if caught_up:
+            drift = self.conn.execute("""
+                WITH pending AS (
+                    SELECT uuid, SUM(amount) AS logged FROM transaction_logs WHERE id > ? GROUP BY uuid
+                ), ledger AS (
+                    SELECT c.uuid, c.name, c.scraps,
+                           c.opening_scraps + COALESCE(t.logged, 0) + COALESCE(p.logged, 0) AS expected
+                    FROM credit_card c
+                    LEFT JOIN ledger_totals t ON t.uuid = c.uuid
+                    LEFT JOIN pending p ON p.uuid = c.uuid
+                )
+                SELECT uuid, name, scraps, expected, scraps - expected, COUNT(*) OVER ()
+                FROM ledger
+                WHERE scraps <> expected
+                ORDER BY abs(scraps - expected) DESC, uuid
+                LIMIT ?
+            """, (position, limit)).fetchall()
+            mismatched = drift[0][5] if drift else 0
+            drift = [row[:5] for row in drift]
+        return {"processed": len(batch), "position": position,
+                "unparsed": sum(1 for row in batch if row[2] is None), "caught_up": caught_up,
+                "mismatched": mismatched, "drift": drift, "adjusted": 0, "adjustments": []}
+
+    def _stream(self, query, params, chunk_rows):
+        cur = self.conn.execute(query, params)
+        try:
+            while True:
+                rows = cur.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cur.close()
+
+    def export_users(self, chunk_rows):
+        return self._stream("SELECT uuid, name, scraps FROM credit_card ORDER BY name ASC", (), chunk_rows)
+
+    def export_transactions(self, chunk_rows, start=None, end=None):
+        conditions = []
+        params = []
+        if start:
+            conditions.append("timestamp >= ?")
+            params.append(start)
+        if end:
+            conditions.append("timestamp < ?")
+            params.append(end)
+        return self._stream(f"SELECT uuid, name, reason, timestamp FROM transaction_logs {where_sql(conditions)} "
+                            "ORDER BY timestamp DESC", params, chunk_rows)
+
+    # --- Writes ---
+    def add_user(self, name, scraps):
+        return self.conn.execute("INSERT INTO credit_card (uuid, name, scraps, opening_scraps) VALUES (?, ?, ?, ?) "
+                                 "RETURNING uuid, scraps", (str(uid.uuid4()), name, scraps, scraps)).fetchone()
+
+    def debit(self, uuid, amount):
+        return self.conn.execute("UPDATE credit_card SET scraps = scraps - ? WHERE uuid = ? AND scraps >= ? "
+                                 "RETURNING scraps, name", (amount, uuid, amount)).fetchone()
+
+    def credit(self, uuid, amount):
+        return self.conn.execute("UPDATE credit_card SET scraps = scraps + ? WHERE uuid = ? RETURNING scraps, name",
+                                 (amount, uuid)).fetchone()
+
+    def log_transaction(self, uuid, user_name, transaction_type, reason, amount, timestamp=None):
+        timestamp = timestamp or datetime.now()
+        log_id = self.conn.execute("INSERT INTO transaction_logs (uuid, name, reason, timestamp, amount, kind) "
+                                   "VALUES (?, ?, ?, ?, ?, ?) RETURNING id",
+                                   (uuid, transaction_type, reason, timestamp, amount,
+                                    TRANSACTION_KINDS[transaction_type])).fetchone()[0]
+        return log_id, uuid, user_name, transaction_type, reason, amount, timestamp
+
+    def bump_counters(self, users=0, transactions=0, scraps=0, transaction_type=None):
+        now = datetime.now()
+        if transaction_type:
+            self.conn.execute("""
+                INSERT INTO transaction_rollups (hour, name, count, amount) VALUES (?, ?, ?, ?)
+                ON CONFLICT (hour, name) DO UPDATE SET
+                    count = count + excluded.count,
+                    amount = amount + excluded.amount
+            """, (truncate_timestamp(now, "hour"), transaction_type, transactions, scraps))
+        self.conn.execute("""
+            UPDATE dashboard_counters SET
+                total_users = total_users + ?,
+                total_transactions = total_transactions + ?,
+                total_scraps = total_scraps + ?,
+                updated_at = ?
+        """, (users, transactions, scraps, now))
+
+    def apply_batch(self, transaction_type, amount, reason, search="", mode=DEFAULT_SEARCH_MODE,
+                    after_uuid=None, limit=None):
+        condition, params = name_filter(search, mode)
+        conditions = [condition] if condition else []
+        if amount < 0:
+            conditions.append("scraps >= ?")
+            params.append(-amount)
+        if after_uuid is not None:
+            conditions.append("uuid > ?")
+            params.append(after_uuid)
+
+        limit_clause = ""
+        if limit:
+            limit_clause = "ORDER BY uuid LIMIT ?"
+            params.append(limit)
+
+        # The write lock is held from the UPDATE on, so no other writer can slip between the statements
+        updated = self.conn.execute(f"""
+            UPDATE credit_card SET scraps = scraps + ?
+            WHERE uuid IN (SELECT uuid FROM credit_card {where_sql(conditions)} {limit_clause})
+            RETURNING uuid, name
+        """, [amount] + params).fetchall()
+
+        timestamp = datetime.now()
+        entries = [self.log_transaction(uuid, user_name, transaction_type, reason, amount, timestamp)
+                   for uuid, user_name in sorted(updated)]
+        if entries:
+            self.bump_counters(transactions=len(entries), scraps=len(entries) * amount,
+                               transaction_type=transaction_type)
+        return entries
+
+    def apply_taps(self, taps):
+        # Statements are in-process calls here, so taps are simply applied one conditional UPDATE at a time
+        results = []
+        totals = {}
+        timestamp = datetime.now()
+        for uuid, transaction_type, amount, reason in taps:
+            updated = self.debit(uuid, -amount) if amount < 0 else self.credit(uuid, amount)
+            if not updated:
+                exists = self.conn.execute("SELECT 1 FROM credit_card WHERE uuid = ?", (uuid,)).fetchone()
+                results.append(("insufficient_scraps" if exists else "not_found", None, None))
+                continue
+            new_scraps, user_name = updated
+            entry = self.log_transaction(uuid, user_name, transaction_type, reason, amount, timestamp)
+            results.append(("applied", entry, new_scraps))
+            count, total = totals.get(transaction_type, (0, 0))
+            totals[transaction_type] = (count + 1, total + amount)
+
+        for transaction_type, (count, total) in totals.items():
+            self.bump_counters(transactions=count, scraps=total, transaction_type=transaction_type)
+        return results
+
+    def load_fixtures(self, users, logs, batch_size=10000):
+        self.conn.executemany("INSERT INTO credit_card (uuid, name, scraps) VALUES (?, ?, ?)", users)
+        batch = []
+        logged = {}
+        for uuid, transaction_type, reason, timestamp, amount in logs:
+            logged[uuid] = logged.get(uuid, 0) + amount
+            batch.append((uuid, transaction_type, reason, timestamp, amount, TRANSACTION_KINDS[transaction_type]))
+            if len(batch) >= batch_size:
+                self._insert_logs(batch)
+                self.commit()
+                batch = []
+        if batch:
+            self._insert_logs(batch)
+        self.conn.executemany("UPDATE credit_card SET opening_scraps = scraps - ? WHERE uuid = ?",
+                              [(total, uuid) for uuid, total in logged.items()])
+        self.recount_dashboard_counters()
+        self.rebuild_rollups()
+
+    def _insert_logs(self, rows):
+        self.conn.executemany("INSERT INTO transaction_logs (uuid, name, reason, timestamp, amount, kind) "
+                              "VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def recount_dashboard_counters(self):
+        """ Recompute the dashboard totals from the source tables, like migrations.recount_dashboard_counters(). """
+        self.conn.execute("""
+            UPDATE dashboard_counters SET
+                total_users = (SELECT COUNT(*) FROM credit_card),
+                total_transactions = (SELECT COUNT(*) FROM transaction_logs),
+                total_scraps = (SELECT COALESCE(SUM(scraps), 0) FROM credit_card),
+                updated_at = ?
+        """, (datetime.now(),))
+
+    def rebuild_rollups(self):
+        """ Recompute transaction_rollups from transaction_logs, like migrations.rebuild_rollups(). """
+        self.conn.execute("DELETE FROM transaction_rollups")
+        self.conn.execute("""
+            INSERT INTO transaction_rollups (hour, name, count, amount)
+            SELECT substr(timestamp, 1, 13) || ':00:00.000000', name, COUNT(*), COALESCE(SUM(amount), 0)
+            FROM transaction_logs
+            GROUP BY 1, 2
+        """)
@@ -0,0 +1,140 @@
+// Virtualized table for the admin listing pages.
+//
+// Pages come from /api/users or /api/logs as {columns, values, next}, with one array per column. Only the
+// rows in (and just around) the visible window are in the DOM; spacer rows above and below keep the
+// scrollbar sized for every loaded row, and the next page is fetched once its end scrolls into view.
+
+function escapeHtml(value) {
+    return String(value ?? "")
+        .replace(/&/g, "&amp;")
+        .replace(/</g, "&lt;")
+        .replace(/>/g, "&gt;")
+        .replace(/"/g, "&quot;")
+        .replace(/'/g, "&#39;")
+}
+
+class VirtualTable {
+    constructor({container, tbody, endpoint, query, renderRow, columnCount, emptyMessage, status, rowHeight = 56}) {
+        this.container = container
+        this.tbody = tbody
+        this.endpoint = endpoint
+        this.query = query
+        // (row object, index) => inner HTML of its <tr>
+        this.renderRow = renderRow
+        this.columnCount = columnCount
+        this.emptyMessage = emptyMessage
+        this.status = status
+        this.rowHeight = rowHeight
+        // Rows rendered beyond each edge of the viewport, so fast scrolling does not show blank space
+        this.overscan = 10
+
+        this.columns = []
+        this.values = []
+        this.next = null
+        this.loading = false
+        this.frame = null
+
+        this.container.addEventListener("scroll", () => this.scheduleRender(), {passive: true})
+        window.addEventListener("resize", () => this.scheduleRender())
+    }
+
+    get length() {
+        return this.values.length ? this.values[0].length : 0
+    }
+
+    append(page) {
+        if (!this.columns.length) {
+            this.columns = page.columns
+            this.values = page.columns.map(() => [])
+        }
+        page.values.forEach((column, i) => {
+            for (const value of column) {
+                this.values[i].push(value)
+            }
+        })
+        this.next = page.next
+        this.updateStatus()
+        this.scheduleRender()
+    }
+
+    row(index) {
+        const row = {}
+        this.columns.forEach((name, i) => {
+            row[name] = this.values[i][index]
+        })
+        return row
+    }
+
+    async loadMore() {
+        if (this.loading || !this.next) {
+            return
+        }
+        this.loading = true
+        this.updateStatus()
+        try {
+            const params = new URLSearchParams({...this.query, after: this.next})
+            const response = await fetch(`${this.endpoint}?${params}`)
+            const page = await response.json()
+            if (!page.success) {
+                throw new Error(page.message)
+            }
+            this.loading = false
+            this.append(page)
+        } catch (error) {
+            console.error("Error loading rows:", error)
+            this.loading = false
+            this.updateStatus("Could not load more rows; scroll to retry")
+        }
+    }
+
+    updateStatus(message) {
+        if (!this.status) {
+            return
+        }
+        const more = this.loading ? ", loading more..." : this.next ? ", scroll for more" : ""
+        this.status.textContent = message || `${this.length} rows loaded${more}`
+    }
+
+    scheduleRender() {
+        if (this.frame === null) {
+            this.frame = requestAnimationFrame(() => {
+                this.frame = null
+                this.render()
+            })
+        }
+    }
+
+    spacer(height) {
+        const tr = document.createElement("tr")
+        tr.className = "virtual-spacer"
+        tr.style.height = `${height}px`
+        return tr
+    }
+
+    render() {
+        const total = this.length
+        if (!total) {
+            this.tbody.innerHTML = `<tr><td colspan="${this.columnCount}" class="text-center">${escapeHtml(this.emptyMessage)}</td></tr>`
+            return
+        }
+
+        const first = Math.max(0, Math.floor(this.container.scrollTop / this.rowHeight) - this.overscan)
+        const last = Math.min(total, first + Math.ceil(this.container.clientHeight / this.rowHeight) + 2 * this.overscan)
+
+        const fragment = document.createDocumentFragment()
+        fragment.appendChild(this.spacer(first * this.rowHeight))
+        for (let i = first; i < last; i++) {
+            const tr = document.createElement("tr")
+            // Stripe by row index; nth-of-type would shift with the spacer as the window moves
+            tr.className = i % 2 ? "virtual-row" : "virtual-row virtual-row-odd"
+            tr.innerHTML = this.renderRow(this.row(i), i)
+            fragment.appendChild(tr)
+        }
+        fragment.appendChild(this.spacer((total - last) * this.rowHeight))
+        this.tbody.replaceChildren(fragment)
+
+        if (this.next && last + this.overscan >= total) {
+            this.loadMore()
+        }
+    }
+}
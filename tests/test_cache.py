@@ -0,0 +1,44 @@
+from cache import LRUCache
+
+
+def test_put_after_a_concurrent_invalidation_is_dropped():
+    cache = LRUCache()
+    version = cache.version()
+    # A write commits and invalidates the key while the reader is still at the database
+    cache.invalidate("card")
+    cache.put("card", "stale", version=version)
+
+    assert cache.get("card") is None
+    cache.put("card", "fresh", version=cache.version())
+    assert cache.get("card") == "fresh"
+
+
+def test_put_after_an_update_of_a_missing_entry_is_dropped():
+    cache = LRUCache()
+    version = cache.version()
+    cache.update("card", lambda view: view + 1)
+    cache.put("card", "stale", version=version)
+
+    assert cache.get("card") is None
+
+
+def test_changes_to_other_keys_do_not_block_a_put():
+    cache = LRUCache()
+    version = cache.version()
+    cache.invalidate("other")
+    cache.put("card", "view", version=version)
+
+    assert cache.get("card") == "view"
+
+
+def test_puts_read_before_a_forgotten_change_or_a_clear_are_dropped():
+    cache = LRUCache(max_size=2)
+    version = cache.version()
+    cache.invalidate("card", "b", "c")
+    cache.put("card", "stale", version=version)
+    assert cache.get("card") is None
+
+    version = cache.version()
+    cache.clear()
+    cache.put("card", "stale", version=version)
+    assert cache.get("card") is None
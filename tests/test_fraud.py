@@ -0,0 +1,174 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from fraud import LARGE_CHANGE_THRESHOLD, RISK_WEIGHTS, FraudEngine, detect_fraud, score_risks
+from sqlite_repository import SQLiteRepository
+
+DETECTORS = ["frequent_users", "duplicate_reasons", "unusual_patterns", "large_changes"]
+
+
+class RecordingCursor:
+    """
+    Stands in for a psycopg2 cursor: records every execute() and answers each detector query, recognised by
+    the table expression it aggregates, with `flagged` rows in that detector's shape.
+    """
+
+    def __init__(self, flagged):
+        self.flagged = flagged
+        self.executed = []
+
+    def execute(self, query, params=None):
+        self.executed.append((" ".join(query.split()), params))
+
+    def fetchall(self):
+        query = self.executed[-1][0]
+        rows = []
+        for i in range(self.flagged):
+            uuid, name = f"uuid-{i}", f"User {i}"
+            if "GROUP BY uuid, reason" in query:
+                rows.append((uuid, name, "Snacks", 3 + i % 5))
+            elif "LAG(name)" in query:
+                rows.append((uuid, name, 3 + i % 3))
+            elif "ABS(amount) >=" in query:
+                rows.append((uuid, name, 3 + i % 4))
+            else:
+                rows.append((uuid, name, 6 + i % 40))
+        return rows
+
+
+@pytest.mark.parametrize("flagged", [0, 1, 10, 500])
+def test_detect_fraud_runs_four_queries_whatever_is_flagged(flagged):
+    start_time = datetime.now() - timedelta(hours=12)
+    cur = RecordingCursor(flagged)
+    findings = detect_fraud(cur, start_time)
+
+    assert len(cur.executed) == 4
+    for query, _ in cur.executed:
+        # Names come from the same statement, never from a query per flagged user
+        assert "LEFT JOIN credit_card c ON c.uuid" in query
+    assert [params for _, params in cur.executed] == [
+        (start_time,), (start_time,), (start_time,), (start_time, LARGE_CHANGE_THRESHOLD)]
+    for category in DETECTORS:
+        assert len(findings[category]) == flagged
+    assert findings["unusual_times"] == []
+
+
+def test_detect_fraud_maps_each_query_to_its_category():
+    findings = detect_fraud(RecordingCursor(10), datetime.now() - timedelta(hours=12))
+
+    assert findings["frequent_users"][7] == {"uuid": "uuid-7", "name": "User 7", "transaction_count": 13,
+                                             "risk_level": "medium"}
+    assert findings["duplicate_reasons"][4] == {"uuid": "uuid-4", "name": "User 4", "reason": "Snacks",
+                                                "count": 7, "risk_level": "high"}
+    assert findings["unusual_patterns"][1]["count"] == 4
+    assert findings["unusual_patterns"][1]["risk_level"] == "high"
+    assert findings["large_changes"][2] == {"uuid": "uuid-2", "name": "User 2", "count": 5, "risk_level": "high"}
+
+
+def test_detect_fraud_findings_feed_score_risks():
+    findings = detect_fraud(RecordingCursor(25), datetime.now() - timedelta(hours=12))
+
+    assert set(findings) == set(DETECTORS) | {"unusual_times"}
+    scores = score_risks(findings)
+    assert len(scores) == 10
+    assert [entry["score"] for entry in scores] == sorted((entry["score"] for entry in scores), reverse=True)
+    for entry in scores:
+        assert set(entry) == {"uuid", "name", "score", "level"}
+        # Every user is flagged once by each detector
+        assert sum(weight[1] for weight in RISK_WEIGHTS.values()) <= entry["score"] <= \
+            sum(weight[0] for weight in RISK_WEIGHTS.values())
+        assert entry["level"] in ("high", "medium", "low")
+
+
+def test_sqlite_backend_finds_and_scores_seeded_fraud(tmp_path):
+    repository = SQLiteRepository(str(tmp_path / "fraud.sqlite3"))
+    repository.setup()
+    now = datetime.now()
+    with repository.transaction() as store:
+        (cycler, _), (hoarder, _), (quiet, _) = (store.add_user(name, 500) for name in ("Cycler", "Hoarder", "Quiet"))
+        # Four purchase -> reimbursement cycles, minutes apart
+        for i in range(4):
+            store.log_transaction(cycler, "Cycler", "Purchase", "Snacks", -5, now - timedelta(minutes=50 - 10 * i))
+            store.log_transaction(cycler, "Cycler", "Reimbursement", "Snacks", 5,
+                                  now - timedelta(minutes=49 - 10 * i))
+        # Large purchases, all for the same reason
+        for i in range(6):
+            store.log_transaction(hoarder, "Hoarder", "Purchase", "Tools", -40, now - timedelta(minutes=30 + i))
+        store.log_transaction(quiet, "Quiet", "Purchase", "Snacks", -5, now - timedelta(minutes=5))
+        # Too old for the window
+        for i in range(5):
+            store.log_transaction(quiet, "Quiet", "Purchase", "Snacks", -5, now - timedelta(hours=13, minutes=i))
+
+    with repository.transaction() as store:
+        findings = store.detect_fraud(now - timedelta(hours=12))
+    repository.close()
+
+    assert [(item["name"], item["transaction_count"]) for item in findings["frequent_users"]] == \
+        [("Cycler", 8), ("Hoarder", 6)]
+    assert [(item["name"], item["reason"], item["count"]) for item in findings["duplicate_reasons"]] == \
+        [("Hoarder", "Tools", 6), ("Cycler", "Snacks", 4)]
+    assert [(item["name"], item["count"], item["risk_level"]) for item in findings["unusual_patterns"]] == \
+        [("Cycler", 4, "high")]
+    assert [(item["name"], item["count"], item["risk_level"]) for item in findings["large_changes"]] == \
+        [("Hoarder", 6, "high")]
+
+    scores = {entry["name"]: (entry["score"], entry["level"]) for entry in score_risks(findings)}
+    # Cycler: frequent (medium 15) + duplicates (medium 10) + cycles (high 40)
+    # Hoarder: frequent (medium 15) + duplicates (high 25) + large changes (high 35)
+    assert scores == {"Cycler": (65, "medium"), "Hoarder": (75, "high")}
+
+
+class FakeStore:
+    """ Answers FraudEngine's fraud_events() from a list of committed log rows. """
+
+    def __init__(self):
+        self.rows = []
+
+    def commit_log(self, event_id, uuid, transaction_type, timestamp, reason="Snacks", amount=-5):
+        self.rows.append((event_id, uuid, f"Name {uuid}", transaction_type, reason, amount, timestamp))
+
+    def fraud_events(self, since):
+        return sorted((row for row in self.rows if row[6] >= since), key=lambda row: (row[6], row[0]))
+
+
+def test_sync_picks_up_a_lower_id_committed_after_a_higher_one():
+    now = datetime.now()
+    store = FakeStore()
+    engine = FraudEngine(window_hours=1)
+    engine.rebuild(store)
+
+    # Ids 1-3 are taken by a slow transaction; ids 4-6 commit and get synced first
+    for event_id in (4, 5, 6):
+        store.commit_log(event_id, "late", "Purchase", now - timedelta(seconds=1))
+    engine.sync(store)
+    for event_id in (1, 2, 3):
+        store.commit_log(event_id, "late", "Purchase", now - timedelta(seconds=2))
+    engine.sync(store)
+
+    frequent = engine.findings(now - timedelta(hours=1))["frequent_users"]
+    assert [(item["uuid"], item["transaction_count"]) for item in frequent] == [("late", 6)]
+    # Re-reading the overlap does not count anything twice
+    engine.sync(store)
+    assert engine.stats()["events"] == 6
+
+
+def test_events_recorded_out_of_order_are_evicted_and_paired_in_time_order():
+    now = datetime.now()
+    engine = FraudEngine(window_hours=1)
+    engine.ready = True
+
+    # Three purchase -> reimbursement cycles a few minutes apart, consumed newest first
+    cycles = [(now - timedelta(minutes=minutes), now - timedelta(minutes=minutes - 1)) for minutes in (10, 20, 30)]
+    for i, (purchased, reimbursed) in enumerate(cycles):
+        engine.record(10 + 2 * i, "user", "User", "Reimbursement", "Snacks", 5, reimbursed)
+        engine.record(11 + 2 * i, "user", "User", "Purchase", "Snacks", -5, purchased)
+    # An already expired row turns up behind the newer ones, e.g. from a later sync()
+    engine.record(1, "user", "User", "Purchase", "Old snacks", -5, now - timedelta(hours=2))
+
+    assert engine.stats()["events"] == 6
+    findings = engine.findings(now - timedelta(hours=1))
+    assert [(item["uuid"], item["count"]) for item in findings["unusual_patterns"]] == [("user", 3)]
+    assert [(item["reason"], item["count"]) for item in findings["duplicate_reasons"]] == [("Snacks", 3)]
+    # The window start is honoured whatever order the events came in
+    assert engine.findings(now - timedelta(minutes=25))["unusual_patterns"] == []
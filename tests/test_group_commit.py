@@ -0,0 +1,88 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+
+from group_commit import GroupCommitWriter, WriterOutcomeUnknownError, WriterQueueFullError
+
+
+class FakeStore:
+    def __init__(self, repository):
+        self.repository = repository
+
+    def apply_taps(self, taps):
+        self.repository.release.wait()
+        self.repository.applied.extend(taps)
+        return [("ok", tap, 0) for tap in taps]
+
+
+class BlockingRepository:
+    """ Applies taps only once `release` is set, to hold the writer thread mid-batch. """
+
+    def __init__(self, fail_commit=False):
+        self.release = threading.Event()
+        self.applied = []
+        self.batches = []
+        self.fail_commit = fail_commit
+
+    @contextmanager
+    def transaction(self):
+        store = FakeStore(self)
+        yield store
+        self.batches.append(len(self.applied))
+        if self.fail_commit:
+            raise ConnectionError("connection lost during COMMIT")
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_a_tap_still_queued_at_the_timeout_is_withdrawn_and_never_applied():
+    repository = BlockingRepository()
+    writer = GroupCommitWriter(repository, max_batch=1, max_wait=0)
+    first = writer.submit("first")
+    wait_for(lambda: writer.stats()["queued"] == 0)
+    second = writer.submit("second")
+
+    # "first" is being written and cannot be withdrawn; "second" is still queued
+    with pytest.raises(WriterOutcomeUnknownError):
+        writer.result(first, timeout=0.01)
+    with pytest.raises(WriterQueueFullError):
+        writer.result(second, timeout=0.01)
+
+    repository.release.set()
+    writer.close()
+    assert repository.applied == ["first"]
+    assert writer.stats()["cancelled"] == 1
+
+
+def test_a_failed_commit_is_not_replayed():
+    repository = BlockingRepository(fail_commit=True)
+    repository.release.set()
+    writer = GroupCommitWriter(repository, max_batch=10, max_wait=0.05)
+    futures = [writer.submit(tap) for tap in ("a", "b", "c")]
+
+    for future in futures:
+        with pytest.raises(WriterOutcomeUnknownError):
+            writer.result(future, timeout=2)
+    writer.close()
+    assert repository.batches == [3]
+    assert writer.stats()["uncertain"] == 3
+
+
+def test_close_gives_up_on_a_full_queue_after_its_timeout():
+    repository = BlockingRepository()
+    writer = GroupCommitWriter(repository, max_batch=1, max_wait=0, queue_size=1)
+    writer.submit("being written")
+    wait_for(lambda: writer.stats()["queued"] == 0)
+    writer.submit("queued")
+
+    started = time.monotonic()
+    writer.close(timeout=0.05)
+    assert time.monotonic() - started < 1
+    repository.release.set()
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+from sqlite_repository import SQLiteRepository
+
+
+def make_repository(tmp_path):
+    repository = SQLiteRepository(str(tmp_path / "ledger.sqlite3"))
+    repository.setup()
+    return repository
+
+
+def tap(store, uuid, name, amount, timestamp=None):
+    """ Change a balance and log it, the way the purchase and reimbursement routes do. """
+    if amount < 0:
+        store.debit(uuid, -amount)
+        store.log_transaction(uuid, name, "Purchase", "Snacks", amount, timestamp)
+    else:
+        store.credit(uuid, amount)
+        store.log_transaction(uuid, name, "Reimbursement", "Snacks", amount, timestamp)
+
+
+def test_consistent_ledgers_reconcile_clean(tmp_path):
+    repository = make_repository(tmp_path)
+    earlier = datetime.now() - timedelta(hours=1)
+    with repository.transaction() as store:
+        alice, _ = store.add_user("Alice", 100)
+        bob, _ = store.add_user("Bob", 0)
+        tap(store, alice, "Alice", -30, earlier)
+        tap(store, bob, "Bob", 20, earlier)
+        # Still inside the settle window: counted on the fly, not yet into the totals
+        tap(store, alice, "Alice", 5)
+
+    with repository.transaction() as store:
+        result = store.reconcile_ledger()
+    repository.close()
+
+    assert result["caught_up"]
+    assert result["processed"] == 2
+    assert (result["mismatched"], result["drift"]) == (0, [])
+    assert (result["adjusted"], result["adjustments"]) == (0, [])
+
+
+def test_a_balance_changed_without_a_log_row_is_reported(tmp_path):
+    repository = make_repository(tmp_path)
+    earlier = datetime.now() - timedelta(hours=1)
+    with repository.transaction() as store:
+        alice, _ = store.add_user("Alice", 100)
+        bob, _ = store.add_user("Bob", 50)
+        tap(store, alice, "Alice", -30, earlier)
+        tap(store, bob, "Bob", -10, earlier)
+
+    with repository.transaction() as store:
+        assert store.reconcile_ledger()["mismatched"] == 0
+        # An unlogged write after the totals were taken
+        store.credit(bob, 7)
+        tap(store, alice, "Alice", -5, earlier)
+
+    with repository.transaction() as store:
+        result = store.reconcile_ledger()
+    repository.close()
+
+    assert result["processed"] == 1
+    assert result["mismatched"] == 1
+    assert result["drift"] == [(bob, "Bob", 47, 40, 7)]
+
+
+def test_reconciliation_is_bounded_per_pass(tmp_path):
+    repository = make_repository(tmp_path)
+    earlier = datetime.now() - timedelta(hours=1)
+    with repository.transaction() as store:
+        alice, _ = store.add_user("Alice", 100)
+        for _ in range(5):
+            tap(store, alice, "Alice", -1, earlier)
+
+    with repository.transaction() as store:
+        first = store.reconcile_ledger(max_rows=3)
+        second = store.reconcile_ledger(max_rows=3)
+    repository.close()
+
+    # Until the totals catch up no drift is reported at all
+    assert (first["processed"], first["caught_up"], first["mismatched"]) == (3, False, None)
+    assert (second["processed"], second["caught_up"], second["mismatched"]) == (2, True, 0)
+    assert second["position"] > first["position"]
@@ -0,0 +1,64 @@
+"""
+Worker side of server_wrapper.py: serve app.py on the sockets the supervisor hands down, and drain on exit.
+
+app.py calls serve_worker() when it finds LISTEN_FDS in its environment; server_wrapper.py only imports the
+drain timeout, so neither depends on the other.
+"""
+import os
+import signal
+import socket
+import threading
+import time
+
+from waitress import wasyncore
+from waitress.channel import HTTPChannel
+from waitress.server import BaseWSGIServer, create_server
+
+# How long a stopping worker may spend finishing in-flight requests (in seconds)
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", 30))
+# While draining, connections idle for this long are closed instead of waiting for another request (in seconds)
+DRAIN_IDLE_CLOSE = 1
+
+
+def serve_worker(app, listen_fds, threads=4, drain_timeout=DRAIN_TIMEOUT):
+    """
+    Serve `app` with waitress on the comma-separated socket file descriptors inherited from the supervisor.
+
+    On SIGTERM or SIGINT the worker stops accepting (the other workers keep accepting from the shared
+    socket), closes idle keep-alive connections, and returns once every in-flight request has been
+    answered or `drain_timeout` seconds have passed.
+    """
+    sockets = [socket.socket(fileno=int(fd)) for fd in listen_fds.split(",")]
+    socket_map = {}
+    server = create_server(app, map=socket_map, sockets=sockets, threads=threads)
+    adj = server.adj
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+    while not stopping.is_set():
+        wasyncore.loop(timeout=adj.asyncore_loop_timeout, map=socket_map, use_poll=adj.asyncore_use_poll,
+                       count=1)
+
+    # Stop accepting; queued connections on the shared socket go to the other workers
+    for listener in [d for d in list(socket_map.values()) if isinstance(d, BaseWSGIServer)]:
+        listener.accepting = False
+        listener.del_channel()
+        listener.socket.close()
+
+    deadline = time.monotonic() + drain_timeout
+    while time.monotonic() < deadline:
+        channels = [d for d in list(socket_map.values()) if isinstance(d, HTTPChannel)]
+        if not channels:
+            break
+        idle_since = time.time() - DRAIN_IDLE_CLOSE
+        for channel in channels:
+            with channel.requests_lock:
+                # Connections that sat idle (kept alive, or accepted but never sent a request) are closed;
+                # busy ones close once their response has been sent and they go quiet
+                if (not channel.requests and channel.request is None and not channel.total_outbufs_len
+                        and channel.last_activity < idle_since):
+                    channel.will_close = True
+        wasyncore.loop(timeout=0.1, map=socket_map, use_poll=adj.asyncore_use_poll, count=1)
+    server.task_dispatcher.shutdown()